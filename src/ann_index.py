@@ -0,0 +1,348 @@
+import json
+import math
+import os
+import sys
+import threading
+import time
+import weakref
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+from config import (
+    FAISS_INDEX_TYPE, FAISS_NLIST, FAISS_HNSW_M, FAISS_PQ_M, FAISS_TRAIN_SAMPLE, FAISS_NPROBE,
+    FAISS_EF_SEARCH, FAISS_MMAP, FAISS_RETRAIN_DRIFT
+)
+
+ANN_INDEX_FILENAME = "index.ann.faiss"
+# Index type, size and changes since the last full build of the approximate index
+ANN_META_FILENAME = "index.ann.json"
+INDEX_TYPES = ("flat", "ivf-flat", "hnsw", "ivf-pq")
+
+# faiss warns below 39 training points per centroid
+_MIN_POINTS_PER_CENTROID = 39
+# Guards building the direct map of an IVF index, or the position lookup of an HNSW index,
+# that may be searched concurrently
+_lookup_lock = threading.Lock()
+# Sorted live IDs and sequence numbers of updatable HNSW indexes, see _position_lookup
+_position_lookups: "weakref.WeakKeyDictionary[faiss.Index, Tuple[int, np.ndarray, np.ndarray]]" = \
+    weakref.WeakKeyDictionary()
+
+def _nlist(n_vectors: int, nlist: int) -> int:
+    if nlist <= 0:
+        nlist = int(4 * math.sqrt(n_vectors))
+    return max(1, min(nlist, n_vectors // _MIN_POINTS_PER_CENTROID))
+
+def factory_string(index_type: str, n_vectors: int, dim: int, nlist: int = FAISS_NLIST,
+                   hnsw_m: int = FAISS_HNSW_M, pq_m: int = FAISS_PQ_M) -> str:
+    """
+    Builds the faiss.index_factory description for an index type and corpus size.
+
+    :param index_type: One of INDEX_TYPES.
+    :param n_vectors: Number of vectors to index.
+    :param dim: Embedding dimension.
+    :param nlist: IVF list count; 0 picks about 4 * sqrt(n_vectors).
+    :param hnsw_m: HNSW graph degree.
+    :param pq_m: Requested PQ sub-quantizers; the largest divisor of dim not above it is used.
+    :returns: Factory string such as "IVF256,Flat".
+    :raises ValueError: If index_type is unsupported.
+    """
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "hnsw":
+        return f"HNSW{hnsw_m}"
+    if index_type == "ivf-flat":
+        return f"IVF{_nlist(n_vectors, nlist)},Flat"
+    if index_type == "ivf-pq":
+        m = max(d for d in range(1, min(pq_m, dim) + 1) if dim % d == 0)
+        # 8-bit codes need 256 * 39 training points; small corpora get coarser codes
+        nbits = max(1, min(8, int(math.log2(max(2, n_vectors // _MIN_POINTS_PER_CENTROID)))))
+        return f"IVF{_nlist(n_vectors, nlist)},PQ{m}x{nbits}"
+    raise ValueError(f"Unsupported FAISS_INDEX_TYPE: {index_type}")
+
+def set_search_params(index: faiss.Index, nprobe: int = FAISS_NPROBE, ef_search: int = FAISS_EF_SEARCH) -> None:
+    """
+    Applies query-time parameters to IVF (nprobe) and HNSW (efSearch) indexes.
+
+    :param index: faiss index.
+    :param nprobe: IVF lists visited per query.
+    :param ef_search: HNSW candidate list size per query.
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = nprobe
+    hnsw = extract_index_hnsw(index)
+    if hnsw is not None:
+        hnsw.hnsw.efSearch = ef_search
+
+def extract_index_hnsw(index: faiss.Index) -> Optional[faiss.Index]:
+    """
+    Returns the HNSW index of an index, unwrapping the IndexIDMap of persisted search indexes.
+
+    :param index: faiss index.
+    :returns: The HNSW index, or None for other index types.
+    """
+    if isinstance(index, faiss.IndexIDMap):
+        index = faiss.downcast_index(index.index)
+    return index if hasattr(index, "hnsw") else None
+
+def build_ann_index(vectors: np.ndarray, index_type: str = FAISS_INDEX_TYPE,
+                    train_sample: int = FAISS_TRAIN_SAMPLE, seed: int = 0, updatable: bool = False,
+                    **factory_kwargs) -> faiss.Index:
+    """
+    Trains an index on a random sample of the vectors and adds all of them in order.
+
+    Positions match the rows of vectors, so the store's index_to_docstore_id still applies.
+
+    :param vectors: Array of shape (n, dim).
+    :param index_type: One of INDEX_TYPES.
+    :param train_sample: Maximum vectors used for training.
+    :param seed: Seed of the training sample.
+    :param updatable: Wrap HNSW in an IndexIDMap, so update_ann_index can renumber and
+        tombstone its entries (IVF indexes store their IDs already).
+    :param factory_kwargs: Overrides passed to factory_string (nlist, hnsw_m, pq_m).
+    :returns: Trained and populated faiss index.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, dim = vectors.shape
+    index = faiss.index_factory(dim, factory_string(index_type, n, dim, **factory_kwargs))
+    if not index.is_trained:
+        rows = np.random.default_rng(seed).choice(n, size=min(n, train_sample), replace=False)
+        index.train(vectors[np.sort(rows)])
+    if updatable:
+        if index_type == "hnsw":
+            index = faiss.IndexIDMap(index)
+        index.add_with_ids(vectors, np.arange(n, dtype=np.int64))
+    else:
+        index.add(vectors)
+    set_search_params(index)
+    return index
+
+def update_ann_index(index: faiss.Index, flat_index: faiss.Index, removed: Sequence[int], added: int) -> None:
+    """
+    Applies a store update to a search index built with updatable=True, in place.
+
+    The store's flat index drops the removed positions and closes the gaps, then appends
+    the added vectors. IVF indexes remove the entries and HNSW indexes (which cannot
+    delete) mark them with ID -1, so searches skip them. Either way the remaining IDs are
+    shifted down like the flat positions. Only the ID arrays and the added vectors are
+    touched: nothing is retrained and no other vectors are read.
+
+    :param index: Search index from build_ann_index(..., updatable=True).
+    :param flat_index: The store's flat index after the update.
+    :param removed: Positions removed from the flat index, as numbered before the update.
+    :param added: Number of vectors appended to the flat index after the removal.
+    """
+    removed_sorted = np.unique(np.asarray(removed, dtype=np.int64))
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        with _lookup_lock:
+            # Dropped rather than updated; reconstruct_positions rebuilds it on demand
+            ivf.set_direct_map_type(faiss.DirectMap.NoMap)
+    if len(removed_sorted):
+        if ivf is not None:
+            ivf.remove_ids(faiss.IDSelectorBatch(removed_sorted))
+            invlists = ivf.invlists
+            for list_no in range(ivf.nlist):
+                size = invlists.list_size(list_no)
+                if size:
+                    # A view of the list's IDs; the index is not memory-mapped here
+                    ids = faiss.rev_swig_ptr(invlists.get_ids(list_no), size)
+                    ids -= np.searchsorted(removed_sorted, ids)
+        else:
+            ids = faiss.vector_to_array(index.id_map)
+            live = ids >= 0
+            live &= ~np.isin(ids, removed_sorted)
+            ids[live] -= np.searchsorted(removed_sorted, ids[live])
+            ids[~live] = -1
+            faiss.copy_array_to_vector(ids, index.id_map)
+    if added:
+        start = flat_index.ntotal - added
+        index.add_with_ids(flat_index.reconstruct_n(start, added), np.arange(start, flat_index.ntotal, dtype=np.int64))
+    with _lookup_lock:
+        _position_lookups.pop(index, None)
+
+def _position_lookup(index: faiss.IndexIDMap) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the live IDs of an IndexIDMap in sorted order and the sequence number of each.
+
+    Built once per index and cached until update_ann_index changes its IDs (or ntotal
+    changes otherwise), so a lookup costs a binary search per position.
+    """
+    with _lookup_lock:
+        cached = _position_lookups.get(index)
+        if cached is not None and cached[0] == index.ntotal:
+            return cached[1], cached[2]
+        ids = faiss.vector_to_array(index.id_map)
+        live = np.flatnonzero(ids >= 0)
+        order = live[np.argsort(ids[live], kind="stable")]
+        _position_lookups[index] = (index.ntotal, ids[order], order)
+        return ids[order], order
+
+def reconstruct_positions(index: faiss.Index, positions: Sequence[int]) -> Optional[np.ndarray]:
+    """
+    Reads the vectors stored at store positions back from a search index, e.g. for MMR.
+
+    Flat and HNSW indexes return the vectors as added; the position to sequence number
+    mapping of an updatable HNSW index is built on first use. IVF indexes get a direct
+    map on first use, which costs one pass over the inverted lists' IDs; PQ codes decode
+    to approximate vectors.
+
+    :param index: The store's search index (flat or from build_ann_index).
+    :param positions: Store positions, as in index_to_docstore_id.
+    :returns: Array of shape (len(positions), dim), or None if a position is not in the index.
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    if not len(positions):
+        return np.zeros((0, index.d), dtype=np.float32)
+    if isinstance(index, faiss.IndexIDMap):
+        # Updatable HNSW: map positions to the wrapped index's sequence numbers
+        sorted_ids, order = _position_lookup(index)
+        found = np.searchsorted(sorted_ids, positions)
+        if found.max() >= len(sorted_ids) or (sorted_ids[found] != positions).any():
+            return None
+        index = faiss.downcast_index(index.index)
+        positions = order[found]
+    else:
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            with _lookup_lock:
+                if ivf.direct_map.type == faiss.DirectMap.NoMap:
+                    ivf.make_direct_map()
+    if positions.min() < 0 or positions.max() >= index.ntotal:
+        return None
+    return index.reconstruct_batch(positions)
+
+def read_search_index(path: str, mmap: bool = FAISS_MMAP) -> faiss.Index:
+    """
+    Reads an index for searching, memory-mapped read-only when mmap is set.
+
+    :param path: Path of a faiss index file.
+    :param mmap: Map the file instead of reading it into RAM.
+    :returns: faiss index with search parameters applied.
+    """
+    flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if mmap else 0
+    index = faiss.read_index(path, flags)
+    set_search_params(index)
+    return index
+
+def _load_meta(db_path: str) -> Optional[Dict]:
+    try:
+        with open(os.path.join(db_path, ANN_META_FILENAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _write(index: faiss.Index, db_path: str, meta: Dict) -> None:
+    path = os.path.join(db_path, ANN_INDEX_FILENAME)
+    faiss.write_index(index, path + ".tmp")
+    os.replace(path + ".tmp", path)
+    meta_path = os.path.join(db_path, ANN_META_FILENAME)
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(meta_path + ".tmp", meta_path)
+
+def save_ann_index(flat_index: faiss.Index, db_path: str, index_type: str = FAISS_INDEX_TYPE,
+                   removed: Sequence[int] = (), added: int = 0, retrain_drift: float = FAISS_RETRAIN_DRIFT) -> None:
+    """
+    Brings the search index next to a store in line with its flat index.
+
+    The flat index stays the source of truth. An existing approximate index of the same
+    type is updated in place with update_ann_index, so a one-file change costs about as
+    much as the changed vectors. It is rebuilt and retrained from the flat index only when
+    there is none, when it does not match the flat index, or when the vectors added and
+    removed since the last build exceed retrain_drift times the number it was built with
+    (IVF centroids drift from the data, and HNSW accumulates tombstones). For "flat" any
+    stale search index is removed.
+
+    :param flat_index: The store's flat faiss index after the update.
+    :param db_path: Directory of the repo's vector store.
+    :param index_type: One of INDEX_TYPES.
+    :param removed: Positions removed from the flat index, as numbered before the update.
+    :param added: Number of vectors appended to the flat index after the removal.
+    :param retrain_drift: Changed fraction of the built size that triggers a full rebuild.
+    """
+    path = os.path.join(db_path, ANN_INDEX_FILENAME)
+    if index_type == "flat" or flat_index.ntotal == 0:
+        for stale in (path, os.path.join(db_path, ANN_META_FILENAME)):
+            if os.path.exists(stale):
+                os.remove(stale)
+        return
+    meta = _load_meta(db_path)
+    changes = (meta or {}).get("changes", 0) + len(removed) + added
+    if (meta is not None and os.path.exists(path) and meta.get("index_type") == index_type
+            and meta.get("vectors") == flat_index.ntotal - added + len(removed)
+            and changes <= retrain_drift * meta.get("built_vectors", 0)):
+        index = faiss.read_index(path)
+        update_ann_index(index, flat_index, removed, added)
+        _write(index, db_path, {**meta, "vectors": flat_index.ntotal, "changes": changes})
+        return
+    index = build_ann_index(flat_index.reconstruct_n(0, flat_index.ntotal), index_type, updatable=True)
+    _write(index, db_path, {"index_type": index_type, "vectors": flat_index.ntotal,
+                            "built_vectors": flat_index.ntotal, "changes": 0})
+
+def search_index_path(db_path: str) -> str:
+    """
+    Returns the index file to search: the approximate index if one was built, else the flat one.
+
+    :param db_path: Directory of the repo's vector store.
+    :returns: Path of the index file.
+    """
+    ann_path = os.path.join(db_path, ANN_INDEX_FILENAME)
+    return ann_path if os.path.exists(ann_path) else os.path.join(db_path, "index.faiss")
+
+def recall_latency_report(vectors: np.ndarray, queries: np.ndarray,
+                          configs: Iterable[Tuple[str, Dict[str, int]]], k: int = 10) -> List[Dict]:
+    """
+    Measures recall@k against exact flat search and mean query latency for index settings.
+
+    :param vectors: Corpus vectors of shape (n, dim).
+    :param queries: Query vectors of shape (q, dim).
+    :param configs: Pairs of (index_type, search params such as {"nprobe": 8} or {"ef_search": 64}).
+    :param k: Neighbours compared per query.
+    :returns: One dict per config with index, params, recall and latency_ms.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    k = min(k, len(vectors))
+    flat = faiss.IndexFlatL2(vectors.shape[1])
+    flat.add(vectors)
+    _, expected = flat.search(queries, k)
+
+    built: Dict[str, faiss.Index] = {}
+    report: List[Dict] = []
+    for index_type, params in configs:
+        if index_type not in built:
+            built[index_type] = build_ann_index(vectors, index_type)
+        index = built[index_type]
+        set_search_params(index, params.get("nprobe", FAISS_NPROBE), params.get("ef_search", FAISS_EF_SEARCH))
+        start = time.perf_counter()
+        # One query at a time, as in interactive use
+        actual = np.vstack([index.search(queries[i:i + 1], k)[1] for i in range(len(queries))])
+        latency = (time.perf_counter() - start) * 1000 / max(1, len(queries))
+        recall = float(np.mean([len(set(e) & set(a)) / k for e, a in zip(expected, actual)]))
+        report.append({"index": index_type, "params": params, "recall": recall, "latency_ms": latency})
+    return report
+
+DEFAULT_REPORT_CONFIGS = [("flat", {})] + [
+    ("ivf-flat", {"nprobe": n}) for n in (1, 4, 16, 64)
+] + [
+    ("hnsw", {"ef_search": ef}) for ef in (16, 64, 256)
+] + [
+    ("ivf-pq", {"nprobe": n}) for n in (4, 16, 64)
+]
+
+if __name__ == "__main__":
+    # Usage: python src/ann_index.py <path to a store's index.faiss> [queries]
+    flat_index = faiss.read_index(sys.argv[1])
+    corpus = flat_index.reconstruct_n(0, flat_index.ntotal)
+    n_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    rng = np.random.default_rng(0)
+    # Perturbed corpus vectors stand in for queries that land near real chunks
+    sample = corpus[rng.choice(len(corpus), size=min(n_queries, len(corpus)), replace=False)]
+    sample = sample + rng.normal(scale=0.05 * float(np.std(corpus)), size=sample.shape).astype(np.float32)
+    print(f"{len(corpus)} vectors, {len(sample)} queries")
+    for row in recall_latency_report(corpus, sample, DEFAULT_REPORT_CONFIGS):
+        print(f"{row['index']:<9} {str(row['params']):<20} recall@10={row['recall']:.3f} "
+              f"latency={row['latency_ms']:.3f}ms")
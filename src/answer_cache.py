@@ -0,0 +1,196 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from query_classifier import normalize_query
+from metrics import metrics
+from config import ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_SIMILARITY, ANSWER_CACHE_PATH
+
+class _Entry(NamedTuple):
+    answer: str
+    created: float
+    repos: List[str]
+    embedding: Optional[List[float]]
+
+def _scope(model_name: str, chunk_ids: Iterable[str]) -> str:
+    """
+    Identifies what an answer was generated from: the model and the exact retrieved chunks.
+
+    Chunk IDs change whenever a file is re-indexed, so answers over stale code never match.
+    """
+    digest = hashlib.sha256("\n".join(sorted(chunk_ids)).encode("utf-8")).hexdigest()
+    return f"{model_name}:{digest}"
+
+class AnswerCache:
+    """
+    LRU cache of LLM answers with a TTL, optional semantic matching and persistence.
+
+    Entries are keyed on (model name, retrieved chunk IDs, normalized query). General
+    questions use an empty chunk set. With a similarity threshold, a differently worded
+    query reuses an answer from the same scope whose query embedding is close enough.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_SIZE, ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS,
+                 similarity: float = ANSWER_CACHE_SIMILARITY, path: str = ANSWER_CACHE_PATH,
+                 embed: Optional[Callable[[str], Sequence[float]]] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity = similarity
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._embed = embed
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self._load()
+
+    def _embedding(self, query: str) -> Optional[List[float]]:
+        if self.similarity <= 0:
+            return None
+        if self._embed is None:
+            from embedding_engine import get_embedding_model
+            self._embed = get_embedding_model().embed_query
+        vector = np.asarray(self._embed(query), dtype=np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def _expired(self, entry: _Entry, now: float) -> bool:
+        return bool(self.ttl_seconds) and now - entry.created > self.ttl_seconds
+
+    def _similar(self, scope: str, embedding: List[float], now: float) -> Optional[Tuple[str, str]]:
+        best_key, best_score = None, self.similarity
+        query = np.asarray(embedding)
+        for key, entry in self._entries.items():
+            if key[0] != scope or entry.embedding is None or self._expired(entry, now):
+                continue
+            score = float(query @ np.asarray(entry.embedding))
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key
+
+    def get(self, query: str, model_name: str, chunk_ids: Iterable[str] = ()) -> Optional[str]:
+        """
+        Looks up a cached answer.
+
+        :param query: User query string.
+        :param model_name: Name of the LLM that would answer.
+        :param chunk_ids: IDs of the chunks retrieved for the query; empty for general questions.
+        :returns: Cached answer, or None on a miss.
+        """
+        if not self.max_entries:
+            return None
+        scope = _scope(model_name, chunk_ids)
+        key = (scope, normalize_query(query))
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, now):
+                del self._entries[key]
+                entry = None
+        if entry is None and self.similarity > 0:
+            embedding = self._embedding(query)
+            with self._lock:
+                similar = self._similar(scope, embedding, now)
+                if similar is not None:
+                    key, entry = similar, self._entries[similar]
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                metrics.inc("rag_answer_cache_requests_total", result="miss")
+                return None
+            self.hits += 1
+            metrics.inc("rag_answer_cache_requests_total", result="hit")
+            self._entries.move_to_end(key)
+            return entry.answer
+
+    def put(self, query: str, model_name: str, answer: str, chunk_ids: Iterable[str] = (),
+            repos: Iterable[str] = ()) -> None:
+        """
+        Stores an answer.
+
+        :param query: User query string.
+        :param model_name: Name of the LLM that answered.
+        :param answer: Answer text.
+        :param chunk_ids: IDs of the chunks the answer was generated from.
+        :param repos: Repos the chunks came from, used by invalidate_repo.
+        """
+        if not self.max_entries:
+            return
+        key = (_scope(model_name, chunk_ids), normalize_query(query))
+        entry = _Entry(answer, time.time(), sorted(set(repos)), self._embedding(query))
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        self.save()
+
+    def invalidate_repo(self, repo_name: str) -> int:
+        """
+        Drops answers generated from a repo's chunks, e.g. after it was re-indexed or removed.
+
+        :param repo_name: Repository name.
+        :returns: Number of dropped answers.
+        """
+        with self._lock:
+            doomed = [key for key, entry in self._entries.items() if repo_name in entry.repos]
+            for key in doomed:
+                del self._entries[key]
+        if doomed:
+            self.save()
+        return len(doomed)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+        self.save()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def save(self) -> None:
+        """
+        Atomically writes the cache to its path, if persistence is enabled.
+        """
+        if not self.path:
+            return
+        with self._lock:
+            data = [[scope, query, *entry] for (scope, query), entry in self._entries.items()]
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        for scope, query, *fields in data[-self.max_entries:] if self.max_entries else []:
+            entry = _Entry(*fields)
+            if not self._expired(entry, now):
+                self._entries[(scope, query)] = entry
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Returns hit/miss counters and the number of cached answers.
+
+        :returns: Dict with hits, misses, hit_rate and entries.
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._entries),
+        }
@@ -0,0 +1,87 @@
+import sys
+import time
+from typing import Callable, Optional
+
+from metrics import metrics
+
+TokenCallback = Callable[[str], None]
+
+def generate(llm, prompt: str, on_token: Optional[TokenCallback] = None) -> str:
+    """
+    Generates an answer, streaming tokens to on_token as they arrive when it is given.
+
+    :param llm: LangChain chat model.
+    :param prompt: Prompt text.
+    :param on_token: Optional callback receiving each streamed piece of text.
+    :returns: Full answer, stripped.
+    """
+    with metrics.span("llm") as span:
+        span["streamed"] = on_token is not None
+        if on_token is None:
+            answer = llm.invoke(prompt).content.strip()
+        else:
+            pieces = []
+            for chunk in llm.stream(prompt):
+                if chunk.content:
+                    pieces.append(chunk.content)
+                    on_token(chunk.content)
+            answer = "".join(pieces).strip()
+    if metrics.enabled:
+        from context_builder import get_token_counter
+        count_tokens = get_token_counter()
+        metrics.inc("rag_llm_prompt_tokens_total", count_tokens(prompt))
+        metrics.inc("rag_llm_response_tokens_total", count_tokens(answer))
+    return answer
+
+class TokenPrinter:
+    """
+    Token callback that prints streamed text immediately and records answer timings.
+
+    Time to first token is measured from construction, i.e. from when the question was
+    submitted, so it includes retrieval. Tokens per second covers the generation after
+    the first token, counting one streamed chunk as one token.
+    """
+
+    def __init__(self, write: Optional[Callable[[str], object]] = None,
+                 flush: Optional[Callable[[], object]] = None):
+        self._write = write or sys.stdout.write
+        self._flush = flush or sys.stdout.flush
+        self.started = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.last_token_at: Optional[float] = None
+        self.tokens = 0
+
+    def __call__(self, token: str) -> None:
+        now = time.perf_counter()
+        if self.first_token_at is None:
+            token = token.lstrip()
+            if not token:
+                return
+            self.first_token_at = now
+        self.last_token_at = now
+        self.tokens += 1
+        self._write(token)
+        self._flush()
+
+    @property
+    def time_to_first_token(self) -> Optional[float]:
+        return None if self.first_token_at is None else self.first_token_at - self.started
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        if self.first_token_at is None or self.tokens < 2 or self.last_token_at == self.first_token_at:
+            return None
+        return (self.tokens - 1) / (self.last_token_at - self.first_token_at)
+
+    def summary(self) -> str:
+        """
+        Formats the recorded timings, e.g. "first token 0.42s, 11.8 tokens/s".
+
+        :returns: Summary string; empty if nothing was streamed.
+        """
+        parts = []
+        if self.time_to_first_token is not None:
+            parts.append(f"first token {self.time_to_first_token:.2f}s")
+        if self.tokens_per_second is not None:
+            parts.append(f"{self.tokens_per_second:.1f} tokens/s")
+        return ", ".join(parts)
@@ -0,0 +1,265 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Dict, List, NamedTuple, Optional, Sequence, TextIO, Tuple
+
+from cli import answer_from_docs, handle_general_query, is_code_related_query, parse_repo_scope
+from answer_cache import AnswerCache
+from federated_search import FederatedIndex
+from search_filter import SearchFilter, make_filter, parse_filters
+from metrics import metrics
+from config import BATCH_CONCURRENCY, CODE_QUERY_RETRIEVAL_K, VECTORSTORE_DIR
+
+class Question(NamedTuple):
+    """
+    One line of a batch input file.
+    """
+    id: str
+    query: str
+    repos: Optional[Tuple[str, ...]] = None  # None searches all repos
+    filters: SearchFilter = SearchFilter()
+
+def parse_question(record: Dict, default_id: str) -> Question:
+    """
+    Builds a Question from a JSON object with "question" (or "query") and optional "id",
+    "repos" and "filters" ({"paths", "languages", "symbols"}).
+
+    An ``@repo`` prefix and ``path:``, ``lang:`` and ``symbol:`` terms in the question are
+    honoured as in the CLI and merged with the explicit fields.
+
+    :param record: Decoded JSON object.
+    :param default_id: ID used when the record has none.
+    :returns: Question instance.
+    :raises ValueError: If the question is missing or the filters are invalid.
+    """
+    if not isinstance(record, dict):
+        raise ValueError("Expected a JSON object")
+    repos, query = parse_repo_scope(str(record.get("question") or record.get("query") or "").strip())
+    repos = record.get("repos") or repos
+    filters, query = parse_filters(query)
+    fields = record.get("filters") or {}
+    try:
+        filters = make_filter(**{field: list(getattr(filters, field)) + list(fields.get(field) or [])
+                                 for field in SearchFilter._fields})
+    except (TypeError, AttributeError) as e:
+        raise ValueError(f"Invalid filters: {e}") from e
+    if not query:
+        raise ValueError("Missing 'question'")
+    return Question(str(record.get("id", default_id)), query, tuple(repos) if repos else None, filters)
+
+def load_questions(path: str) -> List[Question]:
+    """
+    Reads a JSONL file of questions, one JSON object per line (see parse_question).
+
+    :param path: Path to the JSONL file.
+    :returns: List of Question, in file order; line numbers are the default IDs.
+    :raises ValueError: If a line is not valid JSON or not a valid question.
+    """
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                questions.append(parse_question(json.loads(line), str(number)))
+            except ValueError as e:
+                raise ValueError(f"{path}:{number}: {e}") from e
+    return questions
+
+def _sources(docs: List) -> List[Dict]:
+    keys = ("repo_name", "file_path", "start_line", "end_line", "symbol")
+    return [{key: d.metadata[key] for key in keys if d.metadata.get(key) is not None} for d in docs]
+
+def _classify(questions: Sequence[Question], pool: ThreadPoolExecutor,
+              classify: bool) -> Tuple[List[bool], Dict[int, str]]:
+    """
+    Decides which questions need retrieval; scoped or filtered questions always do.
+
+    :returns: Tuple of (is_code per question, error by question position).
+    """
+    is_code = [True] * len(questions)
+    errors: Dict[int, str] = {}
+    pending: Dict[Future, int] = {}
+    for i, question in enumerate(questions):
+        if classify and question.repos is None and not question.filters:
+            pending[pool.submit(is_code_related_query, question.query)] = i
+    for future in as_completed(pending):
+        try:
+            is_code[pending[future]] = bool(future.result())
+        except Exception as e:
+            errors[pending[future]] = f"Classification failed: {e}"
+    return is_code, errors
+
+def _retrieve(questions: Sequence[Question], positions: Sequence[int], index: FederatedIndex,
+              k: int) -> Tuple[Dict[int, List], Dict[int, str]]:
+    """
+    Embeds the selected questions in one batch and searches each (repos, filters) group at once.
+
+    :returns: Tuple of (documents by question position, error by question position).
+    """
+    docs: Dict[int, List] = {}
+    if not positions:
+        return docs, {}
+    try:
+        vectors = dict(zip(positions, index.embed_queries([questions[i].query for i in positions])))
+    except ValueError as e:
+        return docs, {i: str(e) for i in positions}
+    errors: Dict[int, str] = {}
+    groups: Dict[Tuple, List[int]] = {}
+    for i in positions:
+        groups.setdefault((questions[i].repos, questions[i].filters), []).append(i)
+    for (repos, filters), members in groups.items():
+        try:
+            results = index.search_many([questions[i].query for i in members], k, list(repos) if repos else None,
+                                        filters=filters, vectors=[vectors[i] for i in members])
+        except ValueError as e:
+            errors.update((i, str(e)) for i in members)
+            continue
+        docs.update(zip(members, results))
+    return docs, errors
+
+def _answer(question: Question, docs: Optional[List], llm, cache: Optional[AnswerCache],
+            index: FederatedIndex) -> Tuple[str, float]:
+    start = time.perf_counter()
+    if docs is None:
+        answer = handle_general_query(question.query, llm, cache)
+    else:
+        answer = answer_from_docs(question.query, docs, llm, cache, index=index)
+    return answer, (time.perf_counter() - start) * 1000
+
+def run_batch(questions: Sequence[Question], index: FederatedIndex, llm, output: TextIO,
+              concurrency: int = BATCH_CONCURRENCY, cache: Optional[AnswerCache] = None,
+              classify: bool = True, k: int = CODE_QUERY_RETRIEVAL_K) -> Dict:
+    """
+    Answers a question set, writing one JSON line per question as soon as it is answered.
+
+    Unscoped questions are classified on the worker pool first. All code questions are
+    then embedded in one batch and searched with one FAISS call per repo and group of
+    questions sharing repos and filters, before the LLM calls are dispatched with at most
+    concurrency in flight. A failed question is reported in its output line and counted,
+    and does not stop the batch.
+
+    Output lines hold "id", "question", "type" ("code" or "general"), "answer", "sources"
+    (repo, file and lines of the retrieved chunks) and "latency_ms" (answer generation),
+    or "error" instead of "answer".
+
+    :param questions: Questions, e.g. from load_questions.
+    :param index: FederatedIndex over the repos to search.
+    :param llm: LLM instance.
+    :param output: Text stream receiving the JSONL results, in completion order.
+    :param concurrency: Maximum concurrent classifier and LLM calls.
+    :param cache: Optional AnswerCache; None generates every answer afresh.
+    :param classify: Classify unscoped questions; if False every question is a code question.
+    :param k: Documents retrieved per code question.
+    :returns: Summary with counts, wall time, questions/sec, latency percentiles and stage times.
+    """
+    start = time.perf_counter()
+    latencies: List[float] = []
+    failed = 0
+
+    def write(i: int, **fields) -> None:
+        record = {"id": questions[i].id, "question": questions[i].query,
+                  "type": "code" if is_code[i] else "general", **fields}
+        output.write(json.dumps(record) + "\n")
+        output.flush()
+
+    with metrics.span("batch") as span, \
+            ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="batch") as pool:
+        span.update(questions=len(questions), concurrency=concurrency)
+        is_code, errors = _classify(questions, pool, classify)
+        classified = time.perf_counter()
+        docs, search_errors = _retrieve(questions, [i for i in range(len(questions)) if is_code[i] and i not in errors],
+                                        index, k)
+        errors.update(search_errors)
+        retrieved = time.perf_counter()
+
+        pending: Dict[Future, int] = {}
+        for i, question in enumerate(questions):
+            if i in errors:
+                failed += 1
+                write(i, error=errors[i])
+            else:
+                pending[pool.submit(_answer, question, docs.get(i), llm, cache, index)] = i
+        for future in as_completed(pending):
+            i = pending[future]
+            try:
+                answer, latency = future.result()
+            except Exception as e:
+                failed += 1
+                write(i, error=str(e))
+                continue
+            latencies.append(latency)
+            write(i, answer=answer, sources=_sources(docs.get(i, [])), latency_ms=round(latency, 1))
+        span.update(failed=failed)
+
+    seconds = time.perf_counter() - start
+    latencies.sort()
+    metrics.inc("rag_batch_questions_total", len(questions) - failed, status="answered")
+    metrics.inc("rag_batch_questions_total", failed, status="failed")
+    return {
+        "questions": len(questions),
+        "answered": len(questions) - failed,
+        "failed": failed,
+        "seconds": seconds,
+        "questions_per_sec": len(questions) / seconds if seconds else 0.0,
+        "latency_p50_ms": statistics.median(latencies) if latencies else 0.0,
+        "latency_p95_ms": latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0,
+        "classify_seconds": classified - start,
+        "retrieve_seconds": retrieved - classified,
+    }
+
+def stored_repos(db_dir: str = VECTORSTORE_DIR) -> List[str]:
+    """
+    Lists the repos with a saved vector store.
+
+    :param db_dir: Directory of the vector stores.
+    :returns: Sorted repo names.
+    """
+    if not os.path.isdir(db_dir):
+        return []
+    return sorted(name for name in os.listdir(db_dir) if os.path.exists(os.path.join(db_dir, name, "index.faiss")))
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Answers a JSONL question set against already indexed repos and prints a summary.
+
+    :param argv: Command line arguments; sys.argv if None.
+    :returns: Exit code, 1 if any question failed.
+    """
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions about indexed repos.")
+    parser.add_argument("input", help='JSONL file, one {"id": ..., "question": ...} object per line')
+    parser.add_argument("--output", default="answers.jsonl", help="where to stream the JSONL answers")
+    parser.add_argument("--repos", nargs="*", help=f"stores in {VECTORSTORE_DIR} to load; all of them by default")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="concurrent LLM calls")
+    parser.add_argument("--no-classify", action="store_true", help="treat every question as a code question")
+    parser.add_argument("--fake-llm", action="store_true", help="use a canned chat model, e.g. for dry runs")
+    args = parser.parse_args(argv)
+
+    from llm_factory import get_llm
+    from vector_store import load_repo_index
+
+    questions = load_questions(args.input)
+    index = FederatedIndex([load_repo_index(name) for name in args.repos or stored_repos()])
+    if args.fake_llm:
+        from langchain_community.chat_models.fake import FakeListChatModel
+        llm = FakeListChatModel(responses=["This is a canned answer."])
+    else:
+        llm = get_llm()
+    try:
+        with open(args.output, "w", encoding="utf-8") as f:
+            summary = run_batch(questions, index, llm, f, args.concurrency, classify=not args.no_classify)
+    finally:
+        index.close()
+    print(f"Answered {summary['answered']} of {summary['questions']} questions in {summary['seconds']:.1f}s "
+          f"({summary['questions_per_sec']:.2f}/s), {summary['failed']} failed")
+    print(f"Answer latency p50/p95: {summary['latency_p50_ms']:.0f}/{summary['latency_p95_ms']:.0f} ms; "
+          f"classify {summary['classify_seconds']:.2f}s, embed and search {summary['retrieve_seconds']:.2f}s")
+    print(f"Answers written to {args.output}")
+    return 1 if summary["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,355 @@
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+DEFAULT_TOLERANCE = 0.2
+# Counter holding the items each metrics span processes; spans not listed count their calls
+SPAN_ITEM_COUNTERS = {
+    "load": "rag_files_loaded_total",
+    "split": "rag_chunks_total",
+    "dedup": "rag_chunks_total",
+    "embed": "rag_embedded_texts_total",
+    "index": "rag_indexed_chunks_total",
+}
+
+def generate_repo(path: str, files: int = 50, functions: int = 20, seed: int = 0) -> str:
+    """
+    Writes a synthetic Python package and commits it as a local git repository.
+
+    Every file holds a class with a few methods plus top-level functions with loops,
+    docstrings and cross-module imports, so the AST chunker sees realistic structure.
+
+    :param path: Directory to create the repository in.
+    :param files: Number of Python files.
+    :param functions: Top-level functions per file.
+    :param seed: Random seed; the same seed produces the same repository.
+    :returns: The repository path.
+    """
+    from git import Actor, Repo
+
+    rng = random.Random(seed)
+    package = os.path.join(path, "pkg")
+    os.makedirs(package, exist_ok=True)
+    with open(os.path.join(package, "__init__.py"), "w", encoding="utf-8") as f:
+        f.write('"""Synthetic benchmark package."""\n')
+    for i in range(files):
+        lines = [f'"""Module {i}: helpers for {rng.choice(["parsing", "caching", "routing", "storage"])}."""',
+                 "import math", ""]
+        if i:
+            lines += [f"from pkg.module_{i - 1} import process_{i - 1}_0", ""]
+        lines += [f"class Handler{i}:", f'    """Handles records of kind {i}."""', "",
+                  "    def __init__(self, limit=10):", "        self.limit = limit", "        self.items = []", ""]
+        for m in range(3):
+            lines += [f"    def step_{m}(self, value):", f'        """Applies step {m} to value."""',
+                      f"        if value > self.limit * {m + 1}:",
+                      f"            return math.sqrt(value) + {rng.randint(1, 99)}",
+                      "        self.items.append(value)", "        return value", ""]
+        for j in range(functions):
+            lines += ["", f"def process_{i}_{j}(records, factor={rng.randint(2, 9)}):",
+                      f'    """Processes records for stage {j} of module {i} and returns the total."""',
+                      "    total = 0", "    for record in records:",
+                      f"        if record % {rng.randint(2, 7)} == 0:",
+                      "            total += record * factor", "        else:",
+                      f"            total -= {rng.randint(1, 50)}", "    return total", ""]
+        with open(os.path.join(package, f"module_{i}.py"), "w", encoding="utf-8") as f:
+            f.write("\n".join(lines))
+
+    repo = Repo.init(path)
+    repo.git.add(A=True)
+    author = Actor("benchmark", "benchmark@example.com")
+    repo.index.commit("Synthetic benchmark repo", author=author, committer=author)
+    return path
+
+def edit_repo(path: str, files: int, seed: int = 0) -> int:
+    """
+    Appends a function to the first modules of a generate_repo repository and commits,
+    so the next ingestion takes the incremental update path.
+
+    :param path: Repository created by generate_repo.
+    :param files: Number of modules to edit.
+    :param seed: Random seed for the appended code.
+    :returns: Number of modules edited.
+    """
+    from git import Actor, Repo
+
+    rng = random.Random(seed)
+    package = os.path.join(path, "pkg")
+    edited = sorted(name for name in os.listdir(package) if name.startswith("module_"))[:files]
+    for name in edited:
+        with open(os.path.join(package, name), "a", encoding="utf-8") as f:
+            f.write(f'\n\ndef revised_total(records):\n    """Sums the records after revision."""\n'
+                    f"    return sum(records) + {rng.randint(1, 99)}\n")
+    repo = Repo(path)
+    repo.git.add(A=True)
+    author = Actor("benchmark", "benchmark@example.com")
+    repo.index.commit("Revise synthetic benchmark repo", author=author, committer=author)
+    return len(edited)
+
+def peak_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    """
+    Returns the peak resident set size so far, a running maximum over the process lifetime.
+
+    :param who: resource.RUSAGE_SELF for this process, or resource.RUSAGE_CHILDREN for the
+        largest terminated child process (e.g. ingestion workers).
+    :returns: Peak RSS in MB.
+    """
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def _spans(snapshot: Dict) -> Dict[str, Dict]:
+    """
+    Sums the metrics spans of a snapshot per span name, across repos and threads.
+
+    :returns: Dict of span name to calls, total seconds, items and items_per_sec.
+    """
+    counters = {name: sum(series["value"] for series in values) for name, values in snapshot["counters"].items()}
+    spans: Dict[str, Dict] = {}
+    for series in snapshot["histograms"].get("rag_stage_seconds", []):
+        span = spans.setdefault(series["labels"]["stage"], {"calls": 0, "seconds": 0.0})
+        span["calls"] += series["count"]
+        span["seconds"] += series["sum"]
+    for name, span in spans.items():
+        span["items"] = counters.get(SPAN_ITEM_COUNTERS.get(name, ""), span["calls"])
+        span["items_per_sec"] = span["items"] / span["seconds"] if span["seconds"] else 0.0
+    return spans
+
+@contextmanager
+def _stage(stages: Dict[str, Dict], name: str) -> Iterator[Dict]:
+    """
+    Times a stage; the body may set "items" to have items_per_sec reported.
+
+    Since the peak RSS is a running maximum, a stage reports how far it raised the
+    peak (peak_rss_growth_mb) next to the cumulative peak at its end. The metrics spans
+    recorded during the stage (clone, load, split, dedup, index, ...) are reported under
+    "spans", with their total seconds summed over threads and worker processes.
+    """
+    from metrics import metrics
+
+    result: Dict = {}
+    metrics.reset()
+    peak_before = peak_rss_mb()
+    start = time.perf_counter()
+    yield result
+    seconds = time.perf_counter() - start
+    result["seconds"] = seconds
+    if "items" in result:
+        result["items_per_sec"] = result["items"] / seconds if seconds else 0.0
+    result["cumulative_peak_rss_mb"] = peak_rss_mb()
+    result["peak_rss_growth_mb"] = result["cumulative_peak_rss_mb"] - peak_before
+    result["spans"] = _spans(metrics.snapshot())
+    stages[name] = result
+
+def _latencies(latencies: List[float]) -> Dict[str, float]:
+    latencies = sorted(latencies)
+    return {
+        "queries": len(latencies),
+        "p50_ms": statistics.median(latencies) if latencies else 0.0,
+        "p95_ms": latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0,
+    }
+
+def _fake_llm():
+    from langchain_community.chat_models.fake import FakeListChatModel
+    return FakeListChatModel(responses=["The function sums the records that match the factor."])
+
+def run_benchmark(repos: int = 2, files: int = 50, functions: int = 20, queries: int = 20,
+                  embeddings: str = "fake", llm: str = "fake", work_dir: Optional[str] = None,
+                  seed: int = 0) -> Dict:
+    """
+    Runs the ingestion and question answering path end to end over synthetic repos.
+
+    Ingestion goes through ingest_repositories as the CLI does: a full index of fresh
+    clones, then an incremental update after a tenth of the files changed. Reports time,
+    peak RSS and throughput for ingesting, updating and opening the stores, plus search
+    and answer latency percentiles. Metrics are enabled for the run, so each stage also
+    breaks its time down by pipeline span.
+
+    :param repos: Number of synthetic repositories.
+    :param files: Python files per repository.
+    :param functions: Top-level functions per file.
+    :param queries: Number of code questions asked.
+    :param embeddings: "fake" for deterministic hash embeddings, "minilm" for the configured
+        sentence-transformers model on CPU (without the embedding cache).
+    :param llm: "fake" for a canned chat model, "configured" for get_llm().
+    :param work_dir: Directory for repos, clones and stores; a temporary one if None.
+    :param seed: Seed for the synthetic repos and questions.
+    :returns: JSON-serializable report.
+    :raises ValueError: If embeddings or llm is unsupported.
+    """
+    if embeddings not in ("fake", "minilm"):
+        raise ValueError(f"Unsupported embeddings: {embeddings}")
+    if llm not in ("fake", "configured"):
+        raise ValueError(f"Unsupported llm: {llm}")
+    with tempfile.TemporaryDirectory(prefix="rag-benchmark-") as tmp:
+        work_dir = work_dir or tmp
+        return _run(repos, files, functions, queries, embeddings, llm, work_dir, seed)
+
+def _run(repos: int, files: int, functions: int, queries: int, embeddings: str, llm: str,
+         work_dir: str, seed: int) -> Dict:
+    import cli
+    import embedding_engine
+    from federated_search import FederatedIndex
+    from ingest_pipeline import ingest_repositories
+    from metrics import metrics
+    from vector_store import load_repo_index
+
+    if embeddings == "fake":
+        from langchain_community.embeddings import DeterministicFakeEmbedding
+        model = DeterministicFakeEmbedding(size=384)
+    else:
+        model = embedding_engine.EmbeddingEngine()
+    chat_model = _fake_llm() if llm == "fake" else None
+
+    stages: Dict[str, Dict] = {}
+    db_dir = os.path.join(work_dir, "vectorstores")
+    clone_dir = os.path.join(work_dir, "clones")
+    previous_model = embedding_engine._embedding_instance
+    embedding_engine._embedding_instance = model
+    metrics_enabled = metrics.enabled
+    metrics.enabled = True
+
+    def ingest(urls: List[str]) -> List:
+        return ingest_repositories(urls, db_dir=db_dir, clone_cache_dir=clone_dir, progress=lambda message: None)
+
+    try:
+        with _stage(stages, "generate") as stage:
+            paths = [generate_repo(os.path.join(work_dir, "repos", f"synthetic{r}"), files, functions, seed + r)
+                     for r in range(repos)]
+            urls = [f"file://{path}" for path in paths]
+            stage["items"] = repos * files
+
+        if embeddings == "minilm":
+            model.embed_query("warm up")  # keep model loading out of the ingest timing
+        with _stage(stages, "ingest") as stage:
+            repo_indexes = ingest(urls)
+            chunks = sum(repo_index.vectorstore.index.ntotal for repo_index in repo_indexes)
+            stage["items"] = chunks
+
+        edited = [edit_repo(path, max(1, files // 10), seed + r) for r, path in enumerate(paths)]
+        with _stage(stages, "update") as stage:
+            ingest(urls)
+            stage["items"] = sum(edited)
+
+        with _stage(stages, "open_indexes") as stage:
+            index = FederatedIndex([load_repo_index(r.repo_name, db_dir=db_dir) for r in repo_indexes])
+            stage["items"] = repos
+
+        rng = random.Random(seed)
+        questions = [f"How does process_{rng.randrange(files)}_{rng.randrange(functions)} compute its total?"
+                     for _ in range(queries)]
+        search_latencies, answer_latencies = [], []
+        with _stage(stages, "search") as stage:
+            for question in questions:
+                start = time.perf_counter()
+                index.search(question)
+                search_latencies.append((time.perf_counter() - start) * 1000)
+            stage["items"] = queries
+
+        chat_model = chat_model or cli.get_llm()
+        with _stage(stages, "answer") as stage:
+            for question in questions:
+                start = time.perf_counter()
+                cli.handle_code_query(question, index, chat_model)
+                answer_latencies.append((time.perf_counter() - start) * 1000)
+            stage["items"] = queries
+        index.close()
+    finally:
+        embedding_engine._embedding_instance = previous_model
+        metrics.enabled = metrics_enabled
+        metrics.reset()
+
+    return {
+        "config": {"repos": repos, "files": files, "functions": functions, "queries": queries,
+                   "embeddings": embeddings, "llm": llm, "seed": seed},
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpus": os.cpu_count()},
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "chunks": chunks,
+        "stages": stages,
+        "search_latency": _latencies(search_latencies),
+        "answer_latency": _latencies(answer_latencies),
+        "peak_rss_mb": peak_rss_mb(),
+        "workers_peak_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN),
+    }
+
+def compare_reports(baseline: Dict, current: Dict, tolerance: float = DEFAULT_TOLERANCE) -> List[str]:
+    """
+    Lists stages, their spans and latency percentiles that got slower than the baseline by
+    more than tolerance.
+
+    :param baseline: Earlier report from run_benchmark.
+    :param current: New report from run_benchmark.
+    :param tolerance: Allowed relative slowdown, e.g. 0.2 for 20%.
+    :returns: Human-readable regressions; empty if none.
+    """
+    pairs = []
+    for name, stage in baseline["stages"].items():
+        if name not in current["stages"]:
+            continue
+        pairs.append((f"stage {name}", stage["seconds"], current["stages"][name]["seconds"]))
+        current_spans = current["stages"][name].get("spans", {})
+        pairs.extend((f"stage {name} span {span}", before["seconds"], current_spans[span]["seconds"])
+                     for span, before in stage.get("spans", {}).items() if span in current_spans)
+    for key in ("search_latency", "answer_latency"):
+        for percentile in ("p50_ms", "p95_ms"):
+            pairs.append((f"{key} {percentile}", baseline[key][percentile], current[key][percentile]))
+    return [
+        f"{name}: {before:.4f} -> {after:.4f} (+{(after / before - 1) * 100:.0f}%)"
+        for name, before, after in pairs
+        if before > 0 and after > before * (1 + tolerance)
+    ]
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Runs the benchmark, writes the JSON report and optionally checks it against a baseline.
+
+    :param argv: Command line arguments; sys.argv if None.
+    :returns: Exit code, 1 if a regression beyond the tolerance was found.
+    """
+    parser = argparse.ArgumentParser(description="End-to-end ingestion and query benchmark")
+    parser.add_argument("--repos", type=int, default=2)
+    parser.add_argument("--files", type=int, default=50, help="Python files per repo")
+    parser.add_argument("--functions", type=int, default=20, help="functions per file")
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--embeddings", choices=("fake", "minilm"), default="fake")
+    parser.add_argument("--llm", choices=("fake", "configured"), default="fake")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark.json", help="where to write the JSON report")
+    parser.add_argument("--baseline", help="earlier report to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args.repos, args.files, args.functions, args.queries, args.embeddings, args.llm,
+                           seed=args.seed)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    for name, stage in report["stages"].items():
+        rate = f", {stage['items_per_sec']:.1f}/s" if "items_per_sec" in stage else ""
+        print(f"{name:>12}: {stage['seconds']:.3f}s{rate}, peak RSS +{stage['peak_rss_growth_mb']:.0f} MB "
+              f"(cumulative {stage['cumulative_peak_rss_mb']:.0f} MB)")
+        for span_name, span in stage["spans"].items():
+            print(f"{span_name:>16}: {span['seconds']:.3f}s over {span['calls']} calls, "
+                  f"{span['items_per_sec']:.1f} items/s")
+    print(f"search p50/p95: {report['search_latency']['p50_ms']:.1f}/{report['search_latency']['p95_ms']:.1f} ms, "
+          f"answer p50/p95: {report['answer_latency']['p50_ms']:.1f}/{report['answer_latency']['p95_ms']:.1f} ms")
+    print(f"Report written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare_reports(json.load(f), report, args.tolerance)
+        for regression in regressions:
+            print("Regression:", regression)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
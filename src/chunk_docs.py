@@ -1,14 +1,160 @@
+import ast
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
-from typing import List
-from config import CHUNK_SIZE, CHUNK_OVERLAP
+from typing import Iterable, Iterator, List, NamedTuple, Optional
+from config import CHUNK_SIZE, CHUNK_OVERLAP, CHUNKER
+from metrics import metrics
+
+_DEFINITIONS = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
+class _Unit(NamedTuple):
+    start: int  # 1-based, inclusive
+    end: int  # 1-based, inclusive
+    symbol: Optional[str]  # qualified name if the unit is a definition
+    parent: str  # qualified name of the enclosing scope, "" for the module
+
+def _character_splitter() -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+def _node_start(node: ast.AST) -> int:
+    return min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])])
+
+def _text(lines: List[str], start: int, end: int) -> str:
+    return "".join(lines[start - 1:end])
+
+def _line_units(lines: List[str], start: int, end: int, parent: str) -> List[_Unit]:
+    """
+    Splits an oversized statement on line boundaries into units of at most CHUNK_SIZE.
+    """
+    units: List[_Unit] = []
+    piece_start, size = start, 0
+    for line_no in range(start, end + 1):
+        length = len(lines[line_no - 1])
+        if size and size + length > CHUNK_SIZE:
+            units.append(_Unit(piece_start, line_no - 1, None, parent))
+            piece_start, size = line_no, 0
+        size += length
+    units.append(_Unit(piece_start, end, None, parent))
+    return units
+
+def _units(body: List[ast.stmt], lines: List[str], first_line: int, last_line: int, parent: str) -> List[_Unit]:
+    """
+    Turns a statement list into units, descending into definitions that exceed CHUNK_SIZE.
+
+    Comments and blank lines between statements stay with the statement that follows them.
+    """
+    units: List[_Unit] = []
+    prev_end = first_line - 1
+    for i, node in enumerate(body):
+        start = prev_end + 1
+        end = last_line if i == len(body) - 1 else node.end_lineno
+        prev_end = end
+        symbol = f"{parent}.{node.name}" if parent and isinstance(node, _DEFINITIONS) else getattr(node, "name", None)
+
+        if len(_text(lines, start, end)) <= CHUNK_SIZE:
+            units.append(_Unit(start, end, symbol, parent))
+        elif isinstance(node, _DEFINITIONS) and _node_start(node.body[0]) > node.lineno:
+            body_start = _node_start(node.body[0])
+            # The signature/header is packed with the first members of the body
+            units.append(_Unit(start, body_start - 1, symbol, symbol))
+            units.extend(_units(node.body, lines, body_start, end, symbol))
+        else:
+            units.extend(_line_units(lines, start, end, symbol or parent))
+    return units
+
+def _pack(units: List[_Unit], lines: List[str]) -> List[_Unit]:
+    """
+    Greedily merges consecutive sibling units while they fit in CHUNK_SIZE.
+    """
+    packed: List[_Unit] = []
+    symbols: List[List[str]] = []
+    for unit in units:
+        if packed:
+            last = packed[-1]
+            if last.parent == unit.parent and len(_text(lines, last.start, unit.end)) <= CHUNK_SIZE:
+                packed[-1] = _Unit(last.start, unit.end, None, last.parent)
+                if unit.symbol:
+                    symbols[-1].append(unit.symbol)
+                continue
+        packed.append(unit)
+        symbols.append([unit.symbol] if unit.symbol else [])
+    return [
+        _Unit(u.start, u.end, ", ".join(names) or u.parent or "<module>", u.parent)
+        for u, names in zip(packed, symbols)
+    ]
+
+def split_python_document(document: Document) -> List[Document]:
+    """
+    Splits Python source on module, class and function boundaries.
+
+    Small sibling definitions are packed together up to CHUNK_SIZE, and oversized classes
+    and functions are split hierarchically into their members. Each chunk records its
+    start_line, end_line and the qualified symbol name(s) it covers.
+
+    :param document: Document with the full content of a Python file.
+    :returns: List of chunked Document objects.
+    :raises SyntaxError: If the content is not valid Python.
+    """
+    source = document.page_content
+    tree = ast.parse(source)
+    lines = source.splitlines(keepends=True)
+    if not tree.body:
+        return []
+
+    chunks: List[Document] = []
+    for unit in _pack(_units(tree.body, lines, 1, len(lines), ""), lines):
+        start, end = unit.start, unit.end
+        while start <= end and not lines[start - 1].strip():
+            start += 1
+        while end >= start and not lines[end - 1].strip():
+            end -= 1
+        if start > end:
+            continue
+        metadata = {**document.metadata, "start_line": start, "end_line": end, "symbol": unit.symbol}
+        text = _text(lines, start, end).rstrip()
+        if len(text) <= CHUNK_SIZE:
+            chunks.append(Document(page_content=text, metadata=metadata))
+        else:
+            # A single line longer than CHUNK_SIZE
+            chunks.extend(_character_splitter().split_documents([Document(page_content=text, metadata=metadata)]))
+    return chunks
+
+def split_document(document: Document) -> List[Document]:
+    """
+    Splits one document, using the syntax-aware chunker for Python files when enabled.
+
+    :param document: Document to split.
+    :returns: List of chunked Document objects.
+    """
+    chunks = None
+    if CHUNKER == "ast" and str(document.metadata.get("file_path", "")).endswith(".py"):
+        try:
+            chunks = split_python_document(document)
+        except (SyntaxError, ValueError):
+            pass
+    if chunks is None:
+        chunks = _character_splitter().split_documents([document])
+    metrics.inc("rag_chunks_total", len(chunks))
+    return chunks
 
 def split_documents(documents: List[Document]) -> List[Document]:
     """
-    Splits documents into smaller chunks using RecursiveCharacterTextSplitter.
+    Splits documents into smaller chunks, on syntax boundaries for Python files.
 
     :param documents: List of Document objects to split.
     :returns: List of chunked Document objects.
     """
-    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
-    return splitter.split_documents(documents)
+    with metrics.span("split") as span:
+        chunks = [chunk for document in documents for chunk in split_document(document)]
+        span.update(files=len(documents), chunks=len(chunks))
+    return chunks
+
+def iter_chunks(documents: Iterable[Document]) -> Iterator[Document]:
+    """
+    Lazily splits documents into chunks, one document at a time.
+
+    :param documents: Iterable of Document objects to split.
+    :returns: Iterator of chunked Document objects.
+    """
+    for document in documents:
+        yield from split_document(document)
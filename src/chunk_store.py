@@ -0,0 +1,320 @@
+import json
+import os
+import pickle
+import sqlite3
+import threading
+from typing import Dict, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
+
+import faiss
+from langchain.schema import Document
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+
+CHUNK_STORE_FILENAME = "chunks.sqlite3"
+INDEX_FILENAME = "index.faiss"
+LEGACY_PICKLE_FILENAME = "index.pkl"
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """
+    On-disk docstore keeping chunk text and metadata in SQLite instead of a pickle.
+
+    Chunks are fetched per ID on demand, so opening a store costs nothing regardless of
+    corpus size and only the top-k hits of a query are ever read into memory. Writes are
+    transactional and become visible with commit(), which save_store calls together with
+    writing the FAISS index.
+    """
+
+    def __init__(self, path: str, read_only: bool = False):
+        self.path = path
+        self.read_only = read_only
+        self._lock = threading.Lock()
+        if read_only:
+            self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks (doc_id TEXT PRIMARY KEY, page_content TEXT NOT NULL, "
+                "metadata TEXT NOT NULL)"
+            )
+            # Maps FAISS index positions to chunk IDs
+            self._conn.execute("CREATE TABLE IF NOT EXISTS positions (position INTEGER PRIMARY KEY, doc_id TEXT NOT NULL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS positions_doc_id ON positions (doc_id)")
+            self._conn.commit()
+
+    @classmethod
+    def create(cls, path: str, documents: Optional[Dict[str, Document]] = None) -> "SQLiteDocstore":
+        """
+        Creates an empty docstore at path, replacing any existing file.
+
+        :param path: SQLite file path.
+        :param documents: Optional initial documents by ID.
+        :returns: Writable SQLiteDocstore.
+        """
+        if os.path.exists(path):
+            os.remove(path)
+        docstore = cls(path)
+        if documents:
+            docstore.add(documents)
+        return docstore
+
+    @staticmethod
+    def _document(row: Tuple[str, str]) -> Document:
+        return Document(page_content=row[0], metadata=json.loads(row[1]))
+
+    def search(self, search: str) -> Union[str, Document]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT page_content, metadata FROM chunks WHERE doc_id = ?", (search,)
+            ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return self._document(row)
+
+    def mget(self, ids: List[str]) -> List[Optional[Document]]:
+        """
+        Fetches several chunks in one query.
+
+        :param ids: Chunk IDs.
+        :returns: Documents in the order of ids, None for unknown IDs.
+        """
+        found: Dict[str, Document] = {}
+        unique = list(dict.fromkeys(ids))
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT doc_id, page_content, metadata FROM chunks WHERE doc_id IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                for doc_id, content, metadata in rows:
+                    found[doc_id] = self._document((content, metadata))
+        return [found.get(doc_id) for doc_id in ids]
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        with self._lock:
+            try:
+                self._conn.executemany(
+                    "INSERT INTO chunks (doc_id, page_content, metadata) VALUES (?, ?, ?)",
+                    [(doc_id, doc.page_content, json.dumps(doc.metadata)) for doc_id, doc in texts.items()],
+                )
+            except sqlite3.IntegrityError as e:
+                raise ValueError(f"Tried to add ids that already exist: {e}") from e
+
+    def update_metadata(self, metadata: Mapping[str, Dict]) -> None:
+        """
+        Replaces the metadata of stored chunks; visible after commit().
+
+        :param metadata: New metadata by doc_id.
+        """
+        with self._lock:
+            self._conn.executemany("UPDATE chunks SET metadata = ? WHERE doc_id = ?",
+                                   [(json.dumps(value), doc_id) for doc_id, value in metadata.items()])
+
+    def delete(self, ids: List) -> None:
+        with self._lock:
+            self._conn.executemany("DELETE FROM chunks WHERE doc_id = ?", [(doc_id,) for doc_id in ids])
+
+    def items(self) -> Iterator[Tuple[str, Document]]:
+        """
+        Iterates over all chunks, e.g. to rebuild a lexical index.
+
+        :returns: Iterator of (doc_id, Document).
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT doc_id, page_content, metadata FROM chunks").fetchall()
+        for doc_id, content, metadata in rows:
+            yield doc_id, self._document((content, metadata))
+
+    def metadata_rows(self, fields: Sequence[str]) -> List[Tuple]:
+        """
+        Reads selected metadata fields of every indexed chunk without loading chunk text.
+
+        :param fields: Top-level metadata keys; nested values come back as JSON text.
+        :returns: List of (position, doc_id, *field values), None for missing fields.
+        """
+        columns = "".join(f", json_extract(c.metadata, '$.{field}')" for field in fields)
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT p.position, p.doc_id{columns} FROM positions p JOIN chunks c ON c.doc_id = p.doc_id"
+            ).fetchall()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def positions(self) -> Dict[int, str]:
+        """
+        Loads the full FAISS position to chunk ID mapping, for stores that will be modified.
+
+        :returns: Dict of position to doc_id.
+        """
+        with self._lock:
+            return dict(self._conn.execute("SELECT position, doc_id FROM positions").fetchall())
+
+    def position_id(self, position: int) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT doc_id FROM positions WHERE position = ?", (int(position),)).fetchone()
+        return row[0] if row else None
+
+    def doc_positions(self, ids: Sequence[str]) -> Dict[str, int]:
+        """
+        Looks up the FAISS index positions of chunks.
+
+        :param ids: Chunk IDs.
+        :returns: Dict of doc_id to position, without unknown IDs.
+        """
+        unique = list(dict.fromkeys(ids))
+        found: Dict[str, int] = {}
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                found.update(self._conn.execute(
+                    f"SELECT doc_id, position FROM positions WHERE doc_id IN ({','.join('?' * len(batch))})", batch
+                ).fetchall())
+        return found
+
+    def position_count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM positions").fetchone()[0]
+
+    def save_positions(self, index_to_docstore_id: Mapping[int, str]) -> None:
+        """
+        Replaces the stored position mapping; visible after commit().
+
+        :param index_to_docstore_id: The store's position to chunk ID mapping.
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM positions")
+            self._conn.executemany("INSERT INTO positions (position, doc_id) VALUES (?, ?)",
+                                   index_to_docstore_id.items())
+
+    def update_positions(self, removed: Sequence[int], added: Mapping[int, str]) -> None:
+        """
+        Applies deletes and appends to the stored position mapping; visible after commit().
+
+        FAISS compacts its index on delete, so each position after a removed one moves down
+        by the number of removed positions before it. Only those rows are rewritten.
+
+        :param removed: Positions dropped from the stored mapping.
+        :param added: Chunk IDs by their position after compaction.
+        """
+        removed = sorted(set(removed))
+        with self._lock:
+            self._conn.executemany("DELETE FROM positions WHERE position = ?", [(p,) for p in removed])
+            # Shift through negative positions so no row collides with one not yet moved
+            for shift, (low, high) in enumerate(zip(removed, removed[1:] + [None]), start=1):
+                if high is None:
+                    self._conn.execute("UPDATE positions SET position = ? - position WHERE position > ?",
+                                       (shift - 1, low))
+                else:
+                    self._conn.execute("UPDATE positions SET position = ? - position WHERE position > ? AND position < ?",
+                                       (shift - 1, low, high))
+            self._conn.execute("UPDATE positions SET position = -1 - position WHERE position < 0")
+            self._conn.executemany("INSERT INTO positions (position, doc_id) VALUES (?, ?)", added.items())
+
+    def commit(self) -> None:
+        with self._lock:
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+class LazyIdMap(Mapping):
+    """
+    Read-only position to chunk ID mapping that looks positions up in SQLite on demand.
+    """
+
+    def __init__(self, docstore: SQLiteDocstore):
+        self.docstore = docstore
+        self._len: Optional[int] = None
+
+    def __getitem__(self, position: int) -> str:
+        doc_id = self.docstore.position_id(position)
+        if doc_id is None:
+            raise KeyError(position)
+        return doc_id
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(len(self)))
+
+    def __len__(self) -> int:
+        if self._len is None:
+            self._len = self.docstore.position_count()
+        return self._len
+
+def migrate_pickle(db_path: str) -> None:
+    """
+    Converts a store persisted with a pickled docstore (index.pkl) to chunks.sqlite3.
+
+    This is the only place the legacy pickle is read; it is removed afterwards.
+
+    :param db_path: Directory of the repo's vector store.
+    """
+    pickle_path = os.path.join(db_path, LEGACY_PICKLE_FILENAME)
+    with open(pickle_path, "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    print(f"Migrating {pickle_path} to {CHUNK_STORE_FILENAME}")
+    store_path = os.path.join(db_path, CHUNK_STORE_FILENAME)
+    sqlite_docstore = SQLiteDocstore.create(store_path + ".tmp", docstore._dict)
+    sqlite_docstore.save_positions(index_to_docstore_id)
+    sqlite_docstore.commit()
+    sqlite_docstore.close()
+    os.replace(store_path + ".tmp", store_path)
+    os.remove(pickle_path)
+
+def save_store(db: FAISS, db_path: str, removed_positions: Optional[Sequence[int]] = None, added: int = 0) -> None:
+    """
+    Persists a store as index.faiss plus chunks.sqlite3, replacing FAISS.save_local.
+
+    A store still holding an in-memory docstore gets a fresh chunks.sqlite3. When the
+    changes since the store was loaded are given, only the affected rows of the position
+    mapping are written; otherwise it is replaced as a whole.
+
+    :param db: FAISS vector store.
+    :param db_path: Directory of the repo's vector store.
+    :param removed_positions: Positions deleted since loading, numbered as when loaded.
+    :param added: Number of vectors appended since loading, i.e. at the end of the index.
+    """
+    os.makedirs(db_path, exist_ok=True)
+    if not isinstance(db.docstore, SQLiteDocstore):
+        db.docstore = SQLiteDocstore.create(os.path.join(db_path, CHUNK_STORE_FILENAME), db.docstore._dict)
+    index_path = os.path.join(db_path, INDEX_FILENAME)
+    faiss.write_index(db.index, index_path + ".tmp")
+    if removed_positions is None:
+        db.docstore.save_positions(db.index_to_docstore_id)
+    else:
+        ntotal = db.index.ntotal
+        db.docstore.update_positions(removed_positions,
+                                     {p: db.index_to_docstore_id[p] for p in range(ntotal - added, ntotal)})
+    db.docstore.commit()
+    os.replace(index_path + ".tmp", index_path)
+    legacy = os.path.join(db_path, LEGACY_PICKLE_FILENAME)
+    if os.path.exists(legacy):
+        os.remove(legacy)
+
+def load_store(db_path: str, embedding: Embeddings, index: Optional[faiss.Index] = None,
+               writable: bool = False) -> FAISS:
+    """
+    Opens a store persisted by save_store, migrating a legacy pickled docstore first.
+
+    Read-only stores resolve positions and chunks lazily from SQLite; writable stores load
+    the position mapping eagerly, since FAISS rewrites it on add and delete.
+
+    :param db_path: Directory of the repo's vector store.
+    :param embedding: Embedding model used for queries.
+    :param index: Already loaded faiss index (e.g. memory-mapped); read from index.faiss if None.
+    :param writable: Open the docstore for add/delete.
+    :returns: FAISS vector store instance.
+    """
+    store_path = os.path.join(db_path, CHUNK_STORE_FILENAME)
+    if not os.path.exists(store_path) and os.path.exists(os.path.join(db_path, LEGACY_PICKLE_FILENAME)):
+        migrate_pickle(db_path)
+    if index is None:
+        index = faiss.read_index(os.path.join(db_path, INDEX_FILENAME))
+    docstore = SQLiteDocstore(store_path, read_only=not writable)
+    index_to_docstore_id = docstore.positions() if writable else LazyIdMap(docstore)
+    return FAISS(embedding, index, docstore, index_to_docstore_id)
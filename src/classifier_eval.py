@@ -0,0 +1,57 @@
+import json
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import CLASSIFIER_CONFIDENCE_THRESHOLD
+
+DEFAULT_EVAL_SET = "evals/query_classifier.jsonl"
+
+def load_eval_set(path: str = DEFAULT_EVAL_SET) -> List[Dict]:
+    """
+    Loads labelled queries, one JSON object with "query" and "code_related" per line.
+
+    :param path: Path to the JSONL eval set.
+    :returns: List of example dicts.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def evaluate_classifier(examples: List[Dict],
+                        classify: Callable[[str], Tuple[Optional[bool], float]],
+                        threshold: float = CLASSIFIER_CONFIDENCE_THRESHOLD) -> Dict[str, float]:
+    """
+    Reports accuracy, LLM fallback rate and latency of a local classifier tier.
+
+    :param examples: Labelled examples from load_eval_set.
+    :param classify: Local classifier returning (label or None, confidence), e.g. classify_locally.
+    :param threshold: Confidence below which the LLM would be asked.
+    :returns: Dict with accuracy on confident answers, fallback rate and latency percentiles (ms).
+    """
+    latencies: List[float] = []
+    confident = correct = 0
+    for example in examples:
+        start = time.perf_counter()
+        label, confidence = classify(example["query"])
+        latencies.append((time.perf_counter() - start) * 1000)
+        if label is not None and confidence >= threshold:
+            confident += 1
+            correct += label == example["code_related"]
+
+    latencies.sort()
+    return {
+        "examples": len(examples),
+        "confident_accuracy": correct / confident if confident else 0.0,
+        "llm_fallback_rate": 1 - confident / len(examples) if examples else 0.0,
+        "latency_p50_ms": statistics.median(latencies) if latencies else 0.0,
+        "latency_p95_ms": latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0,
+    }
+
+if __name__ == "__main__":
+    from query_classifier import classify_locally, heuristic_classification
+
+    eval_set = load_eval_set(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_EVAL_SET)
+    for name, tier in (("heuristics", heuristic_classification), ("heuristics+embeddings", classify_locally)):
+        classify_locally(eval_set[0]["query"])  # warm up the embedding model
+        print(name, json.dumps(evaluate_classifier(eval_set, tier), indent=2))
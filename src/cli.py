@@ -1,18 +1,37 @@
 import warnings
 warnings.filterwarnings("ignore")
 
-from collections import defaultdict
-from typing import List
+import argparse
+import asyncio
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import TYPE_CHECKING, List, Optional, Tuple
 
+from answer_stream import TokenCallback, TokenPrinter, generate
+from lazy_import import lazy_callable, warm_up
+from metrics import metrics, profile_call, start_metrics_server
+from config import (
+    CODE_QUERY_RETRIEVAL_K, CONTEXT_MMR_LAMBDA, MODEL_PROVIDER, MODEL_NAME, STREAM_ANSWERS, SERVER_URL, METRICS_PORT
+)
 
-from clone_repo import clone_repos
-from load_code_documents import load_code_documents
-from chunk_docs import split_documents
-from vector_store import create_vector_store
-from retriever import create_qa_chain
-from query_classifier import is_code_related_query
-from llm_factory import get_llm
-from config import CODE_QUERY_RETRIEVAL_K
+if TYPE_CHECKING:
+    from answer_cache import AnswerCache
+    from federated_search import FederatedIndex
+    from search_filter import SearchFilter
+
+# langchain, faiss and the models load on first use (or in warm_up while repo URLs are typed)
+ingest_repositories = lazy_callable("ingest_pipeline", "ingest_repositories")
+FederatedIndex = lazy_callable("federated_search", "FederatedIndex")
+AnswerCache = lazy_callable("answer_cache", "AnswerCache")
+build_context = lazy_callable("context_builder", "build_context")
+get_embedding_model = lazy_callable("embedding_engine", "get_embedding_model")
+is_code_related_query = lazy_callable("query_classifier", "is_code_related_query")
+get_llm = lazy_callable("llm_factory", "get_llm")
+parse_filters = lazy_callable("search_filter", "parse_filters")
+
+_WARM_UP_MODULES = ("ingest_pipeline", "federated_search", "answer_cache", "context_builder", "llm_factory")
+
+# Cached answers are only reused for the model that produced them
+ANSWER_MODEL_KEY = f"{MODEL_PROVIDER}:{MODEL_NAME}"
 
 def get_repo_urls() -> List[str]:
     """
@@ -25,99 +44,316 @@ def get_repo_urls() -> List[str]:
 
 def process_repositories(repo_urls: List[str]):
     """
-    Clones repos, loads documents, chunks, and creates vector stores.
+    Clones repos, loads documents, and incrementally updates their vector stores.
+
+    The stages run as a pipeline across repos; see ingest_pipeline.ingest_repositories.
 
     :param repo_urls: List of GitHub repository URLs.
-    :returns: List of FAISS vector stores for each repo.
+    :returns: List of RepoIndex (vector store and lexical index) for each repo.
     """
-    vectorstores = []
-    for repo_name, repo_path in clone_repos(repo_urls):
-        print(f"\nProcessing {repo_name}...")
-        docs = load_code_documents(repo_name, repo_path)
-        chunks = split_documents(docs)
-        vectorstore = create_vector_store(chunks, repo_name)
-        vectorstores.append(vectorstore)
-    return vectorstores
+    return ingest_repositories(repo_urls)
 
-def combine_vectorstores(vectorstores):
+def parse_repo_scope(query: str) -> Tuple[Optional[List[str]], str]:
     """
-    Merges multiple vectorstores into one combined store.
+    Splits an optional ``@repoA,repoB`` prefix from a query.
 
-    :param vectorstores: List of FAISS vectorstores.
-    :returns: Combined FAISS vectorstore.
-    :raises ValueError: If vectorstores list is empty.
+    :param query: Raw user input, e.g. "@repoA,repoB where is the config loaded?".
+    :returns: Tuple of (repo names or None for all repos, remaining query).
     """
-    if not vectorstores:
-        raise ValueError("No vectorstores available!")
-    combined = vectorstores[0]
-    for vs in vectorstores[1:]:
-        combined.merge_from(vs)
-    return combined
+    if not query.startswith("@"):
+        return None, query
+    scope, _, rest = query[1:].partition(" ")
+    repos = [name.strip() for name in scope.split(",") if name.strip()]
+    return repos or None, rest.strip()
 
-def handle_code_query(query: str, vectorstore, llm) -> str:
+def _cached(cache: Optional["AnswerCache"], query: str, chunk_ids: List[str],
+            on_token: Optional[TokenCallback]) -> Optional[str]:
+    if cache is None:
+        return None
+    answer = cache.get(query, ANSWER_MODEL_KEY, chunk_ids)
+    if answer is not None and on_token is not None:
+        on_token(answer)
+    return answer
+
+def handle_general_query(query: str, llm, cache: Optional["AnswerCache"] = None,
+                         on_token: Optional[TokenCallback] = None) -> str:
+    """
+    Answers a question that is not about the indexed code directly with the LLM.
+
+    :param query: User question.
+    :param llm: LLM instance.
+    :param cache: Optional AnswerCache consulted before calling the LLM.
+    :param on_token: Optional callback receiving the answer token by token as it streams.
+    :returns: Answer string from the LLM.
+    """
+    cached = _cached(cache, query, [], on_token)
+    if cached is not None:
+        return cached
+    answer = generate(llm, query, on_token)
+    if cache is not None:
+        cache.put(query, ANSWER_MODEL_KEY, answer)
+    return answer
+
+def handle_code_query(query: str, index: "FederatedIndex", llm, repos: Optional[List[str]] = None,
+                      cache: Optional["AnswerCache"] = None, on_token: Optional[TokenCallback] = None,
+                      filters: Optional["SearchFilter"] = None) -> str:
     """
     Retrieves relevant code snippets for the query and generates an answer using the LLM.
 
     :param query: User question related to code.
-    :param vectorstore: FAISS vectorstore instance.
+    :param index: FederatedIndex over the per-repo indexes.
     :param llm: LLM instance.
+    :param repos: Optional repo names to restrict retrieval to; all repos if None.
+    :param cache: Optional AnswerCache; answers are keyed on the retrieved chunk IDs, so a
+        cached answer is only reused while the same chunks are retrieved.
+    :param on_token: Optional callback receiving the answer token by token as it streams.
+    :param filters: Optional path, language and symbol filters applied inside the search.
     :returns: Answer string from the LLM.
     """
-    retriever = vectorstore.as_retriever(search_kwargs={"k": CODE_QUERY_RETRIEVAL_K})
-    docs = retriever.get_relevant_documents(query)
+    docs = index.search(query, CODE_QUERY_RETRIEVAL_K, repos, filters=filters)
+    return answer_from_docs(query, docs, llm, cache, on_token, index)
 
-    grouped_docs = defaultdict(list)
-    for doc in docs:
-        repo = doc.metadata.get("repo_name", "Unknown Repo")
-        grouped_docs[repo].append(doc)
+def answer_from_docs(query: str, docs: List, llm, cache: Optional["AnswerCache"] = None,
+                     on_token: Optional[TokenCallback] = None, index: Optional["FederatedIndex"] = None) -> str:
+    """
+    Generates an answer to a code question from already retrieved chunks.
 
-    summaries = []
-    for repo, repo_docs in grouped_docs.items():
-        summaries.append(f"\n **{repo}**")
-        for d in repo_docs:
-            path = d.metadata.get("file_path", "unknown")
-            preview = d.page_content.strip().split("\n")[0][:80]
-            summaries.append(f"- `{path}`: {preview}...")
+    :param query: User question related to code.
+    :param docs: Retrieved Document objects.
+    :param llm: LLM instance.
+    :param cache: Optional AnswerCache keyed on the retrieved chunk IDs.
+    :param on_token: Optional callback receiving the answer token by token as it streams.
+    :param index: FederatedIndex the docs came from; MMR reads their vectors back from it
+        instead of embedding the chunks again.
+    :returns: Answer string from the LLM.
+    """
+    chunk_ids = [f"{d.metadata.get('repo_name')}/{d.metadata.get('doc_id')}" for d in docs]
+    cached = _cached(cache, query, chunk_ids, on_token)
+    if cached is not None:
+        return cached
 
-    context = "\n".join(summaries)
+    embeddings, vectors = None, None
+    if CONTEXT_MMR_LAMBDA < 1:
+        embeddings = get_embedding_model()
+        vectors = index.chunk_vectors(docs) if index is not None else None
+    context = build_context(query, docs, embeddings, vectors=vectors)
     prompt = (
         f"The user asked: \"{query}\"\n"
-        f"Here are relevant code snippets grouped by repository:\n{context}\n\n"
+        f"Here are relevant code snippets grouped by repository:\n\n{context}\n\n"
         f"Answer the question in a helpful, structured way."
     )
 
-    response = llm.invoke(prompt)
-    return response.content.strip()
+    answer = generate(llm, prompt, on_token)
+    if cache is not None:
+        cache.put(query, ANSWER_MODEL_KEY, answer, chunk_ids, {d.metadata.get("repo_name") for d in docs})
+    return answer
+
+async def answer_query(query: str, index: "FederatedIndex", llm, repos: Optional[List[str]] = None,
+                       cache: Optional["AnswerCache"] = None, on_token: Optional[TokenCallback] = None,
+                       executor: Optional[Executor] = None, filters: Optional["SearchFilter"] = None) -> str:
+    """
+    Answers a question, retrieving speculatively while it is being classified.
+
+    Retrieval starts at once alongside the classifier (which may call the LLM). A code
+    question then goes straight to generation with the retrieval already done; for a
+    general question the retrieval is cancelled or its result discarded. Questions
+    scoped to repos or filtered by metadata skip classification.
+
+    :param query: User question.
+    :param index: FederatedIndex over the per-repo indexes.
+    :param llm: LLM instance.
+    :param repos: Optional repo names to restrict retrieval to.
+    :param cache: Optional AnswerCache.
+    :param on_token: Optional callback receiving the answer token by token as it streams.
+    :param executor: Executor for the blocking steps; the loop's default executor if None.
+    :param filters: Optional path, language and symbol filters applied inside the search.
+    :returns: Answer string from the LLM.
+    :raises ValueError: If a code question cannot be searched (e.g. no or unknown repos).
+    """
+    with metrics.span("query"):
+        loop = asyncio.get_running_loop()
+        retrieval = loop.run_in_executor(
+            executor, lambda: index.search(query, CODE_QUERY_RETRIEVAL_K, repos, filters=filters)
+        )
+        if repos is None and not filters:
+            try:
+                is_code = await loop.run_in_executor(executor, is_code_related_query, query)
+            except BaseException:
+                retrieval.cancel()
+                raise
+            if not is_code:
+                retrieval.cancel()
+                return await loop.run_in_executor(executor, handle_general_query, query, llm, cache, on_token)
+        docs = await retrieval
+        return await loop.run_in_executor(executor, answer_from_docs, query, docs, llm, cache, on_token, index)
+
+def handle_command(command: str, index: "FederatedIndex", cache: Optional["AnswerCache"] = None) -> None:
+    """
+    Runs a repo management command: ``:repos``, ``:add <url>[, <url>...]`` or ``:drop <repo name>``.
+
+    :param command: Command line starting with ":".
+    :param index: FederatedIndex to modify.
+    :param cache: Optional AnswerCache; answers about an added or dropped repo are invalidated.
+    """
+    name, _, arg = command[1:].partition(" ")
+    arg = arg.strip()
+    if name == "repos":
+        print("Repos:", ", ".join(index.repo_names) or "(none)")
+    elif name == "add" and arg:
+        for repo_index in process_repositories([url.strip() for url in arg.split(",") if url.strip()]):
+            index.add(repo_index)
+            if cache is not None:
+                cache.invalidate_repo(repo_index.repo_name)
+            print(f"Added {repo_index.repo_name}")
+    elif name == "drop" and arg:
+        if cache is not None:
+            cache.invalidate_repo(arg)
+        print(f"Dropped {arg}" if index.remove(arg) else f"Unknown repo: {arg}")
+    else:
+        print("Commands: :repos, :add <url>[, <url>...], :drop <repo name>")
 
-def interactive_loop(vectorstore, llm):
+def interactive_loop(index: "FederatedIndex", llm, cache: Optional["AnswerCache"] = None,
+                     stream: bool = STREAM_ANSWERS):
     """
     Interactive CLI loop for user queries.
 
-    :param vectorstore: Combined FAISS vectorstore.
+    Prefix a question with ``@repoA,repoB`` to search only those repos, and add
+    ``path:<glob>``, ``lang:<language>`` or ``symbol:<glob>`` terms to filter the chunks
+    searched; lines starting with ":" add, drop or list repos (see handle_command).
+
+    :param index: FederatedIndex over the per-repo indexes.
     :param llm: LLM instance.
+    :param cache: Optional AnswerCache shared by general and code questions.
+    :param stream: Print answers token by token, followed by time to first token and tokens/sec.
     """
     print("\nAsk questions about the code across all repos or general programming (type 'exit' to quit):")
+    # Classification, retrieval and generation of each question run on these threads
+    executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="query")
     while True:
         query = input("\nYou: ")
         if query.lower() == "exit":
             break
+        if query.startswith(":"):
+            handle_command(query, index, cache)
+            continue
 
-        if not is_code_related_query(query):
-            response = llm.invoke(query)
-            print("\nBot:", response.content.strip())
-        else:
-            answer = handle_code_query(query, vectorstore, llm)
+        repos, query = parse_repo_scope(query)
+        printer = TokenPrinter() if stream else None
+        if printer is not None:
+            print("\nBot: ", end="", flush=True)
+        try:
+            filters, query = parse_filters(query)
+            answer = asyncio.run(answer_query(query, index, llm, repos, cache, printer, executor, filters))
+        except ValueError as e:
+            print(e if printer is not None else f"\nBot: {e}")
+            continue
+
+        if printer is None:
             print("\nBot:", answer)
+        elif printer.summary():
+            print(f"\n({printer.summary()})")
+        else:
+            print()
+    executor.shutdown(wait=False)
+
+def _request(session, method: str, url: str, **kwargs) -> dict:
+    response = session.request(method, url, timeout=600, **kwargs)
+    body = response.json()
+    if response.status_code >= 400:
+        raise ValueError(body.get("error", f"HTTP {response.status_code}"))
+    return body
 
-def main():
+def client_loop(server_url: str, session=None):
+    """
+    Thin client for a running query server (see server.py), with the same prompt and commands.
+
+    :param server_url: Base URL of the server, e.g. "http://127.0.0.1:8765".
+    :param session: Optional requests.Session; keeps the connection alive between questions.
+    """
+    import requests
+    session = session or requests.Session()
+    base = server_url.rstrip("/")
+    print(f"\nAsk questions about the code across all repos on {base} (type 'exit' to quit):")
+    while True:
+        query = input("\nYou: ")
+        if query.lower() == "exit":
+            break
+        name, _, arg = query[1:].partition(" ")
+        arg = arg.strip()
+        try:
+            if query.startswith(":"):
+                if name == "repos":
+                    repos = _request(session, "GET", f"{base}/repos")["repos"]
+                    print("Repos:", ", ".join(repos) or "(none)")
+                elif name == "add" and arg:
+                    urls = [url.strip() for url in arg.split(",") if url.strip()]
+                    for repo in _request(session, "POST", f"{base}/repos", json={"urls": urls})["repos"]:
+                        print(f"Added {repo}")
+                elif name == "drop" and arg:
+                    _request(session, "DELETE", f"{base}/repos/{arg}")
+                    print(f"Dropped {arg}")
+                else:
+                    print("Commands: :repos, :add <url>[, <url>...], :drop <repo name>")
+                continue
+            print("\nBot:", _request(session, "POST", f"{base}/query", json={"query": query})["answer"])
+        except (ValueError, requests.RequestException) as e:
+            print("\nBot:", e)
+
+def answer_in_thread(query: str, index: "FederatedIndex", llm) -> str:
+    """
+    Classifies and answers a question in the calling thread, without speculative retrieval.
+
+    Used by --profile, since profilers only see the thread they run in.
+
+    :param query: User question.
+    :param index: FederatedIndex over the per-repo indexes.
+    :param llm: LLM instance.
+    :returns: Answer string from the LLM.
+    """
+    repos, query = parse_repo_scope(query)
+    if repos is None and not is_code_related_query(query):
+        return handle_general_query(query, llm)
+    return handle_code_query(query, index, llm, repos)
+
+def main(argv: Optional[List[str]] = None) -> None:
     """
     Main entry point of the CLI app.
+
+    With SERVER_URL set, the CLI only talks to a running server, which keeps models and
+    indexes loaded between sessions. Otherwise the heavy modules and the embedding model
+    load in the background while the repo URLs are typed.
+
+    :param argv: Command line arguments; sys.argv if None.
     """
+    parser = argparse.ArgumentParser(description="Ask questions about GitHub repos.")
+    parser.add_argument("--profile", metavar="QUESTION",
+                        help="answer a single question under a profiler, print the report and exit")
+    parser.add_argument("--profiler", choices=("cprofile", "pyinstrument"), default="cprofile")
+    parser.add_argument("--profile-output", metavar="PATH",
+                        help="write the profile (pstats data, or HTML for pyinstrument) instead of printing it")
+    args = parser.parse_args(argv)
+
+    if not SERVER_URL:
+        warm_up(_WARM_UP_MODULES, [get_embedding_model, get_llm])
     repo_urls = get_repo_urls()
-    vectorstores = process_repositories(repo_urls)
-    combined_vectorstore = combine_vectorstores(vectorstores)
+    if SERVER_URL:
+        import requests
+        session = requests.Session()
+        if repo_urls:
+            added = _request(session, "POST", f"{SERVER_URL.rstrip('/')}/repos", json={"urls": repo_urls})["repos"]
+            print("Indexed:", ", ".join(added))
+        client_loop(SERVER_URL, session)
+        return
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+        print(f"Metrics at http://127.0.0.1:{METRICS_PORT}/metrics")
+    index = FederatedIndex(process_repositories(repo_urls))
     llm = get_llm()
-    interactive_loop(combined_vectorstore, llm)
+    if args.profile:
+        answer = profile_call(lambda: answer_in_thread(args.profile, index, llm), args.profile_output, args.profiler)
+        print("Answer:", answer)
+        return
+    interactive_loop(index, llm, AnswerCache())
 
 if __name__ == "__main__":
     main()
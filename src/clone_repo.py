@@ -1,18 +1,188 @@
+import hashlib
+import os
+import shutil
 import tempfile
-from git import Repo
-from typing import List, Tuple
+import threading
+from git import GitCommandError, Repo
+from typing import Dict, List, Optional, Tuple
+from config import CLONE_CACHE_DIR, CLONE_CACHE_MAX_BYTES, CLONE_DEPTH, CLONE_FILTER
+from metrics import metrics
+
+LAST_USED_MARKER = "rag_last_used"
+
+_cache_lock = threading.Lock()
+# Reference counts of the cache entries in use by this process, and a lock per entry
+# serializing its clone or refresh
+_active_keys: Dict[str, int] = {}
+_key_locks: Dict[str, threading.Lock] = {}
+
+def parse_repo_url(url: str) -> Tuple[str, str, Optional[str]]:
+    """
+    Splits a repo URL with an optional ``#ref`` suffix used to pin a branch or tag.
+
+    :param url: Git repository URL, e.g. ``https://github.com/user/repo#v1.2``.
+    :returns: Tuple of (repo_name, clone_url, ref or None).
+    """
+    clone_url, _, ref = url.partition("#")
+    repo_name = clone_url.rstrip('/').split('/')[-1].replace('.git', '')
+    return repo_name, clone_url, ref or None
+
+def _cache_key(repo_name: str, clone_url: str, ref: Optional[str] = None) -> str:
+    # Each pinned ref gets its own checkout, so repo#v1 and repo#v2 never share a directory
+    source = f"{clone_url}#{ref}" if ref else clone_url
+    return f"{repo_name}-{hashlib.sha1(source.encode('utf-8')).hexdigest()[:12]}"
+
+def _acquire(key: str) -> threading.Lock:
+    with _cache_lock:
+        _active_keys[key] = _active_keys.get(key, 0) + 1
+        return _key_locks.setdefault(key, threading.Lock())
+
+def _release(key: str) -> None:
+    with _cache_lock:
+        _active_keys[key] -= 1
+        if not _active_keys[key]:
+            del _active_keys[key]
+            del _key_locks[key]
+
+def _fetch_kwargs() -> Dict[str, object]:
+    kwargs: Dict[str, object] = {}
+    if CLONE_DEPTH:
+        kwargs["depth"] = CLONE_DEPTH
+    if CLONE_FILTER:
+        kwargs["filter"] = CLONE_FILTER
+    return kwargs
+
+def _touch(repo_path: str) -> None:
+    marker = os.path.join(repo_path, ".git", LAST_USED_MARKER)
+    with open(marker, "a"):
+        pass
+    os.utime(marker, None)
+
+def _refresh(repo: Repo, ref: Optional[str]) -> None:
+    """
+    Fetches only the new objects for ref (or the remote HEAD) and moves the checkout to them.
+    """
+    repo.git.fetch("origin", ref or "HEAD", **_fetch_kwargs())
+    if ref is None and not repo.head.is_detached:
+        try:
+            repo.git.merge("--ff-only", "FETCH_HEAD")
+            return
+        except GitCommandError:
+            # Upstream history was rewritten; follow it
+            repo.git.reset("--hard", "FETCH_HEAD")
+            return
+    repo.git.checkout("--force", "--detach", "FETCH_HEAD")
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                continue
+    return total
+
+def _last_used(path: str) -> float:
+    try:
+        return os.path.getmtime(os.path.join(path, ".git", LAST_USED_MARKER))
+    except OSError:
+        return 0.0
+
+def evict_clone_cache(cache_dir: str = CLONE_CACHE_DIR, max_bytes: int = CLONE_CACHE_MAX_BYTES) -> List[str]:
+    """
+    Removes least recently used clones until the cache fits in the disk budget.
+
+    Clones being cloned or refreshed by the current process are never evicted.
+
+    :param cache_dir: Clone cache directory.
+    :param max_bytes: Disk budget in bytes; 0 disables eviction.
+    :returns: List of evicted cache keys.
+    """
+    if not max_bytes or not os.path.isdir(cache_dir):
+        return []
+    with _cache_lock:
+        entries = [
+            name for name in os.listdir(cache_dir)
+            if not name.startswith(".") and os.path.isdir(os.path.join(cache_dir, name))
+        ]
+        sizes = {name: _dir_size(os.path.join(cache_dir, name)) for name in entries}
+        total = sum(sizes.values())
+        evicted = []
+        for name in sorted(entries, key=lambda n: _last_used(os.path.join(cache_dir, n))):
+            if total <= max_bytes:
+                break
+            if name in _active_keys:
+                continue
+            shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+            total -= sizes[name]
+            evicted.append(name)
+    return evicted
+
+def _clone_or_refresh(repo_name: str, clone_url: str, ref: Optional[str], key: str, repo_path: str,
+                      cache_dir: str) -> None:
+    cached = os.path.isdir(os.path.join(repo_path, ".git"))
+    with metrics.span("clone") as span:
+        span.update(repo=repo_name, cached=cached)
+        if cached:
+            _refresh(Repo(repo_path), ref)
+        else:
+            # Clone next to the final location and move it in place, so an interrupted
+            # clone never leaves a half-populated cache entry behind
+            staging_dir = tempfile.mkdtemp(prefix=f".tmp-{key}-", dir=cache_dir)
+            try:
+                repo = Repo.clone_from(clone_url, staging_dir, **_fetch_kwargs())
+                if ref:
+                    _refresh(repo, ref)
+                shutil.rmtree(repo_path, ignore_errors=True)
+                os.replace(staging_dir, repo_path)
+            finally:
+                shutil.rmtree(staging_dir, ignore_errors=True)
+
+def clone_repo(url: str, cache_dir: str = CLONE_CACHE_DIR) -> Tuple[str, str]:
+    """
+    Clones a Git repository into the local clone cache, or refreshes the cached clone.
+
+    New clones are shallow and blob-filtered; cached clones are updated with a fetch and
+    fast-forward, so a warm run only transfers new objects. A ``#ref`` suffix pins the
+    checkout to a branch or tag, kept in its own cache entry. Concurrent calls for the
+    same entry are serialized.
+
+    :param url: Git repository URL to clone, optionally suffixed with ``#ref``.
+    :param cache_dir: Clone cache directory.
+    :returns: Tuple of (repo_name, local_path).
+    """
+    repo_name, clone_url, ref = parse_repo_url(url)
+    key = _cache_key(repo_name, clone_url, ref)
+    repo_path = os.path.join(cache_dir, key)
+    os.makedirs(cache_dir, exist_ok=True)
+    lock = _acquire(key)
+    try:
+        with lock:
+            _clone_or_refresh(repo_name, clone_url, ref, key, repo_path, cache_dir)
+            _touch(repo_path)
+        evict_clone_cache(cache_dir)
+    finally:
+        _release(key)
+    return repo_name, repo_path
 
 def clone_repos(repo_urls: List[str]) -> List[Tuple[str, str]]:
     """
-    Clones multiple Git repositories into temporary directories.
+    Clones multiple Git repositories into the local clone cache.
 
     :param repo_urls: List of Git repository URLs to clone.
     :returns: List of tuples containing (repo_name, local_path).
     """
-    repo_paths: List[Tuple[str, str]] = []
-    for url in repo_urls:
-        temp_dir = tempfile.mkdtemp()
-        Repo.clone_from(url, temp_dir)
-        repo_name = url.split('/')[-1].replace('.git', '')
-        repo_paths.append((repo_name, temp_dir))
-    return repo_paths
+    return [clone_repo(url) for url in repo_urls]
+
+def get_head_commit(repo_path: str) -> Optional[str]:
+    """
+    Returns the commit SHA checked out in a local repository.
+
+    :param repo_path: Local path to the repository.
+    :returns: Hex SHA of HEAD, or None if the path is not a git checkout.
+    """
+    try:
+        return Repo(repo_path).head.commit.hexsha
+    except Exception:
+        return None
@@ -1,14 +1,145 @@
+from typing import Dict, List
+
 MODEL_PROVIDER: str = "ollama"  # or "openai", "together"
 # Use below model for better code responses. Commenting this as it is large model
 # MODEL_NAME = "codellama:34b-instruct
 MODEL_NAME: str = "mistral"  # example model name for your LLM provider
 
+# LLM gateway: providers tried in order after MODEL_PROVIDER when it fails or is saturated
+LLM_FAILOVER: List[str] = []  # e.g. ["together", "openai"]
+LLM_MODELS: Dict[str, str] = {}  # model name per failover provider; MODEL_NAME otherwise
+LLM_BASE_URLS: Dict[str, str] = {}  # endpoint overrides, e.g. {"ollama": "http://gpu-box:11434"}
+LLM_MAX_CONCURRENCY: Dict[str, int] = {"ollama": 2, "together": 8, "openai": 8}
+LLM_QUEUE_TIMEOUT_SECONDS: float = 5.0  # wait for a free slot before failing over
+LLM_TIMEOUT_SECONDS: float = 120.0
+LLM_MAX_RETRIES: int = 2  # per provider, with exponential backoff
+LLM_RETRY_BACKOFF_SECONDS: float = 0.5
+OLLAMA_KEEP_ALIVE: str = "30m"  # how long the Ollama daemon keeps the model loaded after a request
+# Concurrent LLM classification prompts within this window are sent as one prompt
+LLM_BATCH_WINDOW_MS: float = 10.0
+LLM_BATCH_MAX: int = 16
+
 EMBEDDING_MODEL_NAME: str = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_BACKEND: str = "torch"  # or "torch-int8", "onnx-int8" (needs optimum[onnxruntime])
+EMBEDDING_BATCH_SIZE: int = 64
+EMBEDDING_WORKERS: int = 1  # >1 spreads large jobs over a pool of CPU processes
+EMBEDDING_POOL_MIN_TEXTS: int = 2048  # smaller jobs are not worth the pool overhead
+# Content-addressed embedding cache shared across repos; empty string disables it
+EMBEDDING_CACHE_PATH: str = "../embedding_cache/embeddings.sqlite3"
+EMBEDDING_CACHE_MAX_ENTRIES: int = 2_000_000
+# Concurrent queries (server mode) are embedded together within this window
+QUERY_BATCH_WINDOW_MS: float = 5.0
+QUERY_BATCH_MAX: int = 32
 
+# File discovery: git-tracked (or, outside git, non-ignored) files with these extensions
+LANGUAGE_EXTENSIONS: Dict[str, List[str]] = {
+    "python": [".py", ".pyi"],
+    "javascript": [".js", ".jsx", ".mjs", ".cjs"],
+    "typescript": [".ts", ".tsx"],
+    "go": [".go"],
+    "rust": [".rs"],
+    "java": [".java"],
+    "kotlin": [".kt", ".kts"],
+    "c": [".c", ".h"],
+    "cpp": [".cc", ".cpp", ".cxx", ".hpp", ".hh"],
+    "csharp": [".cs"],
+    "ruby": [".rb"],
+    "php": [".php"],
+    "shell": [".sh", ".bash"],
+}
+INDEX_LANGUAGES: List[str] = ["python"]  # keys of LANGUAGE_EXTENSIONS to index
+SCAN_EXCLUDE_DIRS: List[str] = [
+    ".git", "node_modules", "venv", ".venv", "env", "site-packages", "__pycache__", ".tox", ".mypy_cache",
+    "vendor", "third_party", "dist", "build",
+]
+SCAN_MAX_FILE_BYTES: int = 1_000_000  # larger files are skipped, 0 disables the limit
+SCAN_READ_WORKERS: int = 8
+
+CHUNKER: str = "ast"  # or "character" to always use RecursiveCharacterTextSplitter
 CHUNK_SIZE: int = 800
-CHUNK_OVERLAP: int = 150
+CHUNK_OVERLAP: int = 150  # only used by the character splitter
+
+# Near-duplicate chunks (MinHash/LSH over token shingles) collapse into one indexed chunk
+DEDUP_ENABLED: bool = True
+DEDUP_THRESHOLD: float = 0.9  # estimated Jaccard similarity of token shingles
+DEDUP_NUM_PERM: int = 128
+DEDUP_BANDS: int = 16  # LSH bands; DEDUP_NUM_PERM must be divisible by it
+DEDUP_SHINGLE_SIZE: int = 5  # tokens per shingle
+DEDUP_MIN_TOKENS: int = 20  # shorter chunks are never collapsed
+
+# Chunks are embedded and added to the index in batches; a batch is also flushed
+# once its buffered text reaches the character ceiling
+EMBED_BATCH_SIZE: int = 256
+EMBED_BATCH_MAX_CHARS: int = 1_000_000
+# Stream files through load -> chunk -> embed instead of loading whole repos into memory
+INGEST_STREAMING: bool = False
 
 VECTORSTORE_DIR: str = "../vectorstores"
 
+# Persistent clone cache: shallow (depth) and blob-filtered clones refreshed with fetch
+CLONE_CACHE_DIR: str = "../repo_cache"
+CLONE_DEPTH: int = 1  # 0 clones the full history
+CLONE_FILTER: str = "blob:none"  # empty string disables partial clone
+CLONE_CACHE_MAX_BYTES: int = 10 * 1024 ** 3  # LRU eviction budget, 0 disables eviction
+
+# Local query classification: the LLM is only asked below this confidence
+CLASSIFIER_CONFIDENCE_THRESHOLD: float = 0.8
+CLASSIFIER_USE_EMBEDDINGS: bool = True
+CLASSIFIER_CACHE_SIZE: int = 1024
+
+# Answer cache keyed on model, normalized query and retrieved chunk IDs
+ANSWER_CACHE_SIZE: int = 512  # 0 disables the cache
+ANSWER_CACHE_TTL_SECONDS: float = 24 * 3600
+# Cosine similarity at which a differently worded query reuses an answer; 0 disables
+ANSWER_CACHE_SIMILARITY: float = 0.0
+# Context sent to the LLM for code questions: merged snippets packed into a token budget
+CONTEXT_TOKEN_BUDGET: int = 3000
+CONTEXT_TOKENIZER: str = "cl100k_base"  # tiktoken encoding used when the model has none of its own
+CONTEXT_MMR_LAMBDA: float = 0.7  # 1.0 ranks by relevance only, lower values favour diversity
+
+# Server mode (python src/server.py); the CLI becomes a client of SERVER_URL when it is set
+SERVER_HOST: str = "127.0.0.1"
+SERVER_PORT: int = 8765
+SERVER_WORKERS: int = 8  # threads running retrieval and LLM calls for concurrent requests
+SERVER_URL: str = ""  # e.g. "http://127.0.0.1:8765"
+
+# Batch mode (python src/batch_qa.py questions.jsonl): concurrent classifier and LLM calls
+BATCH_CONCURRENCY: int = 8
+
+# Per-stage latency histograms, token counts, cache hit rates and index sizes (see metrics.py)
+METRICS_ENABLED: bool = True
+METRICS_TRACE_PATH: str = ""  # JSONL file of finished spans plus a final snapshot; empty disables it
+METRICS_PORT: int = 0  # CLI: serve Prometheus text on http://127.0.0.1:<port>/metrics; 0 disables it
+
+# Print answers token by token in the interactive loop
+STREAM_ANSWERS: bool = True
+
+ANSWER_CACHE_PATH: str = ""  # e.g. "../answer_cache/answers.json"; empty keeps the cache in memory
+
 RETRIEVAL_K: int = 3
-CODE_QUERY_RETRIEVAL_K: int = 12
+CODE_QUERY_RETRIEVAL_K: int = 8
+# Hybrid retrieval: candidates taken from BM25 and from FAISS before reciprocal rank fusion
+HYBRID_CANDIDATES_K: int = 20
+RRF_K: int = 60
+# Threads used to search per-repo indexes in parallel
+FEDERATED_SEARCH_WORKERS: int = 4
+
+# Search index built next to the flat store: "flat", "ivf-flat", "hnsw" or "ivf-pq"
+FAISS_INDEX_TYPE: str = "flat"
+FAISS_NLIST: int = 0  # IVF lists; 0 picks about 4 * sqrt(n)
+FAISS_HNSW_M: int = 32
+FAISS_PQ_M: int = 48  # PQ sub-quantizers; must divide the embedding dimension
+FAISS_TRAIN_SAMPLE: int = 100_000
+FAISS_NPROBE: int = 16
+FAISS_EF_SEARCH: int = 64
+# Search indexes are updated in place and only retrained once vectors added and removed since
+# the last build exceed this fraction of its size
+FAISS_RETRAIN_DRIFT: float = 0.2
+# Memory-map search indexes read-only instead of reading them into RAM
+FAISS_MMAP: bool = True
+
+# Ingestion pipeline concurrency: clones run on threads, load/chunk on processes,
+# and embedding is bounded since the model already uses all cores.
+INGEST_CLONE_WORKERS: int = 4
+INGEST_PREPARE_WORKERS: int = 4
+INGEST_EMBED_WORKERS: int = 1
@@ -0,0 +1,205 @@
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+from langchain_core.embeddings import Embeddings
+
+from config import CHUNK_OVERLAP, CONTEXT_TOKEN_BUDGET, CONTEXT_TOKENIZER, CONTEXT_MMR_LAMBDA, MODEL_NAME
+
+# Blank lines stripped from chunk edges; chunks this close together count as adjacent
+_MAX_LINE_GAP = 2
+# Shortest shared prefix/suffix treated as splitter overlap rather than coincidence
+_MIN_TEXT_OVERLAP = 20
+
+class Snippet(NamedTuple):
+    """
+    A contiguous piece of a file assembled from one or more retrieved chunks.
+    """
+    repo_name: str
+    file_path: str
+    start_line: Optional[int]
+    end_line: Optional[int]
+    symbols: List[str]
+    text: str
+    rank: int  # best MMR rank of the chunks it was built from
+
+@lru_cache(maxsize=1)
+def get_token_counter() -> Callable[[str], int]:
+    """
+    Returns a token counter for the configured model.
+
+    Uses tiktoken with the model's own encoding when it has one and CONTEXT_TOKENIZER
+    otherwise. Without tiktoken (or its encoding files) it falls back to about four
+    characters per token.
+
+    :returns: Function mapping text to its token count.
+    """
+    try:
+        import tiktoken
+        try:
+            encoding = tiktoken.encoding_for_model(MODEL_NAME)
+        except KeyError:
+            encoding = tiktoken.get_encoding(CONTEXT_TOKENIZER)
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    except Exception:
+        return lambda text: (len(text) + 3) // 4
+
+def mmr_order(query: str, docs: Sequence, embeddings: Embeddings, lambda_mult: float = CONTEXT_MMR_LAMBDA,
+              vectors: Optional[np.ndarray] = None) -> List[int]:
+    """
+    Orders retrieved chunks by maximal marginal relevance.
+
+    :param query: User question.
+    :param docs: Retrieved Document objects, best first.
+    :param embeddings: Embedding model used for the index; embeds the query.
+    :param lambda_mult: Relevance/diversity trade-off.
+    :param vectors: Chunk vectors as stored in the index (see FederatedIndex.chunk_vectors);
+        the chunks are embedded again if None.
+    :returns: Indexes into docs, most useful first.
+    """
+    if len(docs) < 2:
+        return list(range(len(docs)))
+    query_vector = np.array(embeddings.embed_query(query), dtype=np.float32)
+    if vectors is None:
+        vectors = embeddings.embed_documents([d.page_content for d in docs])
+    return maximal_marginal_relevance(query_vector, vectors, lambda_mult=lambda_mult, k=len(docs))
+
+def _text_overlap(first: str, second: str) -> int:
+    for size in range(min(len(first), len(second), CHUNK_OVERLAP), _MIN_TEXT_OVERLAP - 1, -1):
+        if first.endswith(second[:size]):
+            return size
+    return 0
+
+def _merge_file(chunks: List[Snippet]) -> List[Snippet]:
+    """
+    Merges chunks of one file that overlap or touch, by line range or by shared text.
+    """
+    with_lines = sorted((c for c in chunks if c.start_line is not None), key=lambda c: c.start_line)
+    without_lines = [c for c in chunks if c.start_line is None]
+
+    merged: List[Snippet] = []
+    for chunk in with_lines:
+        last = merged[-1] if merged else None
+        if last is None or chunk.start_line > last.end_line + 1 + _MAX_LINE_GAP:
+            merged.append(chunk)
+            continue
+        if chunk.end_line <= last.end_line:
+            merged[-1] = last._replace(rank=min(last.rank, chunk.rank))
+            continue
+        lines = chunk.text.splitlines()
+        skip = max(0, last.end_line - chunk.start_line + 1)
+        gap = "\n" * max(0, chunk.start_line - last.end_line - 1)
+        merged[-1] = last._replace(
+            end_line=chunk.end_line,
+            symbols=last.symbols + [s for s in chunk.symbols if s not in last.symbols],
+            text=last.text + "\n" + gap + "\n".join(lines[skip:]),
+            rank=min(last.rank, chunk.rank),
+        )
+
+    for chunk in without_lines:
+        for i, other in enumerate(merged):
+            if chunk.text in other.text:
+                merged[i] = other._replace(rank=min(other.rank, chunk.rank))
+                break
+            if other.start_line is None:
+                if other.text in chunk.text:
+                    merged[i] = chunk._replace(rank=min(other.rank, chunk.rank))
+                    break
+                for head, tail in ((other, chunk), (chunk, other)):
+                    size = _text_overlap(head.text, tail.text)
+                    if size:
+                        merged[i] = head._replace(text=head.text + tail.text[size:], rank=min(head.rank, tail.rank))
+                        break
+                else:
+                    continue
+                break
+        else:
+            merged.append(chunk)
+    return merged
+
+def merge_snippets(docs: Sequence, order: Optional[Sequence[int]] = None) -> List[Snippet]:
+    """
+    Merges overlapping and adjacent chunks of the same file into snippets.
+
+    :param docs: Retrieved Document objects.
+    :param order: Rank of each doc as indexes into docs, e.g. from mmr_order; retrieval order if None.
+    :returns: Snippets ordered by the best rank of their chunks.
+    """
+    order = list(order) if order is not None else list(range(len(docs)))
+    by_file: Dict[tuple, List[Snippet]] = OrderedDict()
+    for rank, i in enumerate(order):
+        meta = docs[i].metadata
+        symbol = meta.get("symbol")
+        chunk = Snippet(meta.get("repo_name", "Unknown Repo"), meta.get("file_path", "unknown"),
+                        meta.get("start_line"), meta.get("end_line"), [symbol] if symbol else [],
+                        docs[i].page_content.strip("\n"), rank)
+        by_file.setdefault((chunk.repo_name, chunk.file_path), []).append(chunk)
+    snippets = [s for chunks in by_file.values() for s in _merge_file(chunks)]
+    return sorted(snippets, key=lambda s: s.rank)
+
+def _header(snippet: Snippet) -> str:
+    header = f"`{snippet.file_path}`"
+    details = []
+    if snippet.start_line is not None:
+        details.append(f"lines {snippet.start_line}-{snippet.end_line}")
+    if snippet.symbols:
+        details.append(", ".join(snippet.symbols))
+    return f"{header} ({'; '.join(details)})" if details else header
+
+def _format(snippet: Snippet, text: Optional[str] = None) -> str:
+    return f"{_header(snippet)}:\n```\n{snippet.text if text is None else text}\n```"
+
+def pack_snippets(snippets: Sequence[Snippet], budget: int = CONTEXT_TOKEN_BUDGET,
+                  count_tokens: Optional[Callable[[str], int]] = None) -> List[Tuple[Snippet, str]]:
+    """
+    Formats snippets in rank order until the token budget is used up.
+
+    Snippets that do not fit are skipped in favour of smaller ones further down; if not
+    even the best snippet fits, it is cut to the budget line by line.
+
+    :param snippets: Snippets ordered best first.
+    :param budget: Maximum tokens of formatted context.
+    :param count_tokens: Token counter; get_token_counter() if None.
+    :returns: List of (snippet, formatted block), best first.
+    """
+    count_tokens = count_tokens or get_token_counter()
+    packed: List[Tuple[Snippet, str]] = []
+    used = 0
+    for snippet in snippets:
+        block = _format(snippet)
+        tokens = count_tokens(block)
+        if used + tokens <= budget:
+            packed.append((snippet, block))
+            used += tokens
+        elif not packed:
+            lines = snippet.text.splitlines()
+            while lines and count_tokens(_format(snippet, "\n".join(lines))) > budget:
+                lines = lines[:len(lines) * 3 // 4]
+            if lines:
+                block = _format(snippet, "\n".join(lines))
+                packed.append((snippet, block))
+                used += count_tokens(block)
+    return packed
+
+def build_context(query: str, docs: Sequence, embeddings: Optional[Embeddings] = None,
+                  budget: int = CONTEXT_TOKEN_BUDGET, count_tokens: Optional[Callable[[str], int]] = None,
+                  vectors: Optional[np.ndarray] = None) -> str:
+    """
+    Assembles the code context for a question: MMR ordering, merging of overlapping and
+    adjacent chunks, and packing of full snippets into a token budget, grouped by repo.
+
+    :param query: User question.
+    :param docs: Retrieved Document objects, best first.
+    :param embeddings: Embedding model for MMR; retrieval order is kept if None.
+    :param budget: Maximum tokens of snippet context.
+    :param count_tokens: Token counter; get_token_counter() if None.
+    :param vectors: Stored chunk vectors for MMR, one row per doc; re-embedded if None.
+    :returns: Context text.
+    """
+    order = mmr_order(query, docs, embeddings, vectors=vectors) if embeddings is not None else None
+    grouped: Dict[str, List[str]] = OrderedDict()
+    for snippet, block in pack_snippets(merge_snippets(docs, order), budget, count_tokens):
+        grouped.setdefault(snippet.repo_name, []).append(block)
+    return "\n\n".join(f"**{repo}**\n\n" + "\n\n".join(blocks) for repo, blocks in grouped.items())
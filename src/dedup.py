@@ -0,0 +1,239 @@
+import re
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from langchain.schema import Document
+
+from config import (
+    DEDUP_THRESHOLD, DEDUP_NUM_PERM, DEDUP_BANDS, DEDUP_SHINGLE_SIZE, DEDUP_MIN_TOKENS
+)
+from metrics import metrics
+
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+class DedupReport(NamedTuple):
+    """
+    How much of a chunk list was collapsed into cluster representatives.
+    """
+    chunks: int
+    kept: int
+    clusters: int  # clusters with at least one duplicate
+    chars: int
+    collapsed_chars: int
+
+    @property
+    def collapsed(self) -> int:
+        return self.chunks - self.kept
+
+    def summary(self) -> str:
+        share = self.collapsed_chars / self.chars * 100 if self.chars else 0.0
+        return (f"collapsed {self.collapsed} of {self.chunks} chunks into {self.clusters} clusters "
+                f"({share:.1f}% of the text)")
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    """
+    splitmix64 finalizer; an independent hash function per seed when applied to value ^ seed.
+    """
+    with np.errstate(over="ignore"):
+        z = values + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+class MinHasher:
+    """
+    MinHash signatures over token shingles.
+
+    Two signatures agree in a fraction of positions that estimates the Jaccard
+    similarity of the texts' shingle sets.
+    """
+
+    def __init__(self, num_perm: int = DEDUP_NUM_PERM, shingle_size: int = DEDUP_SHINGLE_SIZE, seed: int = 1):
+        self.shingle_size = shingle_size
+        self.seeds = _mix(np.arange(seed, seed + num_perm, dtype=np.uint64))
+
+    def tokens(self, text: str) -> List[str]:
+        return _TOKEN.findall(text)
+
+    def signature(self, tokens: List[str]) -> np.ndarray:
+        """
+        :param tokens: Text tokens, see tokens().
+        :returns: uint64 array of length num_perm.
+        """
+        k = min(self.shingle_size, len(tokens)) or 1
+        shingles = {" ".join(tokens[i:i + k]) for i in range(max(len(tokens) - k + 1, 1))}
+        # str hashes are salted per process, which is fine: signatures are only compared within a run
+        hashes = np.fromiter((hash(s) for s in shingles), dtype=np.int64, count=len(shingles)).view(np.uint64)
+        return _mix(hashes[:, None] ^ self.seeds[None, :]).min(axis=0)
+
+def similarity(first: np.ndarray, second: np.ndarray) -> float:
+    """
+    Estimated Jaccard similarity of two MinHash signatures.
+    """
+    return float(np.mean(first == second))
+
+def _location(doc: Document) -> Dict:
+    keys = ("file_path", "start_line", "end_line", "symbol")
+    return {key: doc.metadata[key] for key in keys if doc.metadata.get(key) is not None}
+
+class ChunkClusterer:
+    """
+    Incremental near-duplicate clustering of chunk texts.
+
+    Signatures are split into bands; chunks sharing a band are candidates and are merged
+    if their estimated similarity reaches threshold. Each bucket keeps only chunks that
+    matched none of its members, so a header copied a thousand times costs one comparison
+    per copy. Only signatures are kept, never chunk text.
+    """
+
+    def __init__(self, threshold: float = DEDUP_THRESHOLD, num_perm: int = DEDUP_NUM_PERM,
+                 bands: int = DEDUP_BANDS, shingle_size: int = DEDUP_SHINGLE_SIZE,
+                 min_tokens: int = DEDUP_MIN_TOKENS):
+        """
+        :raises ValueError: If num_perm is not divisible by bands.
+        """
+        if num_perm % bands:
+            raise ValueError(f"DEDUP_NUM_PERM ({num_perm}) must be divisible by DEDUP_BANDS ({bands})")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.min_tokens = min_tokens
+        self.hasher = MinHasher(num_perm, shingle_size)
+        self.count = 0
+        self._signatures: Dict[int, np.ndarray] = {}
+        self._buckets: Dict[Tuple[int, bytes], List[int]] = {}
+
+    def add(self, text: str) -> Optional[int]:
+        """
+        Assigns the next chunk to a cluster.
+
+        :param text: Chunk text.
+        :returns: Position (in order of add calls) of the cluster representative the chunk
+            duplicates, or None if it starts a cluster of its own.
+        """
+        i = self.count
+        self.count += 1
+        tokens = self.hasher.tokens(text)
+        if len(tokens) < self.min_tokens:
+            return None
+        signature = self.hasher.signature(tokens)
+        keys = [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+        for key in keys:
+            for j in self._buckets.get(key, ()):
+                if similarity(signature, self._signatures[j]) >= self.threshold:
+                    return j
+        self._signatures[i] = signature
+        for key in keys:
+            self._buckets.setdefault(key, []).append(i)
+        return None
+
+def find_clusters(chunks: List[Document], threshold: float = DEDUP_THRESHOLD, num_perm: int = DEDUP_NUM_PERM,
+                  bands: int = DEDUP_BANDS, shingle_size: int = DEDUP_SHINGLE_SIZE,
+                  min_tokens: int = DEDUP_MIN_TOKENS) -> List[int]:
+    """
+    Assigns every chunk to a near-duplicate cluster (see ChunkClusterer).
+
+    :param chunks: Chunks in index order.
+    :param threshold: Minimum estimated Jaccard similarity of duplicates.
+    :param num_perm: MinHash signature length.
+    :param bands: LSH bands; num_perm must be divisible by it.
+    :param shingle_size: Tokens per shingle.
+    :param min_tokens: Chunks with fewer tokens form their own cluster.
+    :returns: Index of each chunk's representative (the first chunk of its cluster).
+    :raises ValueError: If num_perm is not divisible by bands.
+    """
+    clusterer = ChunkClusterer(threshold, num_perm, bands, shingle_size, min_tokens)
+    representative = []
+    for i, chunk in enumerate(chunks):
+        match = clusterer.add(chunk.page_content)
+        representative.append(i if match is None else match)
+    return representative
+
+def deduplicate_chunks(chunks: List[Document], threshold: float = DEDUP_THRESHOLD,
+                       num_perm: int = DEDUP_NUM_PERM, bands: int = DEDUP_BANDS) -> Tuple[List[Document], DedupReport]:
+    """
+    Keeps one chunk per near-duplicate cluster before embedding.
+
+    The kept chunk records the other copies' locations (file_path and, when known,
+    start_line, end_line and symbol) in its "duplicates" metadata.
+
+    :param chunks: Chunks from split_documents.
+    :param threshold: Minimum estimated Jaccard similarity of duplicates.
+    :param num_perm: MinHash signature length.
+    :param bands: LSH bands.
+    :returns: Tuple of (kept chunks in their original order, DedupReport).
+    """
+    with metrics.span("dedup") as span:
+        representative = find_clusters(chunks, threshold, num_perm, bands)
+        kept: List[Document] = []
+        collapsed_chars = 0
+        clusters = set()
+        for i, chunk in enumerate(chunks):
+            if representative[i] == i:
+                kept.append(chunk)
+                continue
+            rep = chunks[representative[i]]
+            rep.metadata.setdefault("duplicates", []).append(_location(chunk))
+            collapsed_chars += len(chunk.page_content)
+            clusters.add(representative[i])
+        report = DedupReport(len(chunks), len(kept), len(clusters),
+                             sum(len(c.page_content) for c in chunks), collapsed_chars)
+        span.update(chunks=report.chunks, kept=report.kept, clusters=report.clusters)
+    metrics.inc("rag_dedup_chunks_collapsed_total", report.collapsed)
+    return kept, report
+
+class StreamDeduplicator:
+    """
+    Collapses near-duplicate chunks of a stream before embedding, in bounded memory.
+
+    Representatives are passed on as they arrive, so a duplicate may only be found after
+    its representative was embedded and stored. The copies' locations are therefore
+    collected on the side and attached with representatives() once the stream is
+    exhausted; the caller writes them back to the stored metadata. Per kept chunk only
+    its signature and metadata dict are held, never its text.
+    """
+
+    def __init__(self, threshold: float = DEDUP_THRESHOLD, num_perm: int = DEDUP_NUM_PERM,
+                 bands: int = DEDUP_BANDS):
+        self._clusterer = ChunkClusterer(threshold, num_perm, bands)
+        self._metadata: Dict[int, Dict] = {}
+        self._duplicates: Dict[int, List[Dict]] = {}
+        self.chunks = 0
+        self.chars = 0
+        self.collapsed_chars = 0
+
+    def filter(self, chunks: Iterable[Document]) -> Iterator[Document]:
+        """
+        Yields the chunks that are not near-duplicates of an earlier chunk of the stream.
+
+        :param chunks: Chunks, e.g. from iter_chunks.
+        :returns: Iterator of kept chunks, in stream order.
+        """
+        for chunk in chunks:
+            position = self._clusterer.count
+            match = self._clusterer.add(chunk.page_content)
+            self.chunks += 1
+            self.chars += len(chunk.page_content)
+            if match is None:
+                self._metadata[position] = chunk.metadata
+                yield chunk
+            else:
+                self._duplicates.setdefault(match, []).append(_location(chunk))
+                self.collapsed_chars += len(chunk.page_content)
+
+    def finish(self) -> Tuple[List[Dict], DedupReport]:
+        """
+        Adds the collected "duplicates" to the metadata of the representatives that have any.
+
+        :returns: Tuple of (updated metadata dicts, which are the same objects the yielded
+            chunks carry, DedupReport).
+        """
+        updated = []
+        for position, locations in self._duplicates.items():
+            metadata = self._metadata[position]
+            metadata.setdefault("duplicates", []).extend(locations)
+            updated.append(metadata)
+        report = DedupReport(self.chunks, len(self._metadata), len(self._duplicates), self.chars,
+                             self.collapsed_chars)
+        metrics.inc("rag_dedup_chunks_collapsed_total", report.collapsed)
+        return updated, report
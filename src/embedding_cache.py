@@ -0,0 +1,141 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from config import EMBEDDING_CACHE_MAX_ENTRIES
+from metrics import metrics
+
+class CachedEmbeddings(Embeddings):
+    """
+    Content-addressed, SQLite-backed cache in front of an embedding model.
+
+    Vectors are keyed by (model name, SHA-256 of the chunk text), so identical chunks in
+    forks, vendored copies or re-chunked repos are embedded only once across all repos.
+    The least recently used entries are evicted beyond max_entries; the entry count is
+    kept in a meta row updated with every insert and eviction, so no batch has to count
+    the table.
+    """
+
+    def __init__(self, inner: Embeddings, model_name: str, path: str,
+                 max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self.inner = inner
+        self.model_name = model_name
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, last_used REAL NOT NULL, "
+            "PRIMARY KEY (model, text_hash))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        # Caches created before the entry count was tracked are counted once
+        self._conn.execute("INSERT OR IGNORE INTO meta (key, value) SELECT 'entries', COUNT(*) FROM embeddings")
+        self._conn.commit()
+
+    @staticmethod
+    def _hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _lookup(self, hashes: List[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        unique = list(dict.fromkeys(hashes))
+        # Stay well below SQLite's bound-parameter limit
+        for start in range(0, len(unique), 500):
+            batch = unique[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn.execute(
+                f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                [self.model_name, *batch],
+            ).fetchall()
+            for text_hash, blob in rows:
+                found[text_hash] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def _entries(self) -> int:
+        return self._conn.execute("SELECT value FROM meta WHERE key = 'entries'").fetchone()[0]
+
+    def _count_entries(self, delta: int) -> None:
+        self._conn.execute("UPDATE meta SET value = value + ? WHERE key = 'entries'", (delta,))
+
+    def _evict(self) -> None:
+        excess = self._entries() - self.max_entries
+        if self.max_entries and excess > 0:
+            deleted = self._conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN "
+                "(SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                (excess,),
+            ).rowcount
+            self._count_entries(-deleted)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [self._hash(text) for text in texts]
+        with self._lock:
+            found = self._lookup(hashes)
+
+        missing = {h: text for h, text in zip(hashes, texts) if h not in found}
+        metrics.inc("rag_embedding_cache_requests_total", len(texts) - len(missing), result="hit")
+        metrics.inc("rag_embedding_cache_requests_total", len(missing), result="miss")
+        if missing:
+            vectors = self.inner.embed_documents(list(missing.values()))
+            # Round through float32 so a miss returns exactly what a later hit will
+            computed = {h: np.asarray(v, dtype=np.float32).tolist() for h, v in zip(missing.keys(), vectors)}
+        else:
+            computed = {}
+
+        now = time.time()
+        with self._lock:
+            self.hits += len(texts) - sum(1 for h in hashes if h in missing)
+            self.misses += sum(1 for h in hashes if h in missing)
+            self._conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                [(now, self.model_name, h) for h in found],
+            )
+            # Rows another process added meanwhile hold the same vector and are kept
+            inserted = self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                [(self.model_name, h, np.asarray(v, dtype=np.float32).tobytes(), now) for h, v in computed.items()],
+            ).rowcount
+            if inserted > 0:
+                self._count_entries(inserted)
+                self._evict()
+            self._conn.commit()
+
+        return [found[h] if h in found else computed[h] for h in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        # Queries are rarely repeated verbatim and sit on the latency-critical path
+        return self.inner.embed_query(text)
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Returns hit/miss counters and the current number of cached vectors.
+
+        :returns: Dict with hits, misses, hit_rate and entries.
+        """
+        with self._lock:
+            entries = self._entries()
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": entries,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
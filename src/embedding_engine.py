@@ -0,0 +1,225 @@
+import atexit
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from embedding_cache import CachedEmbeddings
+from metrics import metrics
+from config import (
+    EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND, EMBEDDING_BATCH_SIZE, EMBEDDING_WORKERS, EMBEDDING_POOL_MIN_TEXTS,
+    EMBEDDING_CACHE_PATH, QUERY_BATCH_WINDOW_MS, QUERY_BATCH_MAX
+)
+
+# Quantized ONNX export shipped with the sentence-transformers MiniLM checkpoints
+ONNX_INT8_FILE = "onnx/model_qint8_avx512_vnni.onnx"
+
+_embedding_instance = None
+_instance_lock = threading.Lock()
+
+def _load_model(model_name: str, backend: str):
+    """
+    Loads the SentenceTransformer model for the given backend.
+
+    :param model_name: Hugging Face model name.
+    :param backend: "torch" (fp32), "torch-int8" (dynamic int8 quantization) or "onnx-int8".
+    :returns: SentenceTransformer instance on CPU.
+    :raises ValueError: If backend is unsupported.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "torch":
+        return SentenceTransformer(model_name, device="cpu")
+    if backend == "torch-int8":
+        import torch
+        model = SentenceTransformer(model_name, device="cpu")
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if backend == "onnx-int8":
+        return SentenceTransformer(model_name, device="cpu", backend="onnx",
+                                   model_kwargs={"file_name": ONNX_INT8_FILE})
+    raise ValueError(f"Unsupported EMBEDDING_BACKEND: {backend}")
+
+class EmbeddingEngine(Embeddings):
+    """
+    Process-wide sentence embedding engine.
+
+    The model is loaded once on first use. Texts are sorted by token length and encoded in
+    fixed-size batches so each batch pads to similar lengths, and large jobs are spread
+    over a pool of CPU worker processes.
+    """
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL_NAME, backend: str = EMBEDDING_BACKEND,
+                 batch_size: int = EMBEDDING_BATCH_SIZE, workers: int = EMBEDDING_WORKERS,
+                 pool_min_texts: int = EMBEDDING_POOL_MIN_TEXTS, model=None):
+        self.model_name = model_name
+        self.backend = backend
+        self.batch_size = batch_size
+        self.workers = workers
+        self.pool_min_texts = pool_min_texts
+        self._model = model
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = _load_model(self.model_name, self.backend)
+        return self._model
+
+    def _token_lengths(self, texts: Sequence[str]) -> List[int]:
+        tokenizer = getattr(self.model, "tokenizer", None)
+        if tokenizer is None:
+            return [len(text) for text in texts]
+        max_length = getattr(self.model, "max_seq_length", None) or 512
+        encoded = tokenizer(list(texts), add_special_tokens=False, truncation=True, max_length=max_length)["input_ids"]
+        return [len(ids) for ids in encoded]
+
+    def _encode_pool(self, texts: List[str]) -> np.ndarray:
+        with self._lock:
+            if self._pool is None:
+                self._pool = self.model.start_multi_process_pool(["cpu"] * self.workers)
+                atexit.register(self.close)
+        return self.model.encode_multi_process(texts, self._pool, batch_size=self.batch_size)
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        Encodes texts with length-bucketed batching.
+
+        :param texts: Texts to embed.
+        :returns: Array of shape (len(texts), dim), in input order.
+        """
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        order = np.argsort(self._token_lengths(texts), kind="stable")
+        sorted_texts = [texts[i] for i in order]
+
+        if self.workers > 1 and len(texts) >= self.pool_min_texts:
+            sorted_vectors = self._encode_pool(sorted_texts)
+        else:
+            batches = [
+                self.model.encode(sorted_texts[start:start + self.batch_size], batch_size=self.batch_size)
+                for start in range(0, len(sorted_texts), self.batch_size)
+            ]
+            sorted_vectors = np.vstack(batches)
+
+        vectors = np.empty_like(sorted_vectors)
+        vectors[order] = sorted_vectors
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with metrics.span("embed") as span:
+            span["texts"] = len(texts)
+            vectors = self.encode(texts).tolist()
+        metrics.inc("rag_embedded_texts_total", len(texts))
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        with metrics.span("embed_query"):
+            return self.encode([text])[0].tolist()
+
+    def close(self) -> None:
+        """
+        Stops the multi-process worker pool, if one was started.
+        """
+        with self._lock:
+            if self._pool is not None:
+                self.model.stop_multi_process_pool(self._pool)
+                self._pool = None
+
+def get_embedding_model() -> Embeddings:
+    """
+    Singleton factory to get the shared embedding engine.
+
+    :returns: EmbeddingEngine configured from config.py, behind the persistent
+        embedding cache when EMBEDDING_CACHE_PATH is set.
+    """
+    global _embedding_instance
+    if _embedding_instance is None:
+        with _instance_lock:
+            if _embedding_instance is None:
+                engine = EmbeddingEngine()
+                if EMBEDDING_CACHE_PATH:
+                    # The backend is part of the key, since quantized vectors differ from fp32 ones
+                    engine = CachedEmbeddings(engine, f"{engine.model_name}:{engine.backend}", EMBEDDING_CACHE_PATH)
+                _embedding_instance = engine
+    return _embedding_instance
+
+class QueryBatcher(Embeddings):
+    """
+    Coalesces concurrent embed_query calls into batched embed_documents calls.
+
+    Each caller blocks until its vector is ready. A background thread takes the first
+    waiting query, gathers more for up to window_ms (or until max_batch), and encodes
+    them together, so concurrent requests share one forward pass.
+    """
+
+    def __init__(self, inner: Embeddings, window_ms: float = QUERY_BATCH_WINDOW_MS, max_batch: int = QUERY_BATCH_MAX):
+        self.inner = inner
+        self.window_ms = window_ms
+        self.max_batch = max_batch
+        self.batches = 0
+        self._queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="query-batcher", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window_ms / 1000
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self.batches += 1
+            try:
+                # Unwrap CachedEmbeddings: queries bypass the chunk cache, as in CachedEmbeddings.embed_query
+                vectors = getattr(self.inner, "inner", self.inner).embed_documents([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(list(vector))
+
+    def embed_query(self, text: str) -> List[float]:
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future.result()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.inner.embed_documents(texts)
+
+def _top_k(corpus: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    corpus = corpus / np.linalg.norm(corpus, axis=1, keepdims=True)
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    scores = queries @ corpus.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+def quantization_recall(corpus: List[str], queries: List[str], candidate: Embeddings,
+                        reference: Optional[Embeddings] = None, k: int = 10) -> float:
+    """
+    Measures how well a quantized backend preserves the fp32 model's nearest neighbours.
+
+    :param corpus: Texts to search over, e.g. a sample of repo chunks.
+    :param queries: Sample queries.
+    :param candidate: Embeddings under test, e.g. EmbeddingEngine(backend="onnx-int8").
+    :param reference: fp32 reference embeddings; defaults to an fp32 EmbeddingEngine.
+    :param k: Number of neighbours compared per query.
+    :returns: Mean recall@k of the candidate's top-k against the reference's top-k.
+    """
+    reference = reference or EmbeddingEngine(backend="torch")
+    k = min(k, len(corpus))
+    expected = _top_k(np.array(reference.embed_documents(corpus)), np.array(reference.embed_documents(queries)), k)
+    actual = _top_k(np.array(candidate.embed_documents(corpus)), np.array(candidate.embed_documents(queries)), k)
+    hits = [len(set(e) & set(a)) / k for e, a in zip(expected, actual)]
+    return float(np.mean(hits))
@@ -0,0 +1,243 @@
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+
+from lexical_index import reciprocal_rank_fusion
+from retriever import stored_vectors, vector_search_many
+from search_filter import MetadataIndex, SearchFilter
+from vector_store import RepoIndex
+from config import CODE_QUERY_RETRIEVAL_K, HYBRID_CANDIDATES_K, RRF_K, FEDERATED_SEARCH_WORKERS
+from metrics import metrics
+
+# A hit is identified by (repo_name, docstore ID), so IDs never clash across repos
+Hit = Tuple[str, str]
+# One repo's (vector hits, lexical hits) for a query
+RepoHits = Tuple[List[Tuple[float, Hit]], List[Tuple[float, Hit]]]
+
+class FederatedIndex:
+    """
+    Searches several per-repo indexes in parallel without merging them.
+
+    Each repo keeps its own FAISS store and lexical index, so repos can be added or
+    dropped at runtime and the in-memory indexes stay identical to the ones on disk.
+    Per-repo candidates are merged into global top-k lists with a heap and then fused
+    with reciprocal rank fusion. Metadata filters are applied inside each repo's FAISS and
+    BM25 search using bitmaps from a per-repo MetadataIndex, built on the first filtered
+    search of the repo.
+    """
+
+    def __init__(self, repo_indexes: Iterable[RepoIndex] = (), max_workers: int = FEDERATED_SEARCH_WORKERS,
+                 query_embeddings: Optional[Embeddings] = None):
+        self.query_embeddings = query_embeddings
+        self._repos: Dict[str, RepoIndex] = {}
+        self._metadata: Dict[str, MetadataIndex] = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="federated-search")
+        for repo_index in repo_indexes:
+            self.add(repo_index)
+
+    @property
+    def repo_names(self) -> List[str]:
+        with self._lock:
+            return list(self._repos)
+
+    def add(self, repo_index: RepoIndex) -> None:
+        """
+        Adds a repo, replacing any index already registered under the same name.
+
+        :param repo_index: RepoIndex to search.
+        """
+        with self._lock:
+            self._repos[repo_index.repo_name] = repo_index
+            self._metadata.pop(repo_index.repo_name, None)
+
+    def remove(self, repo_name: str) -> bool:
+        """
+        Drops a repo from the search.
+
+        :param repo_name: Repository name.
+        :returns: True if the repo was registered.
+        """
+        with self._lock:
+            self._metadata.pop(repo_name, None)
+            return self._repos.pop(repo_name, None) is not None
+
+    def _select(self, repos: Optional[Sequence[str]]) -> List[RepoIndex]:
+        with self._lock:
+            if repos is None:
+                return list(self._repos.values())
+            unknown = [name for name in repos if name not in self._repos]
+            if unknown:
+                raise ValueError(f"Unknown repos: {', '.join(unknown)}")
+            return [self._repos[name] for name in repos]
+
+    def metadata_index(self, repo: RepoIndex) -> MetadataIndex:
+        """
+        Returns the repo's MetadataIndex, building it on first use.
+
+        :param repo: Registered RepoIndex.
+        :returns: MetadataIndex over the repo's vector store.
+        """
+        with self._lock:
+            metadata = self._metadata.get(repo.repo_name)
+        if metadata is None:
+            metadata = MetadataIndex.from_store(repo.vectorstore)
+            with self._lock:
+                if self._repos.get(repo.repo_name) is repo:
+                    self._metadata[repo.repo_name] = metadata
+        return metadata
+
+    def _search_repo(self, repo: RepoIndex, queries: Sequence[str], vectors: Sequence[Sequence[float]],
+                     candidates_k: int, filters: Optional[SearchFilter] = None) -> List[RepoHits]:
+        """
+        Searches one repo for every query, with one vectorized FAISS call.
+
+        :returns: One (vector hits, lexical hits) pair per query.
+        """
+        mask, allowed = None, None
+        if filters:
+            metadata = self.metadata_index(repo)
+            mask = metadata.mask(filters)
+            if not mask.any():
+                return [([], []) for _ in queries]
+            allowed = metadata.allowed_ids(filters)
+        vector_results = vector_search_many(repo.vectorstore, vectors, candidates_k, mask)
+        results = []
+        for query, vector_result in zip(queries, vector_results):
+            vector_hits = [(distance, (repo.repo_name, doc_id)) for doc_id, distance in vector_result]
+            with metrics.span("lexical_search"):
+                lexical_hits = [(score, (repo.repo_name, doc_id))
+                                for doc_id, score in repo.lexical_index.search(query, candidates_k, allowed)]
+            results.append((vector_hits, lexical_hits))
+        return results
+
+    def search(self, query: str, k: int = CODE_QUERY_RETRIEVAL_K, repos: Optional[Sequence[str]] = None,
+               candidates_k: int = HYBRID_CANDIDATES_K, filters: Optional[SearchFilter] = None) -> List[Document]:
+        """
+        Runs hybrid search over the selected repos in parallel.
+
+        :param query: Query text.
+        :param k: Number of documents to return.
+        :param repos: Repo names to restrict the search to; all repos if None.
+        :param candidates_k: Candidates per repo and per retriever before merging.
+        :param filters: Optional path, language and symbol restrictions applied inside the search.
+        :returns: List of Document objects, best first.
+        :raises ValueError: If no repos are registered or an unknown repo is requested.
+        """
+        selected = self._select(repos)
+        if not selected:
+            raise ValueError("No vectorstores available!")
+        with metrics.span("search") as span:
+            span["repos"] = len(selected)
+            span["filtered"] = bool(filters)
+            return self._search(selected, query, k, candidates_k, filters)
+
+    def _search(self, selected: List[RepoIndex], query: str, k: int, candidates_k: int,
+                filters: Optional[SearchFilter] = None) -> List[Document]:
+
+        # All repos share the embedding model, so the query is embedded once
+        if self.query_embeddings is not None:
+            vector = self.query_embeddings.embed_query(query)
+        else:
+            vector = selected[0].vectorstore._embed_query(query)
+        results = self._pool.map(lambda r: self._search_repo(r, [query], [vector], candidates_k, filters)[0], selected)
+        return self._fuse(selected, list(results), k, candidates_k)
+
+    def embed_queries(self, queries: Sequence[str], repos: Optional[Sequence[str]] = None) -> List[List[float]]:
+        """
+        Embeds many queries in one batch, bypassing QueryBatcher and the chunk embedding cache.
+
+        :param queries: Query texts.
+        :param repos: Repos whose store's embedding model is used if there is no query_embeddings.
+        :returns: One vector per query.
+        :raises ValueError: If no repos are registered.
+        """
+        selected = self._select(repos)
+        if not selected and self.query_embeddings is None:
+            raise ValueError("No vectorstores available!")
+        model = self.query_embeddings if self.query_embeddings is not None else selected[0].vectorstore.embeddings
+        # QueryBatcher and CachedEmbeddings wrap the engine as `inner`
+        while hasattr(model, "inner"):
+            model = model.inner
+        return model.embed_documents(list(queries))
+
+    def search_many(self, queries: Sequence[str], k: int = CODE_QUERY_RETRIEVAL_K,
+                    repos: Optional[Sequence[str]] = None, candidates_k: int = HYBRID_CANDIDATES_K,
+                    filters: Optional[SearchFilter] = None,
+                    vectors: Optional[Sequence[Sequence[float]]] = None) -> List[List[Document]]:
+        """
+        Runs hybrid search for many queries, with one FAISS search per repo for all of them.
+
+        :param queries: Query texts.
+        :param k: Number of documents per query.
+        :param repos: Repo names to restrict the search to; all repos if None.
+        :param candidates_k: Candidates per repo and per retriever before merging.
+        :param filters: Optional path, language and symbol restrictions shared by all queries.
+        :param vectors: Precomputed query embeddings (see embed_queries); embedded in one batch if None.
+        :returns: One list of Document objects per query, best first.
+        :raises ValueError: If no repos are registered or an unknown repo is requested.
+        """
+        selected = self._select(repos)
+        if not selected:
+            raise ValueError("No vectorstores available!")
+        if not queries:
+            return []
+        with metrics.span("search_many") as span:
+            span.update(repos=len(selected), queries=len(queries), filtered=bool(filters))
+            if vectors is None:
+                vectors = self.embed_queries(queries, repos)
+            per_repo = list(self._pool.map(
+                lambda r: self._search_repo(r, queries, vectors, candidates_k, filters), selected
+            ))
+            return [self._fuse(selected, [hits[i] for hits in per_repo], k, candidates_k)
+                    for i in range(len(queries))]
+
+    @staticmethod
+    def _fuse(selected: List[RepoIndex], results: List[RepoHits], k: int, candidates_k: int) -> List[Document]:
+        """
+        Merges one query's per-repo hits into global top-k lists and fuses them.
+        """
+        nearest = heapq.nsmallest(candidates_k, (hit for vector_hits, _ in results for hit in vector_hits))
+        best_lexical = heapq.nlargest(candidates_k, (hit for _, lexical_hits in results for hit in lexical_hits))
+        fused = reciprocal_rank_fusion([[hit for _, hit in best_lexical], [hit for _, hit in nearest]], k=RRF_K)
+
+        by_name = {repo.repo_name: repo for repo in selected}
+        docs: List[Document] = []
+        for (repo_name, doc_id), _ in fused[:k]:
+            doc = by_name[repo_name].vectorstore.docstore.search(doc_id)
+            if isinstance(doc, Document):
+                docs.append(doc)
+        return docs
+
+    def chunk_vectors(self, docs: Sequence[Document]) -> Optional[np.ndarray]:
+        """
+        Returns the indexed vectors of retrieved chunks, read back from their repos' FAISS indexes.
+
+        :param docs: Documents returned by search, with "repo_name" and "doc_id" metadata.
+        :returns: Array with one row per doc, or None if any doc is not in a registered repo.
+        """
+        with self._lock:
+            repos = dict(self._repos)
+        members: Dict[str, List[int]] = {}
+        for i, doc in enumerate(docs):
+            members.setdefault(doc.metadata.get("repo_name"), []).append(i)
+        rows: List[Optional[np.ndarray]] = [None] * len(docs)
+        for repo_name, positions in members.items():
+            repo = repos.get(repo_name)
+            doc_ids = [docs[i].metadata.get("doc_id") for i in positions]
+            if repo is None or None in doc_ids:
+                return None
+            vectors = stored_vectors(repo.vectorstore, doc_ids)
+            if vectors is None:
+                return None
+            for i, vector in zip(positions, vectors):
+                rows[i] = vector
+        return np.vstack(rows) if rows else None
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False)
@@ -0,0 +1,50 @@
+import hashlib
+import json
+import os
+from typing import Dict, Optional
+
+MANIFEST_FILENAME = "manifest.json"
+
+def hash_content(content: str) -> str:
+    """
+    Computes the content hash used to detect changed files.
+
+    :param content: File content.
+    :returns: Hex SHA-256 digest of the content.
+    """
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+def load_manifest(db_path: str) -> Optional[Dict]:
+    """
+    Loads the index manifest stored next to a vector store.
+
+    The manifest has the shape
+    ``{"commit": sha, "files": {relative_path: {"hash": digest, "ids": [doc_id, ...]}}}``.
+
+    :param db_path: Directory of the repo's vector store.
+    :returns: Manifest dict, or None if the store has no (readable) manifest.
+    """
+    path = os.path.join(db_path, MANIFEST_FILENAME)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    manifest.setdefault("files", {})
+    return manifest
+
+def save_manifest(db_path: str, manifest: Dict) -> None:
+    """
+    Atomically writes the index manifest next to a vector store.
+
+    :param db_path: Directory of the repo's vector store.
+    :param manifest: Manifest dict to persist.
+    """
+    os.makedirs(db_path, exist_ok=True)
+    path = os.path.join(db_path, MANIFEST_FILENAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
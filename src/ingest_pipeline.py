@@ -0,0 +1,163 @@
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, Executor, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from clone_repo import clone_repo, get_head_commit
+from load_code_documents import iter_code_documents, load_code_documents
+from metrics import metrics
+from vector_store import (
+    IndexUpdate, RepoIndex, apply_update, is_index_current, load_repo_index, prepare_update,
+    stream_vector_store
+)
+from config import (
+    CLONE_CACHE_DIR, INGEST_CLONE_WORKERS, INGEST_PREPARE_WORKERS, INGEST_EMBED_WORKERS, INGEST_STREAMING, VECTORSTORE_DIR
+)
+
+def prepare_repo(repo_name: str, repo_path: str, db_dir: str = VECTORSTORE_DIR) -> Optional[IndexUpdate]:
+    """
+    Loads and chunks a cloned repo's changed files. Runs in a worker process.
+
+    :param repo_name: Repository name.
+    :param repo_path: Local path to the cloned repository.
+    :param db_dir: Directory to store vector stores.
+    :returns: IndexUpdate to embed, or None if the store is already at the checked-out commit.
+    """
+    commit = get_head_commit(repo_path)
+    if is_index_current(repo_name, commit, db_dir):
+        return None
+    docs = load_code_documents(repo_name, repo_path)
+    return prepare_update(docs, repo_name, repo_path, commit, db_dir)
+
+def _prepare_in_worker(repo_name: str, repo_path: str, db_dir: str,
+                       metrics_enabled: bool) -> Tuple[Optional[IndexUpdate], Dict[str, Any]]:
+    """
+    Runs prepare_repo in a worker process and returns the metrics it recorded with its result,
+    since the worker's registry is not the parent's.
+    """
+    metrics.enabled = metrics_enabled
+    metrics.reset()
+    try:
+        return prepare_repo(repo_name, repo_path, db_dir), metrics.export()
+    finally:
+        metrics.reset()
+
+def embed_repo(repo_name: str, update: Optional[IndexUpdate], db_dir: str = VECTORSTORE_DIR) -> RepoIndex:
+    """
+    Embeds a prepared update into the repo's vector store, or loads the store if it is current.
+
+    :param repo_name: Repository name.
+    :param update: IndexUpdate from prepare_repo, or None.
+    :param db_dir: Directory to store vector stores.
+    :returns: RepoIndex with the vector store and lexical index.
+    """
+    if update is not None:
+        apply_update(update, db_dir)
+    # Reload read-only so searches use the (memory-mapped) search index
+    return load_repo_index(repo_name, db_dir=db_dir)
+
+def stream_repo(repo_name: str, repo_path: str, db_dir: str = VECTORSTORE_DIR) -> RepoIndex:
+    """
+    Streams a cloned repo's files through chunking and batched embedding in bounded memory.
+
+    :param repo_name: Repository name.
+    :param repo_path: Local path to the cloned repository.
+    :param db_dir: Directory to store vector stores.
+    :returns: RepoIndex with the vector store and lexical index.
+    """
+    commit = get_head_commit(repo_path)
+    if is_index_current(repo_name, commit, db_dir):
+        return load_repo_index(repo_name, db_dir=db_dir)
+    stream_vector_store(iter_code_documents(repo_name, repo_path), repo_name, repo_path, commit, db_dir)
+    return load_repo_index(repo_name, db_dir=db_dir)
+
+def ingest_repositories(repo_urls: List[str],
+                        clone_workers: int = INGEST_CLONE_WORKERS,
+                        prepare_workers: int = INGEST_PREPARE_WORKERS,
+                        embed_workers: int = INGEST_EMBED_WORKERS,
+                        db_dir: str = VECTORSTORE_DIR,
+                        use_processes: bool = True,
+                        streaming: bool = INGEST_STREAMING,
+                        clone_cache_dir: str = CLONE_CACHE_DIR,
+                        progress: Callable[[str], None] = print) -> List[RepoIndex]:
+    """
+    Clones, prepares and embeds repos as a pipeline, overlapping the stages across repos.
+
+    Clones run on a thread pool, load/chunk on a process pool and embedding on a small
+    bounded pool, so a repo is embedded while the next ones are still being cloned or chunked.
+    A repo that fails in any stage is reported through progress, counted in
+    rag_ingest_failures_total and left out of the result; the other repos carry on.
+    Metrics recorded in load/chunk worker processes (e.g. the load and split spans) are
+    merged into the parent's registry when each repo's prepare stage finishes; those of
+    a failed worker are lost.
+
+    :param repo_urls: List of Git repository URLs.
+    :param clone_workers: Maximum concurrent clones.
+    :param prepare_workers: Maximum concurrent load/chunk workers.
+    :param embed_workers: Maximum concurrent embedding jobs.
+    :param db_dir: Directory to store vector stores.
+    :param use_processes: Run load/chunk in processes; threads are used when False.
+    :param streaming: Skip the load/chunk stage and stream each repo through the embed stage
+        with stream_repo, keeping memory bounded for very large repos.
+    :param clone_cache_dir: Clone cache directory.
+    :param progress: Callback receiving per-repo progress messages.
+    :returns: List of RepoIndex (vector store and lexical index) of the repos that were
+        indexed, in the order of repo_urls.
+    """
+    total = len(repo_urls)
+    results: List[Optional[RepoIndex]] = [None] * total
+    names: Dict[int, str] = {}
+    started: Dict[int, float] = {}
+    done = 0
+
+    if use_processes:
+        # Spawn rather than fork: the CLI may still be importing torch on its warm-up thread,
+        # and forking mid-import can leave the workers with a half-initialized module
+        prepare_pool: Executor = ProcessPoolExecutor(max_workers=max(1, prepare_workers),
+                                                     mp_context=multiprocessing.get_context("spawn"))
+    else:
+        prepare_pool = ThreadPoolExecutor(max_workers=max(1, prepare_workers))
+    with ThreadPoolExecutor(max_workers=max(1, clone_workers)) as clone_pool, prepare_pool, \
+            ThreadPoolExecutor(max_workers=max(1, embed_workers)) as embed_pool:
+        pending: Dict[object, Tuple[str, int]] = {}
+        for i, url in enumerate(repo_urls):
+            started[i] = time.perf_counter()
+            pending[clone_pool.submit(clone_repo, url, clone_cache_dir)] = ("clone", i)
+
+        while pending:
+            finished, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, i = pending.pop(future)
+                elapsed = time.perf_counter() - started[i]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    done += 1
+                    metrics.inc("rag_ingest_failures_total", stage=stage)
+                    progress(f"[{names.get(i, repo_urls[i])}] failed to {stage}: {e} ({elapsed:.1f}s) [{done}/{total}]")
+                    continue
+
+                if stage == "clone":
+                    repo_name, repo_path = result
+                    names[i] = repo_name
+                    progress(f"[{repo_name}] cloned ({elapsed:.1f}s)")
+                    if streaming:
+                        pending[embed_pool.submit(stream_repo, repo_name, repo_path, db_dir)] = ("embed", i)
+                    elif use_processes:
+                        pending[prepare_pool.submit(_prepare_in_worker, repo_name, repo_path, db_dir,
+                                                    metrics.enabled)] = ("prepare", i)
+                    else:
+                        pending[prepare_pool.submit(prepare_repo, repo_name, repo_path, db_dir)] = ("prepare", i)
+                elif stage == "prepare":
+                    if use_processes:
+                        result, worker_metrics = result
+                        metrics.merge(worker_metrics)
+                    status = "up to date" if result is None else f"{len(result.chunks)} chunks to embed"
+                    progress(f"[{names[i]}] prepared, {status} ({elapsed:.1f}s)")
+                    pending[embed_pool.submit(embed_repo, names[i], result, db_dir)] = ("embed", i)
+                else:
+                    results[i] = result
+                    done += 1
+                    progress(f"[{names[i]}] indexed ({elapsed:.1f}s) [{done}/{total}]")
+
+    return [result for result in results if result is not None]
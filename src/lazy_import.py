@@ -0,0 +1,50 @@
+import importlib
+import threading
+from typing import Any, Callable, Iterable
+
+def lazy_callable(module: str, name: str) -> Callable[..., Any]:
+    """
+    Returns a stand-in for module.name that imports the module on its first call.
+
+    Lets entry points such as cli keep `name` as a module attribute (and a patch point in
+    tests) without paying for langchain, faiss or torch imports at startup.
+
+    :param module: Module to import, e.g. "federated_search".
+    :param name: Function or class in that module.
+    :returns: Callable forwarding to module.name.
+    """
+    target = None
+
+    def call(*args: Any, **kwargs: Any) -> Any:
+        nonlocal target
+        if target is None:
+            target = getattr(importlib.import_module(module), name)
+        return target(*args, **kwargs)
+
+    call.__name__ = call.__qualname__ = name
+    call.__doc__ = f"Imports {module} on first use and calls {module}.{name}."
+    return call
+
+def warm_up(modules: Iterable[str], initializers: Iterable[Callable[[], Any]] = ()) -> threading.Thread:
+    """
+    Imports modules and runs initializers (e.g. model loaders) in a background thread.
+
+    Meant to overlap slow startup work with user input. Errors are ignored here; they
+    surface with a proper traceback when the main thread needs the failing component.
+
+    :param modules: Module names to import.
+    :param initializers: Callables run after the imports, in order.
+    :returns: The started daemon thread.
+    """
+    def run() -> None:
+        try:
+            for module in modules:
+                importlib.import_module(module)
+            for initializer in initializers:
+                initializer()
+        except Exception:
+            pass
+
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,430 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from typing import AbstractSet, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+LEXICAL_FILENAME = "lexical.sqlite3"
+# Terms whose BM25 weights a SQLiteLexicalIndex keeps in memory
+WEIGHT_CACHE_TERMS = 4096
+
+_SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value);
+CREATE TABLE docs (position INTEGER PRIMARY KEY, doc_id TEXT NOT NULL, length INTEGER NOT NULL);
+CREATE INDEX docs_doc_id ON docs (doc_id);
+CREATE TABLE postings (term TEXT PRIMARY KEY, positions BLOB NOT NULL, tfs BLOB NOT NULL, lengths BLOB NOT NULL);
+"""
+
+_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+_CAMEL_PART = re.compile(r"[A-Z]+(?=[A-Z][a-z]|\d|\b)|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+def tokenize(text: str) -> List[str]:
+    """
+    Tokenizes code and questions with identifier-aware splitting.
+
+    Each identifier yields its full lowercased form (so exact names such as ``merge_from``
+    match) plus its snake_case and camelCase parts (so ``merge`` and ``from`` match too).
+
+    :param text: Code or query text.
+    :returns: List of lowercased terms.
+    """
+    terms: List[str] = []
+    for identifier in _IDENTIFIER.findall(text):
+        parts = [p.lower() for word in identifier.split("_") for p in _CAMEL_PART.findall(word)]
+        terms.append(identifier.lower())
+        if len(parts) > 1:
+            terms.extend(parts)
+    return terms
+
+def _bm25(tf: np.ndarray, lengths: np.ndarray, n_docs: int, avg_length: float, k1: float, b: float) -> np.ndarray:
+    idf = math.log(1 + (n_docs - len(tf) + 0.5) / (len(tf) + 0.5))
+    return idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * lengths / avg_length))
+
+def _combine(parts: Sequence[Tuple[np.ndarray, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Sums the per-term weights of each document position.
+    """
+    positions = np.concatenate([p for p, _ in parts])
+    weights = np.concatenate([w for _, w in parts])
+    if len(parts) > 1:
+        positions, inverse = np.unique(positions, return_inverse=True)
+        weights = np.bincount(inverse, weights=weights)
+    return positions, weights
+
+def _top(weights: np.ndarray, k: int) -> np.ndarray:
+    """
+    Returns the indices of the k largest weights, best first.
+    """
+    if len(weights) > k:
+        top = np.argpartition(-weights, k - 1)[:k]
+    else:
+        top = np.arange(len(weights))
+    return top[np.argsort(-weights[top], kind="stable")]
+
+class LexicalIndex:
+    """
+    In-memory BM25 inverted index over chunk IDs, persisted in SQLite next to a FAISS store.
+
+    Used to build and update the index; searches over a saved index go through
+    SQLiteLexicalIndex, which reads postings from disk on demand.
+
+    Per-term BM25 weights are computed once into numpy arrays on first use and reused
+    until the index changes, so a warm query costs a few array operations per term.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self.doc_lengths: Dict[str, int] = {}
+        self._total_length = 0
+        self._ids: Optional[List[str]] = None
+        self._positions: Dict[str, int] = {}
+        self._weights: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def term_count(self) -> int:
+        return len(self.postings)
+
+    def add(self, doc_id: str, text: str) -> None:
+        """
+        Indexes a chunk, replacing any previous entry with the same ID.
+
+        :param doc_id: Docstore ID of the chunk.
+        :param text: Chunk text.
+        """
+        if doc_id in self.doc_lengths:
+            self.remove([doc_id])
+        self._invalidate()
+        terms = tokenize(text)
+        for term, count in Counter(terms).items():
+            self.postings[term][doc_id] = count
+        self.doc_lengths[doc_id] = len(terms)
+        self._total_length += len(terms)
+
+    def remove(self, doc_ids: Iterable[str]) -> None:
+        """
+        Drops chunks from the index; unknown IDs are ignored.
+
+        :param doc_ids: Docstore IDs to remove.
+        """
+        doomed = {doc_id for doc_id in doc_ids if doc_id in self.doc_lengths}
+        if not doomed:
+            return
+        self._invalidate()
+        for term in list(self.postings):
+            posting = self.postings[term]
+            for doc_id in doomed.intersection(posting):
+                del posting[doc_id]
+            if not posting:
+                del self.postings[term]
+        for doc_id in doomed:
+            self._total_length -= self.doc_lengths.pop(doc_id)
+
+    def _invalidate(self) -> None:
+        self._ids = None
+        self._positions = {}
+        self._weights = {}
+
+    def _term_weights(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        cached = self._weights.get(term)
+        if cached is not None:
+            return cached
+        if self._ids is None:
+            self._ids = list(self.doc_lengths)
+            self._positions = {doc_id: i for i, doc_id in enumerate(self._ids)}
+        posting = self.postings.get(term) or {}
+        n_docs = len(self._ids)
+        positions = np.fromiter((self._positions[d] for d in posting), dtype=np.int64, count=len(posting))
+        tf = np.fromiter(posting.values(), dtype=np.float64, count=len(posting))
+        lengths = np.fromiter((self.doc_lengths[d] for d in posting), dtype=np.float64, count=len(posting))
+        weights = _bm25(tf, lengths, n_docs, self._total_length / n_docs or 1.0, self.k1, self.b)
+        self._weights[term] = (positions, weights)
+        return positions, weights
+
+    def search(self, query: str, k: int, allowed: Optional[AbstractSet[str]] = None) -> List[Tuple[str, float]]:
+        """
+        Ranks chunks against the query with BM25.
+
+        :param query: Query text.
+        :param k: Number of results.
+        :param allowed: Optional doc IDs to restrict the ranking to; others are dropped
+            before the top k are taken.
+        :returns: List of (doc_id, score), best first.
+        """
+        if not self.doc_lengths or k <= 0:
+            return []
+        parts = [self._term_weights(term) for term in set(tokenize(query)) if term in self.postings]
+        if not parts:
+            return []
+        positions, weights = _combine(parts)
+        if allowed is not None:
+            keep = np.fromiter((self._ids[p] in allowed for p in positions), dtype=bool, count=len(positions))
+            positions, weights = positions[keep], weights[keep]
+        return [(self._ids[positions[i]], float(weights[i])) for i in _top(weights, k)]
+
+    def save(self, db_path: str) -> None:
+        """
+        Atomically writes the index to ``lexical.sqlite3`` in the vector store directory.
+
+        Each term's posting is stored as arrays of document positions, term frequencies
+        and document lengths, so a search reads one row per query term.
+
+        :param db_path: Directory of the repo's vector store.
+        """
+        path = os.path.join(db_path, LEXICAL_FILENAME)
+        if os.path.exists(path + ".tmp"):
+            os.remove(path + ".tmp")
+        ids = list(self.doc_lengths)
+        positions = {doc_id: i for i, doc_id in enumerate(ids)}
+        conn = sqlite3.connect(path + ".tmp")
+        try:
+            conn.executescript(_SCHEMA)
+            conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", [
+                ("k1", self.k1), ("b", self.b), ("docs", len(ids)), ("terms", len(self.postings)),
+                ("total_length", self._total_length),
+            ])
+            conn.executemany("INSERT INTO docs (position, doc_id, length) VALUES (?, ?, ?)",
+                             ((i, doc_id, self.doc_lengths[doc_id]) for i, doc_id in enumerate(ids)))
+            conn.executemany("INSERT INTO postings (term, positions, tfs, lengths) VALUES (?, ?, ?, ?)", (
+                (term,
+                 np.fromiter((positions[d] for d in posting), dtype=np.int32, count=len(posting)).tobytes(),
+                 np.fromiter(posting.values(), dtype=np.int32, count=len(posting)).tobytes(),
+                 np.fromiter((self.doc_lengths[d] for d in posting), dtype=np.int32, count=len(posting)).tobytes())
+                for term, posting in self.postings.items()
+            ))
+            conn.commit()
+        finally:
+            conn.close()
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, db_path: str) -> "LexicalIndex":
+        """
+        Reads ``lexical.sqlite3`` from the vector store directory fully into memory, e.g. to update it.
+
+        :param db_path: Directory of the repo's vector store.
+        :returns: LexicalIndex, empty if the file does not exist.
+        """
+        path = os.path.join(db_path, LEXICAL_FILENAME)
+        if not os.path.exists(path):
+            return cls()
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            meta = dict(conn.execute("SELECT key, value FROM meta"))
+            index = cls(meta["k1"], meta["b"])
+            # Positions have gaps where LexicalIndexUpdater removed chunks
+            ids: Dict[int, str] = {}
+            for position, doc_id, length in conn.execute("SELECT position, doc_id, length FROM docs ORDER BY position"):
+                ids[position] = doc_id
+                index.doc_lengths[doc_id] = length
+            for term, positions, tfs in conn.execute("SELECT term, positions, tfs FROM postings"):
+                index.postings[term] = dict(zip((ids[p] for p in np.frombuffer(positions, dtype=np.int32)),
+                                                np.frombuffer(tfs, dtype=np.int32).tolist()))
+        finally:
+            conn.close()
+        index._total_length = sum(index.doc_lengths.values())
+        return index
+
+class LexicalIndexUpdater:
+    """
+    Applies chunk additions and removals to a saved ``lexical.sqlite3`` in place.
+
+    Only the docs rows of changed chunks and the posting rows of their terms are
+    rewritten, so an incremental update costs time in the size of the change rather
+    than of the corpus. Removed chunks leave gaps in the document positions, which
+    searches do not rely on.
+    """
+
+    def __init__(self, docstore):
+        """
+        :param docstore: Docstore with ``mget`` (e.g. SQLiteDocstore), used to read the
+            text of removed chunks and so find the postings they appear in.
+        """
+        self.docstore = docstore
+        self._added: Dict[str, Dict[str, int]] = {}
+        self._removed_ids: List[str] = []
+        self._removed_terms: Set[str] = set()
+
+    def add(self, doc_id: str, text: str) -> None:
+        """
+        Queues a new chunk for indexing.
+
+        :param doc_id: Docstore ID of the chunk, not yet in the index.
+        :param text: Chunk text.
+        """
+        self._added[doc_id] = Counter(tokenize(text))
+
+    def remove(self, doc_ids: Iterable[str]) -> None:
+        """
+        Queues chunks for removal; must be called while their text is still in the docstore.
+
+        :param doc_ids: Docstore IDs to remove; unknown IDs are ignored.
+        """
+        doc_ids = [doc_id for doc_id in doc_ids if self._added.pop(doc_id, None) is None]
+        for doc_id, doc in zip(doc_ids, self.docstore.mget(doc_ids)):
+            if doc is not None:
+                self._removed_ids.append(doc_id)
+                self._removed_terms.update(tokenize(doc.page_content))
+
+    def save(self, db_path: str) -> None:
+        """
+        Writes the queued changes to ``lexical.sqlite3`` in the vector store directory in one transaction.
+
+        :param db_path: Directory of the repo's vector store.
+        """
+        conn = sqlite3.connect(os.path.join(db_path, LEXICAL_FILENAME))
+        try:
+            conn.execute("CREATE INDEX IF NOT EXISTS docs_doc_id ON docs (doc_id)")
+            meta = dict(conn.execute("SELECT key, value FROM meta"))
+            removed: Dict[int, int] = {}
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(self._removed_ids), 500):
+                batch = self._removed_ids[start:start + 500]
+                removed.update(conn.execute(
+                    f"SELECT position, length FROM docs WHERE doc_id IN ({','.join('?' * len(batch))})", batch
+                ).fetchall())
+            next_position = conn.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM docs").fetchone()[0]
+            conn.executemany("DELETE FROM docs WHERE position = ?", [(p,) for p in removed])
+
+            lengths = {doc_id: sum(counts.values()) for doc_id, counts in self._added.items()}
+            conn.executemany("INSERT INTO docs (position, doc_id, length) VALUES (?, ?, ?)",
+                             ((next_position + i, doc_id, lengths[doc_id]) for i, doc_id in enumerate(self._added)))
+            added: Dict[str, List[Tuple[int, int, int]]] = defaultdict(list)
+            for i, (doc_id, counts) in enumerate(self._added.items()):
+                for term, count in counts.items():
+                    added[term].append((next_position + i, count, lengths[doc_id]))
+
+            removed_positions = np.fromiter(removed, dtype=np.int32, count=len(removed))
+            terms = meta["terms"]
+            for term in self._removed_terms.union(added):
+                row = conn.execute("SELECT positions, tfs, lengths FROM postings WHERE term = ?", (term,)).fetchone()
+                columns = [np.empty(0, dtype=np.int32)] * 3
+                if row is not None:
+                    columns = [np.frombuffer(column, dtype=np.int32) for column in row]
+                    keep = ~np.isin(columns[0], removed_positions)
+                    columns = [column[keep] for column in columns]
+                if term in added:
+                    columns = [np.concatenate([column, np.array(new, dtype=np.int32)])
+                               for column, new in zip(columns, zip(*added[term]))]
+                if len(columns[0]):
+                    conn.execute("INSERT OR REPLACE INTO postings (term, positions, tfs, lengths) VALUES (?, ?, ?, ?)",
+                                 (term, *(column.tobytes() for column in columns)))
+                    if row is None:
+                        terms += 1
+                elif row is not None:
+                    conn.execute("DELETE FROM postings WHERE term = ?", (term,))
+                    terms -= 1
+            conn.executemany("UPDATE meta SET value = ? WHERE key = ?", [
+                (meta["docs"] - len(removed) + len(self._added), "docs"), (terms, "terms"),
+                (meta["total_length"] - sum(removed.values()) + sum(lengths.values()), "total_length"),
+            ])
+            conn.commit()
+        finally:
+            conn.close()
+        self._added, self._removed_ids, self._removed_terms = {}, [], set()
+
+class SQLiteLexicalIndex:
+    """
+    Read-only BM25 index searching a saved ``lexical.sqlite3`` in place.
+
+    Opening reads only the collection statistics. A query fetches the postings of its own
+    terms, and the BM25 weights of recently queried terms are kept in memory, so startup
+    cost and memory do not grow with the corpus. Rankings match LexicalIndex.search.
+    """
+
+    def __init__(self, path: str, cache_terms: int = WEIGHT_CACHE_TERMS):
+        self.path = path
+        self.cache_terms = cache_terms
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        meta = dict(self._conn.execute("SELECT key, value FROM meta"))
+        self.k1 = meta["k1"]
+        self.b = meta["b"]
+        self._docs = meta["docs"]
+        self._terms = meta["terms"]
+        self._avg_length = meta["total_length"] / self._docs if self._docs else 1.0
+        self._weights: "OrderedDict[str, Optional[Tuple[np.ndarray, np.ndarray]]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return self._docs
+
+    def term_count(self) -> int:
+        return self._terms
+
+    def _term_weights(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        with self._lock:
+            if term in self._weights:
+                self._weights.move_to_end(term)
+                return self._weights[term]
+            row = self._conn.execute("SELECT positions, tfs, lengths FROM postings WHERE term = ?", (term,)).fetchone()
+            weights = None
+            if row is not None:
+                positions, tf, lengths = (np.frombuffer(column, dtype=np.int32) for column in row)
+                weights = (positions.astype(np.int64), _bm25(tf.astype(np.float64), lengths.astype(np.float64),
+                                                             self._docs, self._avg_length or 1.0, self.k1, self.b))
+            self._weights[term] = weights
+            if len(self._weights) > self.cache_terms:
+                self._weights.popitem(last=False)
+            return weights
+
+    def _doc_ids(self, positions: Iterable[int]) -> Dict[int, str]:
+        found: Dict[int, str] = {}
+        unique = [int(p) for p in set(positions)]
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                found.update(self._conn.execute(
+                    f"SELECT position, doc_id FROM docs WHERE position IN ({','.join('?' * len(batch))})", batch
+                ).fetchall())
+        return found
+
+    def search(self, query: str, k: int, allowed: Optional[AbstractSet[str]] = None) -> List[Tuple[str, float]]:
+        """
+        Ranks chunks against the query with BM25.
+
+        :param query: Query text.
+        :param k: Number of results.
+        :param allowed: Optional doc IDs to restrict the ranking to; others are dropped
+            before the top k are taken.
+        :returns: List of (doc_id, score), best first.
+        """
+        if not self._docs or k <= 0:
+            return []
+        parts = [weights for weights in map(self._term_weights, set(tokenize(query))) if weights is not None]
+        if not parts:
+            return []
+        positions, weights = _combine(parts)
+        ids = None
+        if allowed is not None:
+            ids = self._doc_ids(positions)
+            keep = np.fromiter((ids[p] in allowed for p in positions), dtype=bool, count=len(positions))
+            positions, weights = positions[keep], weights[keep]
+        top = _top(weights, k)
+        ids = ids or self._doc_ids(positions[top])
+        return [(ids[positions[i]], float(weights[i])) for i in top]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Fuses several rankings of IDs with reciprocal rank fusion.
+
+    :param rankings: Ranked ID lists, best first.
+    :param k: RRF damping constant.
+    :returns: List of (id, fused score), best first.
+    """
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] += 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -1,36 +1,316 @@
 import os
-from typing import Optional
-from config import MODEL_PROVIDER, MODEL_NAME
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import httpx
+import requests
+from config import (
+    MODEL_PROVIDER, MODEL_NAME, LLM_FAILOVER, LLM_MODELS, LLM_BASE_URLS, LLM_MAX_CONCURRENCY,
+    LLM_QUEUE_TIMEOUT_SECONDS, LLM_TIMEOUT_SECONDS, LLM_MAX_RETRIES, LLM_RETRY_BACKOFF_SECONDS,
+    LLM_BATCH_WINDOW_MS, LLM_BATCH_MAX, OLLAMA_KEEP_ALIVE,
+)
 
 from langchain_community.chat_models import ChatOllama, ChatOpenAI
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+PROVIDERS = ("ollama", "openai", "together")
+
+_DEFAULT_BASE_URLS = {
+    "ollama": "http://localhost:11434",
+    "together": "https://api.together.xyz/v1",
+}
 
 _llm_instance = None
 
-def get_llm() -> object:
+# ChatOllama reports HTTP errors as ValueError("Ollama call failed with status code N. ...")
+_STATUS_CODE = re.compile(r"status code (\d{3})")
+
+def is_transient_error(error: Exception) -> bool:
     """
-    Singleton factory to get the LLM instance based on configuration.
+    Tells whether a provider error is worth retrying or failing over on.
 
-    :returns: An instance of the configured LLM model.
-    :raises ValueError: If MODEL_PROVIDER is unsupported.
+    Connection failures, timeouts, rate limiting (429) and server errors (5xx) are
+    transient. Authentication errors, other 4xx responses (e.g. a prompt longer than
+    the context window) and local errors would fail the same way again.
+
+    :param error: Exception raised by a chat model call.
+    :returns: True if the call may succeed when repeated.
     """
-    global _llm_instance
-    if _llm_instance is not None:
-        return _llm_instance
+    if isinstance(error, (requests.ConnectionError, requests.Timeout, httpx.TransportError, ConnectionError,
+                          TimeoutError)):
+        return True
+    try:
+        import openai
+        if isinstance(error, openai.APIConnectionError):
+            return True
+    except ImportError:
+        pass
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if status is None and isinstance(error, ValueError):
+        match = _STATUS_CODE.search(str(error))
+        status = int(match.group(1)) if match else None
+    return status is not None and (status == 429 or status >= 500)
+
+def create_chat_model(provider: str, model_name: str, base_url: Optional[str] = None,
+                      timeout: float = LLM_TIMEOUT_SECONDS, pool_size: int = 8) -> BaseChatModel:
+    """
+    Creates a chat model for one provider with a timeout.
 
-    if MODEL_PROVIDER == "ollama":
-        _llm_instance = ChatOllama(model=MODEL_NAME)
+    OpenAI-compatible clients get a keep-alive connection pool; Ollama keeps the model
+    loaded between requests for OLLAMA_KEEP_ALIVE. Retries are disabled in the client;
+    LLMGateway retries and fails over instead.
 
-    elif MODEL_PROVIDER == "openai":
-        _llm_instance = ChatOpenAI(model_name=MODEL_NAME)
+    :param provider: "ollama", "openai" or "together".
+    :param model_name: Model name at the provider.
+    :param base_url: Endpoint override (LLM_BASE_URLS), e.g. a local stand-in server.
+    :param timeout: Request timeout in seconds.
+    :param pool_size: Maximum pooled connections of OpenAI-compatible clients, normally the
+        provider's concurrency limit.
+    :returns: LangChain chat model.
+    :raises ValueError: If the provider is unsupported.
+    """
+    base_url = base_url or LLM_BASE_URLS.get(provider) or _DEFAULT_BASE_URLS.get(provider)
+    if provider == "ollama":
+        return ChatOllama(model=model_name, base_url=base_url, timeout=int(timeout), keep_alive=OLLAMA_KEEP_ALIVE)
 
-    elif MODEL_PROVIDER == "together":
-        _llm_instance = ChatOpenAI(
-            base_url="https://api.together.xyz/v1",
-            api_key=os.getenv("TOGETHER_API_KEY"),
-            model=MODEL_NAME
+    if provider in ("openai", "together"):
+        import openai
+        api_key = os.getenv("TOGETHER_API_KEY" if provider == "together" else "OPENAI_API_KEY")
+        http_client = httpx.Client(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=timeout,
         )
+        # ChatOpenAI would hand a sync http_client to its async client too, so build the client here
+        client = openai.OpenAI(api_key=api_key, base_url=base_url, timeout=timeout, max_retries=0,
+                               http_client=http_client)
+        return ChatOpenAI(client=client.chat.completions, model=model_name, api_key=api_key, base_url=base_url,
+                          request_timeout=timeout, max_retries=0)
+
+    raise ValueError(f"Unsupported MODEL_PROVIDER: {provider}")
+
+class ProviderPool:
+    """
+    One LLM provider behind a concurrency limit.
+
+    The chat model is created on first use, so a failover provider without credentials
+    only fails (and is skipped) when it is actually needed.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], BaseChatModel], max_concurrency: int = 1):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.calls = 0
+        self.failures = 0
+        self._factory = factory
+        self._model: Optional[BaseChatModel] = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+    @property
+    def model(self) -> BaseChatModel:
+        with self._lock:
+            if self._model is None:
+                self._model = self._factory()
+            return self._model
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits for a free request slot.
+
+        :param timeout: Seconds to wait; None waits indefinitely.
+        :returns: True if a slot was taken, False if the provider stayed saturated.
+        """
+        return self._slots.acquire(timeout=timeout)
+
+    def release(self) -> None:
+        self._slots.release()
+
+class LLMGateway(BaseChatModel):
+    """
+    Chat model spreading requests over an ordered list of providers.
+
+    Each provider has its own concurrency limit. A request goes to the first provider
+    with a free slot within queue_timeout seconds (the last provider is always waited
+    for), is retried there with exponential backoff, and fails over to the next provider
+    once its retries are exhausted. Only transient errors (see is_transient_error) are
+    retried; others are raised at once. Streams are only retried before the first token.
+    """
+
+    providers: List[ProviderPool]
+    max_retries: int = LLM_MAX_RETRIES
+    backoff: float = LLM_RETRY_BACKOFF_SECONDS
+    queue_timeout: float = LLM_QUEUE_TIMEOUT_SECONDS
 
-    else:
-        raise ValueError(f"Unsupported MODEL_PROVIDER: {MODEL_PROVIDER}")
+    class Config:
+        arbitrary_types_allowed = True
 
+    @property
+    def _llm_type(self) -> str:
+        return "llm-gateway"
+
+    def _with_failover(self, call: Callable[[BaseChatModel], Any]) -> Tuple[ProviderPool, Any]:
+        """
+        Runs call on the first available provider, retrying and failing over on transient errors.
+
+        :returns: Tuple of (provider, result); the caller releases the provider's slot.
+        :raises Exception: A non-transient provider error, or the last error if every provider failed.
+        """
+        last_error: Optional[Exception] = None
+        for i, provider in enumerate(self.providers):
+            is_last = i == len(self.providers) - 1
+            if not provider.acquire(None if is_last else self.queue_timeout):
+                print(f"LLM provider {provider.name} is saturated, failing over")
+                continue
+            try:
+                model = provider.model
+            except Exception as e:
+                provider.release()
+                last_error = e
+                print(f"LLM provider {provider.name} is unavailable: {e}")
+                continue
+            for attempt in range(self.max_retries + 1):
+                if attempt:
+                    time.sleep(self.backoff * 2 ** (attempt - 1))
+                provider.calls += 1
+                try:
+                    return provider, call(model)
+                except Exception as e:
+                    provider.failures += 1
+                    if not is_transient_error(e):
+                        provider.release()
+                        raise
+                    last_error = e
+                    print(f"LLM provider {provider.name} failed (attempt {attempt + 1}): {e}")
+            provider.release()
+        raise last_error or RuntimeError("No LLM provider available")
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        provider, result = self._with_failover(lambda model: model._generate(messages, stop=stop, **kwargs))
+        provider.release()
+        return result
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        def start(model: BaseChatModel) -> Tuple[Iterator[ChatGenerationChunk], Optional[ChatGenerationChunk]]:
+            chunks = model._stream(messages, stop=stop, **kwargs)
+            return chunks, next(chunks, None)
+
+        provider, (chunks, first) = self._with_failover(start)
+        try:
+            if first is not None:
+                yield first
+                yield from chunks
+        finally:
+            provider.release()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        Returns call and failure counters per provider.
+
+        :returns: Dict of provider name to {"calls", "failures"}.
+        """
+        return {p.name: {"calls": p.calls, "failures": p.failures} for p in self.providers}
+
+class PromptBatcher:
+    """
+    Coalesces concurrent prompts into batched calls, like QueryBatcher for queries.
+
+    Each caller blocks until its result is ready. A background thread takes the first
+    waiting item, gathers more for up to window_ms (or until max_batch) and passes them
+    to handler together, e.g. to ask the LLM several classification questions at once.
+    """
+
+    def __init__(self, handler: Callable[[List[Any]], Sequence[Any]], window_ms: float = LLM_BATCH_WINDOW_MS,
+                 max_batch: int = LLM_BATCH_MAX):
+        self.handler = handler
+        self.window_ms = window_ms
+        self.max_batch = max_batch
+        self.batches = 0
+        self._queue: "queue.Queue[Tuple[Any, Future]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="prompt-batcher", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window_ms / 1000
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self.batches += 1
+            try:
+                results = self.handler([item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def submit(self, item: Any) -> Any:
+        """
+        Queues an item for the next batch and waits for its result.
+
+        :param item: Prompt or other input understood by the handler.
+        :returns: The handler's result for this item.
+        """
+        future: Future = Future()
+        self._queue.put((item, future))
+        return future.result()
+
+def create_gateway(providers: Optional[List[str]] = None) -> LLMGateway:
+    """
+    Builds the LLM gateway for MODEL_PROVIDER followed by the LLM_FAILOVER providers.
+
+    :param providers: Ordered provider names; defaults to [MODEL_PROVIDER] + LLM_FAILOVER.
+    :returns: LLMGateway instance.
+    :raises ValueError: If a provider is unsupported.
+    """
+    names = list(dict.fromkeys(providers or [MODEL_PROVIDER, *LLM_FAILOVER]))
+    pools = []
+    for name in names:
+        if name not in PROVIDERS:
+            raise ValueError(f"Unsupported MODEL_PROVIDER: {name}")
+        model_name = MODEL_NAME if name == MODEL_PROVIDER else LLM_MODELS.get(name, MODEL_NAME)
+        limit = LLM_MAX_CONCURRENCY.get(name, 4)
+        pools.append(ProviderPool(
+            name,
+            lambda name=name, model_name=model_name, limit=limit: create_chat_model(name, model_name, pool_size=limit),
+            limit,
+        ))
+    return LLMGateway(providers=pools)
+
+def get_llm() -> object:
+    """
+    Singleton factory to get the LLM gateway based on configuration.
+
+    :returns: LLMGateway over MODEL_PROVIDER and the LLM_FAILOVER providers.
+    :raises ValueError: If MODEL_PROVIDER is unsupported.
+    """
+    global _llm_instance
+    if _llm_instance is None:
+        _llm_instance = create_gateway()
     return _llm_instance
@@ -1,32 +1,282 @@
-from langchain_community.document_loaders import DirectoryLoader, PythonLoader
-from langchain.schema import Document
-import glob
+import fnmatch
 import os
-
+import subprocess
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Tuple
 
 from langchain.schema import Document
-import glob
-import os
-from typing import List
 
-def load_code_documents(repo_name: str, repo_path: str) -> List[Document]:
+from config import INDEX_LANGUAGES, LANGUAGE_EXTENSIONS, SCAN_EXCLUDE_DIRS, SCAN_MAX_FILE_BYTES, SCAN_READ_WORKERS
+from metrics import metrics
+
+# Checked against file names before anything is read
+GENERATED_NAME_PATTERNS = ("*_pb2.py", "*_pb2_grpc.py", "*.pb.go", "*.min.js", "*.bundle.js",
+                           "*_generated.*", "*.generated.*")
+# Checked in the first GENERATED_HEADER_BYTES of a file
+GENERATED_MARKERS = ("@generated", "do not edit", "code generated by", "autogenerated", "auto-generated")
+GENERATED_HEADER_BYTES = 1024
+# Text with fewer line breaks than this per character is minified or data, not code
+MINIFIED_MIN_CHARS = 10_000
+MINIFIED_CHARS_PER_LINE = 1000
+BINARY_SNIFF_BYTES = 8192
+
+class ScanStats:
+    """
+    Per-repo counts of listed, skipped and read files.
+
+    Skip reasons: "excluded" (SCAN_EXCLUDE_DIRS), "extension", "size", "generated",
+    "binary" (NUL bytes or not UTF-8), "missing" (listed but gone) and "error" (unreadable).
+    """
+
+    def __init__(self, repo_name: str):
+        self.repo_name = repo_name
+        self.listed = 0
+        self.read = 0
+        self.bytes_read = 0
+        self.skipped: Dict[str, int] = {}
+        self.source = ""
+
+    def skip(self, reason: str) -> None:
+        self.skipped[reason] = self.skipped.get(reason, 0) + 1
+
+    def as_dict(self) -> Dict[str, object]:
+        return {"repo": self.repo_name, "source": self.source, "listed": self.listed, "read": self.read,
+                "bytes_read": self.bytes_read, "skipped": dict(self.skipped)}
+
+    def summary(self) -> str:
+        skipped = ", ".join(f"{count} {reason}" for reason, count in sorted(self.skipped.items()))
+        return (f"{self.repo_name}: listed {self.listed} files via {self.source}, read {self.read} "
+                f"({self.bytes_read / 1024:.0f} KB), skipped {sum(self.skipped.values())}"
+                + (f" ({skipped})" if skipped else ""))
+
+def extension_languages(languages: Optional[Iterable[str]] = None) -> Dict[str, str]:
+    """
+    Maps file extensions to language names for the selected languages.
+
+    :param languages: Keys of LANGUAGE_EXTENSIONS; INDEX_LANGUAGES if None.
+    :returns: Dict of lower-case extension (with dot) to language.
+    :raises ValueError: If a language is not in LANGUAGE_EXTENSIONS.
     """
-    Loads Python code files from the given repository path and converts them into Document objects.
+    mapping = {}
+    for language in INDEX_LANGUAGES if languages is None else languages:
+        if language not in LANGUAGE_EXTENSIONS:
+            raise ValueError(f"Unknown language: {language}")
+        for extension in LANGUAGE_EXTENSIONS[language]:
+            mapping[extension.lower()] = language
+    return mapping
+
+def _git_files(repo_path: str) -> Optional[List[str]]:
+    """
+    Lists tracked and untracked, non-ignored files from the git index.
+
+    :returns: Repo-relative paths, or None if repo_path is not a git work tree.
+    """
+    if not os.path.exists(os.path.join(repo_path, ".git")):
+        return None
+    try:
+        result = subprocess.run(
+            ["git", "-C", repo_path, "ls-files", "-z", "--cached", "--others", "--exclude-standard"],
+            capture_output=True, check=True,
+        )
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"git ls-files failed in {repo_path}, walking the directory instead: {e}")
+        return None
+    # Files with unmerged stages are listed once per stage
+    return list(dict.fromkeys(p for p in result.stdout.decode("utf-8", "surrogateescape").split("\0") if p))
+
+def _ignore_patterns(directory: str, prefix: str) -> List[Tuple[str, bool]]:
+    """
+    Reads a .gitignore as (repo-relative pattern, directories only) pairs.
+
+    Negated patterns are not supported and ignored.
+    """
+    try:
+        with open(os.path.join(directory, ".gitignore"), "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return []
+    patterns = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith(("#", "!")):
+            continue
+        dir_only = line.endswith("/")
+        line = line.strip("/")
+        # Patterns without an inner slash match at any depth below the .gitignore
+        anchored = "/" in line
+        patterns.append((prefix + line if anchored else prefix + "**/" + line, dir_only))
+        if not anchored:
+            patterns.append((prefix + line, dir_only))
+    return patterns
+
+def _is_ignored(rel_path: str, is_dir: bool, patterns: List[Tuple[str, bool]]) -> bool:
+    return any(fnmatch.fnmatchcase(rel_path, pattern) for pattern, dir_only in patterns if is_dir or not dir_only)
+
+def _walk_files(repo_path: str) -> List[str]:
+    """
+    Lists files outside git, pruning SCAN_EXCLUDE_DIRS and paths matched by .gitignore files.
+
+    :returns: Repo-relative paths.
+    """
+    excluded = set(SCAN_EXCLUDE_DIRS)
+    patterns: List[Tuple[str, bool]] = []
+    files = []
+    for root, dirs, names in os.walk(repo_path):
+        rel_root = os.path.relpath(root, repo_path).replace(os.sep, "/")
+        prefix = "" if rel_root == "." else rel_root + "/"
+        patterns = patterns + _ignore_patterns(root, prefix)
+        dirs[:] = sorted(d for d in dirs if d not in excluded and not _is_ignored(prefix + d, True, patterns))
+        files.extend(prefix + name for name in sorted(names) if not _is_ignored(prefix + name, False, patterns))
+    return files
+
+def list_repo_files(repo_path: str, stats: Optional[ScanStats] = None) -> List[str]:
+    """
+    Lists a repository's files, honoring .gitignore.
+
+    Uses `git ls-files` when repo_path is a git work tree (no directory walk, and nothing
+    under .git or ignored paths is visited), otherwise walks the tree.
+
+    :param repo_path: Local path to the repository.
+    :param stats: Receives the listing source and count.
+    :returns: Repo-relative paths with forward slashes.
+    """
+    files = _git_files(repo_path)
+    source = "git"
+    if files is None:
+        files = _walk_files(repo_path)
+        source = "walk"
+    if stats is not None:
+        stats.source = source
+        stats.listed = len(files)
+    return files
+
+def _select_files(files: Iterable[str], extensions: Dict[str, str], stats: ScanStats) -> Iterator[Tuple[str, str]]:
+    """
+    Filters listed files by excluded directories, extension and generated-file name.
+
+    :returns: Iterator of (relative path, language).
+    """
+    excluded = set(SCAN_EXCLUDE_DIRS)
+    for rel_path in files:
+        parts = rel_path.split("/")
+        if excluded.intersection(parts[:-1]):
+            stats.skip("excluded")
+            continue
+        language = extensions.get(os.path.splitext(parts[-1])[1].lower())
+        if language is None:
+            stats.skip("extension")
+        elif any(fnmatch.fnmatch(parts[-1], pattern) for pattern in GENERATED_NAME_PATTERNS):
+            stats.skip("generated")
+        else:
+            yield rel_path, language
+
+def _is_generated(content: str) -> bool:
+    header = content[:GENERATED_HEADER_BYTES].lower()
+    if any(marker in header for marker in GENERATED_MARKERS):
+        return True
+    return len(content) >= MINIFIED_MIN_CHARS and content.count("\n") < len(content) / MINIFIED_CHARS_PER_LINE
+
+def read_source_file(file_path: str, max_bytes: int = SCAN_MAX_FILE_BYTES) -> Tuple[Optional[str], str]:
+    """
+    Reads a file if it is worth indexing.
+
+    :param file_path: Absolute path.
+    :param max_bytes: Size limit; 0 disables it.
+    :returns: Tuple of (content, "") or (None, skip reason).
+    :raises OSError: If the file exists but cannot be read.
+    """
+    try:
+        size = os.path.getsize(file_path)
+    except FileNotFoundError:
+        return None, "missing"
+    if not os.path.isfile(file_path):
+        # Submodules are listed by git as paths to directories
+        return None, "missing"
+    if max_bytes and size > max_bytes:
+        return None, "size"
+    with open(file_path, "rb") as f:
+        data = f.read()
+    if b"\0" in data[:BINARY_SNIFF_BYTES]:
+        return None, "binary"
+    try:
+        content = data.decode("utf-8")
+    except UnicodeDecodeError:
+        return None, "binary"
+    if _is_generated(content):
+        return None, "generated"
+    return content, ""
+
+def _read(file_path: str) -> Tuple[Optional[str], str]:
+    try:
+        return read_source_file(file_path)
+    except OSError as e:
+        print(f"Could not read {file_path}: {e}")
+        return None, "error"
+
+def iter_code_documents(repo_name: str, repo_path: str, stats: Optional[ScanStats] = None,
+                        languages: Optional[Iterable[str]] = None,
+                        workers: int = SCAN_READ_WORKERS) -> Iterator[Document]:
+    """
+    Lazily yields the repository's source files worth indexing as Document objects.
+
+    Files are listed from the git index (honoring .gitignore), filtered by language
+    extension, excluded directories, size and generated/binary content, and read on a
+    thread pool. Only a small window of reads is in flight, so callers can stream a repo
+    of any size. A scan summary is printed once the iterator is exhausted.
+
+    :param repo_name: Name of the repository.
+    :param repo_path: Local path to the repository.
+    :param stats: Receives per-repo scan counts; a new ScanStats if None.
+    :param languages: Keys of LANGUAGE_EXTENSIONS to index; INDEX_LANGUAGES if None.
+    :param workers: Reader threads.
+    :returns: Iterator of Document objects with repo_name, file_path and language metadata.
+    """
+    stats = stats or ScanStats(repo_name)
+    extensions = extension_languages(languages)
+    selected = _select_files(list_repo_files(repo_path, stats), extensions, stats)
+    pending: Deque[Tuple[str, str, Future]] = deque()
+
+    def document(file_path: str, language: str, future: Future) -> Optional[Document]:
+        content, reason = future.result()
+        if content is None:
+            stats.skip(reason)
+            return None
+        stats.read += 1
+        stats.bytes_read += len(content)
+        return Document(page_content=content,
+                        metadata={"repo_name": repo_name, "file_path": file_path, "language": language})
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="file-reader") as pool:
+        for rel_path, language in selected:
+            file_path = os.path.join(repo_path, *rel_path.split("/"))
+            pending.append((file_path, language, pool.submit(_read, file_path)))
+            if len(pending) >= 4 * max(1, workers):
+                doc = document(*pending.popleft())
+                if doc is not None:
+                    yield doc
+        while pending:
+            doc = document(*pending.popleft())
+            if doc is not None:
+                yield doc
+
+    for reason, count in stats.skipped.items():
+        metrics.inc("rag_files_skipped_total", count, reason=reason)
+    print(f"Scanned {stats.summary()}")
+
+def load_code_documents(repo_name: str, repo_path: str, stats: Optional[ScanStats] = None) -> List[Document]:
+    """
+    Loads the repository's source files worth indexing as Document objects.
 
     :param repo_name: Name of the repository.
     :param repo_path: Local path to the repository.
+    :param stats: Receives per-repo scan counts.
     :returns: List of Document objects representing code files.
     """
-    documents: List[Document] = []
-    for file_path in glob.glob(os.path.join(repo_path, "**", "*.py"), recursive=True):
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-                doc = Document(
-                    page_content=content,
-                    metadata={"repo_name": repo_name, "file_path": file_path}
-                )
-                documents.append(doc)
-        except Exception:
-            continue
+    stats = stats or ScanStats(repo_name)
+    with metrics.span("load") as span:
+        documents = list(iter_code_documents(repo_name, repo_path, stats))
+        span.update(stats.as_dict())
+        span.update(files=len(documents))
+    metrics.inc("rag_files_loaded_total", len(documents))
     return documents
@@ -0,0 +1,332 @@
+import atexit
+import contextvars
+import copy
+import json
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from config import METRICS_ENABLED, METRICS_TRACE_PATH, METRICS_PORT
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+# Seconds; wide enough for both FAISS lookups and multi-second LLM calls
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+_current_span: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_span", default=None)
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _format_labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{key}="{value}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class Histogram:
+    """
+    Cumulative-bucket histogram in the Prometheus sense.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimates a quantile as the upper bound of the bucket it falls in.
+
+        :param q: Quantile in [0, 1].
+        :returns: Bucket upper bound; the largest bucket for the overflow bucket, 0 if empty.
+        """
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+class Metrics:
+    """
+    Thread-safe registry of counters, gauges and histograms with optional JSONL span export.
+
+    Metric names follow Prometheus conventions (``_total`` counters, ``_seconds``
+    histograms), so render_prometheus() can be scraped directly.
+    """
+
+    def __init__(self, enabled: bool = METRICS_ENABLED, trace_path: str = METRICS_TRACE_PATH):
+        self.enabled = enabled
+        self.trace_path = trace_path
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.gauges: Dict[str, Dict[Labels, float]] = {}
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels: Any) -> None:
+        if not self.enabled:
+            return
+        key = _labels(labels)
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels: Any) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self.gauges.setdefault(name, {})[_labels(labels)] = value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        if not self.enabled:
+            return
+        key = _labels(labels)
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(value)
+
+    @contextmanager
+    def span(self, stage: str, **labels: Any) -> Iterator[Dict[str, Any]]:
+        """
+        Times a pipeline stage into the ``rag_stage_seconds`` histogram.
+
+        The body may add attributes to the yielded dict (e.g. item counts); they are only
+        written to the JSONL trace. Nested spans record their parent stage.
+
+        :param stage: Stage name, e.g. "clone", "embed" or "llm".
+        :param labels: Extra histogram labels, e.g. repo.
+        :returns: Context manager yielding a dict of span attributes.
+        """
+        attributes: Dict[str, Any] = {}
+        if not self.enabled:
+            yield attributes
+            return
+        parent = _current_span.get()
+        token = _current_span.set(stage)
+        start_time = time.time()
+        start = time.perf_counter()
+        error: Optional[str] = None
+        try:
+            yield attributes
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            _current_span.reset(token)
+            self.observe("rag_stage_seconds", seconds, stage=stage, **labels)
+            if error:
+                self.inc("rag_stage_errors_total", stage=stage, error=error)
+            if self.trace_path:
+                self._write_trace({
+                    "ts": start_time, "span": stage, "duration_ms": seconds * 1000, "parent": parent,
+                    "thread": threading.current_thread().name, "labels": labels, **attributes,
+                    **({"error": error} if error else {}),
+                })
+
+    def timed(self, stage: str) -> Callable[[Callable], Callable]:
+        """
+        Decorator running the function inside span(stage).
+        """
+        def decorator(func: Callable) -> Callable:
+            @wraps(func)
+            def wrapper(*args: Any, **kwargs: Any) -> Any:
+                with self.span(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _write_trace(self, event: Dict[str, Any]) -> None:
+        line = json.dumps(event, default=str)
+        with self._lock:
+            with open(self.trace_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Returns all series as plain data, with p50/p95 estimates for histograms.
+
+        :returns: Dict with "counters", "gauges" and "histograms" keyed by metric name.
+        """
+        def series(values: Dict[Labels, Any], render: Callable[[Any], Any]) -> List[Dict[str, Any]]:
+            return [{"labels": dict(labels), **render(value)} for labels, value in values.items()]
+
+        with self._lock:
+            return {
+                "counters": {name: series(values, lambda v: {"value": v}) for name, values in self.counters.items()},
+                "gauges": {name: series(values, lambda v: {"value": v}) for name, values in self.gauges.items()},
+                "histograms": {
+                    name: series(values, lambda h: {"count": h.count, "sum": h.sum,
+                                                    "p50": h.quantile(0.5), "p95": h.quantile(0.95)})
+                    for name, values in self.histograms.items()
+                },
+            }
+
+    def export(self) -> Dict[str, Any]:
+        """
+        Returns a copy of all series with full histograms, e.g. to send a worker process's
+        metrics back to its parent, which adds them to its own with merge().
+
+        :returns: Picklable dict with "counters", "gauges" and "histograms".
+        """
+        with self._lock:
+            return copy.deepcopy({"counters": self.counters, "gauges": self.gauges, "histograms": self.histograms})
+
+    def merge(self, exported: Dict[str, Any]) -> None:
+        """
+        Adds series from export() to this registry: counters and histograms are summed,
+        gauges are overwritten.
+
+        :param exported: Result of export() on another registry with the same buckets.
+        """
+        with self._lock:
+            for name, values in exported["counters"].items():
+                series = self.counters.setdefault(name, {})
+                for key, value in values.items():
+                    series[key] = series.get(key, 0) + value
+            for name, values in exported["gauges"].items():
+                self.gauges.setdefault(name, {}).update(values)
+            for name, values in exported["histograms"].items():
+                series = self.histograms.setdefault(name, {})
+                for key, other in values.items():
+                    histogram = series.setdefault(key, Histogram(other.buckets))
+                    histogram.counts = [a + b for a, b in zip(histogram.counts, other.counts)]
+                    histogram.count += other.count
+                    histogram.sum += other.sum
+
+    def render_prometheus(self) -> str:
+        """
+        Renders all series in the Prometheus text exposition format.
+
+        :returns: Exposition text.
+        """
+        lines: List[str] = []
+        with self._lock:
+            for kind, metrics in (("counter", self.counters), ("gauge", self.gauges)):
+                for name, values in sorted(metrics.items()):
+                    lines.append(f"# TYPE {name} {kind}")
+                    lines.extend(f"{name}{_format_labels(labels)} {value}" for labels, value in values.items())
+            for name, values in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for labels, histogram in values.items():
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        bucket_labels = _format_labels(labels, 'le="' + le + '"')
+                        lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def dump_snapshot(self) -> None:
+        """
+        Appends the current snapshot to the JSONL trace file, if one is configured.
+        """
+        if self.enabled and self.trace_path:
+            self._write_trace({"ts": time.time(), "metrics": self.snapshot()})
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+metrics = Metrics()
+atexit.register(metrics.dump_snapshot)
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = "127.0.0.1",
+                         registry: Optional[Metrics] = None) -> "ThreadingHTTPServer":
+    """
+    Serves GET /metrics in Prometheus text format from a background thread.
+
+    :param port: Port to listen on; 0 picks a free port.
+    :param host: Interface to bind.
+    :param registry: Metrics to expose; the process-wide registry if None.
+    :returns: The running server (call shutdown() to stop it).
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    registry = registry or metrics
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args: Any) -> None:
+            pass
+
+        def do_GET(self) -> None:
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+def profile_call(func: Callable[[], Any], output: Optional[str] = None, profiler: str = "cprofile",
+                 top: int = 30) -> Any:
+    """
+    Runs func under a profiler and prints (or writes) the report.
+
+    :param func: Callable to profile, e.g. answering one question.
+    :param output: File for the report (pstats data for cProfile, HTML for pyinstrument);
+        printed to stdout if None.
+    :param profiler: "cprofile" or "pyinstrument" (optional dependency).
+    :param top: Number of functions printed by cumulative time (cProfile).
+    :returns: func's result.
+    :raises ValueError: If the profiler is unsupported.
+    :raises ImportError: If pyinstrument is requested but not installed.
+    """
+    if profiler == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError as e:
+            raise ImportError("--profiler pyinstrument needs `pip install pyinstrument`") from e
+        profile = Profiler()
+        profile.start()
+        try:
+            return func()
+        finally:
+            profile.stop()
+            if output:
+                with open(output, "w", encoding="utf-8") as f:
+                    f.write(profile.output_html())
+            else:
+                print(profile.output_text(unicode=True))
+
+    if profiler != "cprofile":
+        raise ValueError(f"Unsupported profiler: {profiler}")
+    import cProfile
+    import pstats
+
+    profile = cProfile.Profile()
+    try:
+        return profile.runcall(func)
+    finally:
+        if output:
+            profile.dump_stats(output)
+        else:
+            pstats.Stats(profile).sort_stats("cumulative").print_stats(top)
@@ -1,19 +1,264 @@
-from llm_factory import get_llm
+import re
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
 
-llm = get_llm()
+import numpy as np
 
-def is_code_related_query(query: str) -> bool:
+from config import CLASSIFIER_CONFIDENCE_THRESHOLD, CLASSIFIER_USE_EMBEDDINGS, CLASSIFIER_CACHE_SIZE
+from metrics import metrics
+
+# Created on first use, so importing the classifier does not build an LLM client
+llm = None
+
+# Inline code, calls and file names are near-certain signs of a code question
+_CODE_PATTERNS = [
+    re.compile(r"`[^`]+`"),
+    re.compile(r"\b\w+\(\)"),  # foo()
+    re.compile(r"\b[\w/]+\.(py|js|ts|java|go|rs|rb|cpp|c|h|json|yaml|yml|toml|cfg|ini|md)\b"),
+]
+
+# Identifier-shaped tokens are also brands (YouTube, McDonald's), places (New_York) and
+# abbreviations (U.S.A), so on their own they only lean towards code
+_IDENTIFIER_PATTERNS = [
+    re.compile(r"\b[A-Za-z]\w*_\w+\b"),  # snake_case / UPPER_CASE
+    re.compile(r"\b[a-z]{2,}[A-Z]\w*\b"),  # camelCase (not iPhone or eBay)
+    re.compile(r"\b[A-Z][a-z]+[A-Z]\w*\b"),  # PascalCase
+    re.compile(r"\b[A-Za-z_]\w*\.[A-Za-z_]\w*\.[A-Za-z_]\w*\b"),  # dotted module paths
+]
+# Below CLASSIFIER_CONFIDENCE_THRESHOLD, so a lone identifier is checked by the next tier
+_LONE_IDENTIFIER_CONFIDENCE = 0.6
+
+# Acronyms such as LLM or FAISS only reinforce other code evidence; NBA or USA are not code
+_ACRONYM = re.compile(r"\b[A-Z]{3,}\b")
+
+# Terms that are rarely used outside programming; one of them is enough
+_STRONG_CODE_TERMS = {
+    "codebase", "repo", "repository", "traceback", "stacktrace", "refactor", "decorator", "async", "api", "endpoint", "cli", "embedding", "chunking", "parser", "constructor",
+    "dependency", "dependencies", "implementation", "implemented",
+}
+
+# Terms that also have everyday meanings ("return policy", "model of car", "test of character");
+# only several of them together, or one with a strong term, make a confident code question
+_CODE_TERMS = _STRONG_CODE_TERMS | {
+    "function", "functions", "method", "methods", "class", "classes", "module", "modules", "package",
+    "import", "imports", "variable", "variables", "bug", "error", "errors", "exception", "exceptions",
+    "implement", "test", "tests", "config", "configuration", "parameter", "parameters", "argument",
+    "arguments", "return", "returns", "call", "calls", "called", "file", "files", "commit", "compile",
+    "runtime", "debug", "loop", "algorithm", "script", "library", "thread", "database", "schema",
+    "query", "index", "parse", "handler", "inherit", "interface", "command", "option", "options",
+    "documents", "chunk", "model", "syntax", "code", "python",
+}
+
+_GENERAL_TERMS = {
+    "weather", "hello", "hi", "hey", "thanks", "thank", "joke", "news", "recipe", "movie", "movies",
+    "song", "music", "capital", "country", "president", "football", "sport", "sports", "holiday",
+    "travel", "health", "poem", "story", "birthday", "restaurant", "today", "tomorrow", "yesterday",
+    "feel", "feeling", "love", "meaning", "life",
+}
+
+_CODE_PROTOTYPES = [
+    "How does this function work?",
+    "Where is the configuration loaded in the repository?",
+    "What does this class do?",
+    "Why does this method raise an exception?",
+    "How are the vector stores created in the code?",
+    "Which module handles authentication?",
+    "Explain the implementation of the retry logic.",
+    "How do I add a new command to the CLI?",
+]
+
+_GENERAL_PROTOTYPES = [
+    "What is the weather like today?",
+    "Tell me a joke.",
+    "Who won the football match yesterday?",
+    "What is the capital of France?",
+    "Hello, how are you?",
+    "Recommend a good movie to watch.",
+    "What should I cook for dinner?",
+    "Write a short poem about the sea.",
+]
+
+_prototype_centroids: Optional[Tuple[np.ndarray, np.ndarray]] = None
+_classification_cache: "OrderedDict[str, bool]" = OrderedDict()
+_cache_lock = threading.Lock()
+_llm_batcher = None
+_batcher_lock = threading.Lock()
+_NUMBERED_ANSWER = re.compile(r"^\W*(\d+)\W+(yes|no)\b", re.IGNORECASE | re.MULTILINE)
+
+def normalize_query(query: str) -> str:
     """
-    Classifies if the query is specifically about source code or repository content using the LLM.
+    Normalizes a query for memoization: trims, collapses whitespace and lowercases.
 
     :param query: User query string.
-    :returns: True if code-related, False otherwise.
+    :returns: Normalized query.
     """
-    prompt = (
+    return " ".join(query.split()).lower()
+
+def heuristic_classification(query: str) -> Tuple[Optional[bool], float]:
+    """
+    Classifies a query from identifiers and keywords alone.
+
+    :param query: User query string (not lowercased, so identifier casing is visible).
+    :returns: Tuple of (label or None if undecided, confidence in [0, 1]).
+    """
+    if any(pattern.search(query) for pattern in _CODE_PATTERNS):
+        return True, 0.95
+    identifier = any(pattern.search(query) for pattern in _IDENTIFIER_PATTERNS)
+    words = set(re.findall(r"[a-z]+", query.lower()))
+    code_terms = words & _CODE_TERMS
+    strong = bool(code_terms & _STRONG_CODE_TERMS)
+    # Strong terms count double; acronyms only reinforce a strong term
+    code_score = len(code_terms) + len(code_terms & _STRONG_CODE_TERMS)
+    if strong:
+        code_score += len(set(_ACRONYM.findall(query)))
+    general_hits = len(words & _GENERAL_TERMS)
+    if identifier and not general_hits:
+        # An identifier is confident only when code terms back it up
+        return True, 0.95 if code_score >= 2 else _LONE_IDENTIFIER_CONFIDENCE
+    if code_score and not general_hits:
+        if not strong:
+            # "call about my return" or "test the model": everyday words need company
+            return True, {1: 0.6, 2: 0.75}.get(code_score, 0.85)
+        return True, {2: 0.85}.get(code_score, 0.9)
+    if general_hits and not code_score:
+        return False, min(0.7 + 0.15 * general_hits, 0.9)
+    return None, 0.0
+
+def _centroids() -> Tuple[np.ndarray, np.ndarray]:
+    global _prototype_centroids
+    if _prototype_centroids is None:
+        from embedding_engine import get_embedding_model
+        model = get_embedding_model()
+        centroids = []
+        for prototypes in (_CODE_PROTOTYPES, _GENERAL_PROTOTYPES):
+            vectors = np.array(model.embed_documents(prototypes))
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            centroid = vectors.mean(axis=0)
+            centroids.append(centroid / np.linalg.norm(centroid))
+        _prototype_centroids = (centroids[0], centroids[1])
+    return _prototype_centroids
+
+def embedding_classification(query: str) -> Tuple[bool, float]:
+    """
+    Classifies a query by cosine similarity to code and general prototype centroids.
+
+    :param query: User query string.
+    :returns: Tuple of (label, confidence in [0, 1]).
+    """
+    from embedding_engine import get_embedding_model
+    code_centroid, general_centroid = _centroids()
+    vector = np.array(get_embedding_model().embed_query(query))
+    vector /= np.linalg.norm(vector)
+    margin = float(vector @ code_centroid - vector @ general_centroid)
+    return margin > 0, min(0.5 + 3 * abs(margin), 1.0)
+
+def classify_locally(query: str) -> Tuple[Optional[bool], float]:
+    """
+    Runs the local classifier tiers: heuristics, then (optionally) embedding similarity.
+
+    :param query: User query string.
+    :returns: Tuple of (label or None if undecided, confidence in [0, 1]).
+    """
+    label, confidence = heuristic_classification(query)
+    if confidence >= CLASSIFIER_CONFIDENCE_THRESHOLD or not CLASSIFIER_USE_EMBEDDINGS:
+        return label, confidence
+
+    emb_label, emb_confidence = embedding_classification(query)
+    if label is None:
+        return emb_label, emb_confidence
+    if label == emb_label:
+        return label, 1 - (1 - confidence) * (1 - emb_confidence)
+    if confidence >= emb_confidence:
+        return label, confidence - emb_confidence
+    return emb_label, emb_confidence - confidence
+
+def _classification_prompt(query: str) -> str:
+    return (
         "Answer with only 'Yes' or 'No'.\n"
         "Is the following question specifically about the source code, programming logic, or repository content?\n"
         f"Question: {query}"
     )
-    response = llm.invoke(prompt)
-    text = response.content.strip().lower()
-    return text == "yes"
+
+def classify_many_with_llm(queries: List[str]) -> List[bool]:
+    """
+    Classifies several queries with a single LLM prompt listing them as numbered questions.
+
+    Falls back to one prompt per query (sent as one llm.batch) if the numbered answers
+    cannot be parsed.
+
+    :param queries: User query strings.
+    :returns: True for each code-related query, False otherwise.
+    """
+    global llm
+    if llm is None:
+        from llm_factory import get_llm
+        llm = get_llm()
+    if len(queries) == 1:
+        return [llm.invoke(_classification_prompt(queries[0])).content.strip().lower() == "yes"]
+    prompt = (
+        "Answer each question with only 'Yes' or 'No', one line per question in the form '<number>. Yes'.\n"
+        "Is each of the following questions specifically about the source code, programming logic, or "
+        "repository content?\n"
+        + "\n".join(f"{i}. {query}" for i, query in enumerate(queries, 1))
+    )
+    answers = {int(n): a.lower() == "yes" for n, a in _NUMBERED_ANSWER.findall(llm.invoke(prompt).content)}
+    if all(i in answers for i in range(1, len(queries) + 1)):
+        return [answers[i] for i in range(1, len(queries) + 1)]
+    responses = llm.batch([_classification_prompt(query) for query in queries])
+    return [response.content.strip().lower() == "yes" for response in responses]
+
+def classify_with_llm(query: str) -> bool:
+    """
+    Classifies if the query is specifically about source code or repository content using the LLM.
+
+    Concurrent calls (e.g. from server requests) within LLM_BATCH_WINDOW_MS are answered
+    by one batched prompt.
+
+    :param query: User query string.
+    :returns: True if code-related, False otherwise.
+    """
+    global _llm_batcher
+    with _batcher_lock:
+        if _llm_batcher is None:
+            from llm_factory import PromptBatcher
+            _llm_batcher = PromptBatcher(classify_many_with_llm)
+    return _llm_batcher.submit(query)
+
+def is_code_related_query(query: str) -> bool:
+    """
+    Classifies if the query is specifically about source code or repository content.
+
+    A local tier (identifier/keyword heuristics and embedding similarity) answers in about
+    a millisecond; the LLM is only asked when the local confidence is below
+    CLASSIFIER_CONFIDENCE_THRESHOLD. Results are memoized per normalized query.
+
+    :param query: User query string.
+    :returns: True if code-related, False otherwise.
+    """
+    key = normalize_query(query)
+    with _cache_lock:
+        if key in _classification_cache:
+            _classification_cache.move_to_end(key)
+            metrics.inc("rag_classifications_total", tier="cache")
+            return _classification_cache[key]
+
+    with metrics.span("classify"):
+        label, confidence = classify_locally(query)
+        tier = "local"
+        if label is None or confidence < CLASSIFIER_CONFIDENCE_THRESHOLD:
+            label, tier = classify_with_llm(query), "llm"
+    metrics.inc("rag_classifications_total", tier=tier)
+
+    with _cache_lock:
+        _classification_cache[key] = label
+        if len(_classification_cache) > CLASSIFIER_CACHE_SIZE:
+            _classification_cache.popitem(last=False)
+    return label
+
+def clear_classifier_cache() -> None:
+    """
+    Clears memoized classifications.
+    """
+    with _cache_lock:
+        _classification_cache.clear()
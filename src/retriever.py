@@ -1,8 +1,14 @@
 from langchain.chains import RetrievalQA
 from langchain_community.vectorstores import FAISS
+import faiss
+import math
+import numpy as np
 from llm_factory import get_llm
-from typing import Union
+from ann_index import extract_index_hnsw, reconstruct_positions
+from chunk_store import SQLiteDocstore
+from typing import List, Optional, Sequence, Tuple, Union
 from config import CODE_QUERY_RETRIEVAL_K
+from metrics import metrics
 
 def create_qa_chain(vector_store: FAISS) -> RetrievalQA:
     """
@@ -14,3 +20,85 @@ def create_qa_chain(vector_store: FAISS) -> RetrievalQA:
     retriever = vector_store.as_retriever(search_kwargs={'k': CODE_QUERY_RETRIEVAL_K})
     llm = get_llm()
     return RetrievalQA.from_chain_type(llm=llm, retriever=retriever)
+
+def filtered_search_params(index: faiss.Index, mask: np.ndarray) -> Tuple[faiss.SearchParameters, np.ndarray]:
+    """
+    Builds search parameters restricting a FAISS search to the positions set in mask.
+
+    IVF and HNSW indexes visit proportionally more lists or candidates the fewer vectors
+    pass the filter, so selective filters still find k hits.
+
+    :param index: faiss index to search.
+    :param mask: Boolean array of length index.ntotal.
+    :returns: Tuple of (parameters, packed bitmap); the bitmap must outlive the search.
+    """
+    bitmap = np.packbits(mask, bitorder="little")
+    selector = faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bitmap))
+    fraction = max(float(mask.mean()), 1e-6) if len(mask) else 1.0
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        nprobe = min(ivf.nlist, math.ceil(ivf.nprobe / fraction))
+        return faiss.SearchParametersIVF(sel=selector, nprobe=nprobe), bitmap
+    hnsw = extract_index_hnsw(index)
+    if hnsw is not None:
+        ef_search = min(max(index.ntotal, 1), math.ceil(hnsw.hnsw.efSearch / fraction))
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=ef_search), bitmap
+    return faiss.SearchParameters(sel=selector), bitmap
+
+def vector_search(vector_store: FAISS, vector: Sequence[float], k: int,
+                  mask: Optional[np.ndarray] = None) -> List[Tuple[str, float]]:
+    """
+    Searches with a precomputed query embedding and returns docstore IDs with distances.
+
+    :param vector_store: FAISS vector store instance.
+    :param vector: Query embedding.
+    :param k: Number of results.
+    :param mask: Optional bitmap of allowed index positions (see search_filter.MetadataIndex);
+        FAISS skips other vectors during the search.
+    :returns: List of (docstore ID, distance), nearest first.
+    """
+    return vector_search_many(vector_store, [vector], k, mask)[0]
+
+def vector_search_many(vector_store: FAISS, vectors: Sequence[Sequence[float]], k: int,
+                       mask: Optional[np.ndarray] = None) -> List[List[Tuple[str, float]]]:
+    """
+    Searches several precomputed query embeddings in one FAISS call.
+
+    :param vector_store: FAISS vector store instance.
+    :param vectors: Query embeddings.
+    :param k: Number of results per query.
+    :param mask: Optional bitmap of allowed index positions, shared by all queries.
+    :returns: One list of (docstore ID, distance) per query, nearest first.
+    """
+    query = np.array(vectors, dtype=np.float32).reshape(len(vectors), -1)
+    if vector_store._normalize_L2:
+        query /= np.linalg.norm(query, axis=1, keepdims=True)
+    with metrics.span("faiss_search"):
+        if mask is None:
+            distances, indices = vector_store.index.search(query, k)
+        else:
+            params, _bitmap = filtered_search_params(vector_store.index, mask)
+            distances, indices = vector_store.index.search(query, k, params=params)
+    return [
+        [(vector_store.index_to_docstore_id[i], float(d)) for i, d in zip(row_indices, row_distances) if i != -1]
+        for row_indices, row_distances in zip(indices, distances)
+    ]
+
+def stored_vectors(vector_store: FAISS, doc_ids: Sequence[str]) -> Optional[np.ndarray]:
+    """
+    Reads the indexed vectors of chunks back from the store's FAISS index instead of re-embedding them.
+
+    :param vector_store: FAISS vector store instance.
+    :param doc_ids: Docstore IDs.
+    :returns: Array with one row per ID, or None if an ID is not in the index.
+    """
+    docstore = vector_store.docstore
+    if isinstance(docstore, SQLiteDocstore):
+        positions = docstore.doc_positions(doc_ids)
+    else:
+        wanted = set(doc_ids)
+        positions = {doc_id: position for position, doc_id in vector_store.index_to_docstore_id.items()
+                     if doc_id in wanted}
+    if any(doc_id not in positions for doc_id in doc_ids):
+        return None
+    return reconstruct_positions(vector_store.index, [positions[doc_id] for doc_id in doc_ids])
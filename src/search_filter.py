@@ -0,0 +1,218 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from fnmatch import fnmatchcase
+from typing import AbstractSet, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain.schema import Document
+from langchain_community.vectorstores import FAISS
+
+from chunk_store import SQLiteDocstore
+from index_manifest import load_manifest
+from load_code_documents import extension_languages
+from config import LANGUAGE_EXTENSIONS
+
+# Inline query syntax, e.g. "path:src/retrieval/* lang:python symbol:LexicalIndex.* how is BM25 scored?"
+FILTER_PREFIXES = {"path": "paths", "lang": "languages", "symbol": "symbols"}
+# Masks of recently used filters kept per repo
+MASK_CACHE_SIZE = 64
+
+class SearchFilter(NamedTuple):
+    """
+    Metadata restrictions applied inside the search. Values within a field are ORed,
+    fields are ANDed.
+    """
+    paths: Tuple[str, ...] = ()  # globs on repo-relative paths; a directory matches everything below it
+    languages: Tuple[str, ...] = ()  # keys of LANGUAGE_EXTENSIONS
+    symbols: Tuple[str, ...] = ()  # globs on qualified symbol names or their last component
+
+    def __bool__(self) -> bool:
+        return bool(self.paths or self.languages or self.symbols)
+
+def make_filter(paths: Iterable[str] = (), languages: Iterable[str] = (), symbols: Iterable[str] = ()) -> SearchFilter:
+    """
+    Builds a SearchFilter, checking the language names.
+
+    :raises ValueError: If a language is not in LANGUAGE_EXTENSIONS.
+    """
+    languages = tuple(languages)
+    unknown = [language for language in languages if language not in LANGUAGE_EXTENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown language: {', '.join(unknown)}")
+    return SearchFilter(tuple(paths), languages, tuple(symbols))
+
+def parse_filters(query: str) -> Tuple[SearchFilter, str]:
+    """
+    Splits ``path:``, ``lang:`` and ``symbol:`` terms from a query.
+
+    Each term takes a comma separated list, e.g. ``path:src/*,tests/* lang:python``.
+
+    :param query: Raw user question.
+    :returns: Tuple of (SearchFilter, remaining query).
+    :raises ValueError: If a language is not in LANGUAGE_EXTENSIONS.
+    """
+    values: Dict[str, List[str]] = {field: [] for field in FILTER_PREFIXES.values()}
+    words = []
+    for word in query.split():
+        prefix, sep, value = word.partition(":")
+        if sep and prefix in FILTER_PREFIXES and value:
+            values[FILTER_PREFIXES[prefix]].extend(v for v in value.split(",") if v)
+        else:
+            words.append(word)
+    return make_filter(**values), " ".join(words)
+
+def _path_matches(path: str, patterns: Sequence[str]) -> bool:
+    return any(fnmatchcase(path, pattern) or fnmatchcase(path, pattern.rstrip("/") + "/*") for pattern in patterns)
+
+def _symbol_matches(symbol: str, patterns: Sequence[str]) -> bool:
+    names = symbol.split(", ")
+    return any(fnmatchcase(name, pattern) or fnmatchcase(name.rsplit(".", 1)[-1], pattern)
+               for name in names for pattern in patterns)
+
+def _repo_root(paths: Iterable[str], manifest_paths: AbstractSet[str]) -> str:
+    """
+    Finds the checkout path the stored absolute file paths start with.
+
+    Uses the manifest's repo-relative paths when there is one, else the common directory.
+    """
+    paths = list(paths)
+    for path in paths:
+        for i, char in enumerate(path):
+            if char == "/" and path[i + 1:] in manifest_paths:
+                return path[:i + 1]
+    if not paths:
+        return ""
+    root = os.path.commonpath(paths) if len(paths) > 1 else os.path.dirname(paths[0])
+    return root.rstrip("/") + "/" if root else ""
+
+class MetadataIndex:
+    """
+    Per-repo columns of chunk metadata for turning filters into FAISS ID bitmaps.
+
+    Every FAISS position has one row per location of its chunk (the chunk itself plus the
+    copies collapsed into it by deduplication), holding codes into the repo's distinct
+    paths, languages and symbols. Filters are evaluated once per distinct value and then
+    broadcast over the rows with numpy, and the resulting masks are cached.
+    """
+
+    def __init__(self, rows: Sequence[Tuple[int, str, Optional[str], Optional[str]]], size: int,
+                 manifest_paths: AbstractSet[str] = frozenset()):
+        """
+        :param rows: (FAISS position, doc_id, absolute file_path, symbol) per chunk location.
+        :param size: Number of vectors in the index (ntotal).
+        :param manifest_paths: Repo-relative paths from the manifest, to find the checkout root.
+        """
+        self.size = size
+        self.doc_ids: Dict[int, str] = {}
+        root = _repo_root({path.replace(os.sep, "/") for _, _, path, _ in rows if path}, manifest_paths)
+        extensions = extension_languages(LANGUAGE_EXTENSIONS)
+
+        self.paths: List[str] = []
+        self.symbols: List[str] = []
+        self.languages: List[str] = []
+        path_codes: Dict[str, int] = {}
+        symbol_codes: Dict[str, int] = {}
+        positions, paths, symbols = [], [], []
+        for position, doc_id, path, symbol in rows:
+            self.doc_ids[position] = doc_id
+            path = (path or "").replace(os.sep, "/")
+            if root and path.startswith(root):
+                path = path[len(root):]
+            if path not in path_codes:
+                path_codes[path] = len(self.paths)
+                self.paths.append(path)
+                self.languages.append(extensions.get(os.path.splitext(path)[1].lower(), ""))
+            symbol = symbol or ""
+            if symbol not in symbol_codes:
+                symbol_codes[symbol] = len(self.symbols)
+                self.symbols.append(symbol)
+            positions.append(position)
+            paths.append(path_codes[path])
+            symbols.append(symbol_codes[symbol])
+        self.positions = np.array(positions, dtype=np.int64)
+        self.path_codes = np.array(paths, dtype=np.int64)
+        self.symbol_codes = np.array(symbols, dtype=np.int64)
+        self._masks: "OrderedDict[SearchFilter, np.ndarray]" = OrderedDict()
+        self._allowed_ids: Dict[SearchFilter, AbstractSet[str]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_store(cls, vectorstore: FAISS) -> "MetadataIndex":
+        """
+        Reads chunk metadata of a store, from SQLite in one query for persisted stores.
+
+        :param vectorstore: FAISS vector store.
+        :returns: MetadataIndex over the store's positions.
+        """
+        docstore = vectorstore.docstore
+        manifest_paths: AbstractSet[str] = frozenset()
+        if isinstance(docstore, SQLiteDocstore):
+            manifest = load_manifest(os.path.dirname(docstore.path))
+            manifest_paths = frozenset(manifest["files"]) if manifest else frozenset()
+            records = docstore.metadata_rows(("file_path", "symbol", "duplicates"))
+        else:
+            records = []
+            for position, doc_id in vectorstore.index_to_docstore_id.items():
+                doc = docstore.search(doc_id)
+                if isinstance(doc, Document):
+                    duplicates = doc.metadata.get("duplicates")
+                    records.append((position, doc_id, doc.metadata.get("file_path"), doc.metadata.get("symbol"),
+                                    json.dumps(duplicates) if duplicates else None))
+        rows = []
+        for position, doc_id, path, symbol, duplicates in records:
+            rows.append((position, doc_id, path, symbol))
+            for location in json.loads(duplicates) if duplicates else []:
+                rows.append((position, doc_id, location.get("file_path"), location.get("symbol", symbol)))
+        return cls(rows, vectorstore.index.ntotal, manifest_paths)
+
+    def mask(self, search_filter: SearchFilter) -> np.ndarray:
+        """
+        Computes the bitmap of FAISS positions passing the filter.
+
+        :param search_filter: Non-empty SearchFilter.
+        :returns: Boolean array of length size.
+        """
+        with self._lock:
+            cached = self._masks.get(search_filter)
+            if cached is not None:
+                self._masks.move_to_end(search_filter)
+                return cached
+        rows = np.ones(len(self.positions), dtype=bool)
+        if search_filter.paths or search_filter.languages:
+            allowed_paths = np.array([
+                (not search_filter.paths or _path_matches(path, search_filter.paths))
+                and (not search_filter.languages or language in search_filter.languages)
+                for path, language in zip(self.paths, self.languages)
+            ], dtype=bool)
+            rows &= allowed_paths[self.path_codes]
+        if search_filter.symbols:
+            allowed_symbols = np.array([bool(symbol) and _symbol_matches(symbol, search_filter.symbols)
+                                        for symbol in self.symbols], dtype=bool)
+            rows &= allowed_symbols[self.symbol_codes]
+        mask = np.zeros(self.size, dtype=bool)
+        mask[self.positions[rows]] = True
+        with self._lock:
+            self._masks[search_filter] = mask
+            if len(self._masks) > MASK_CACHE_SIZE:
+                evicted, _ = self._masks.popitem(last=False)
+                self._allowed_ids.pop(evicted, None)
+        return mask
+
+    def allowed_ids(self, search_filter: SearchFilter) -> AbstractSet[str]:
+        """
+        Returns the doc IDs passing the filter, e.g. to restrict lexical search.
+
+        :param search_filter: Non-empty SearchFilter.
+        :returns: Set of docstore IDs.
+        """
+        mask = self.mask(search_filter)
+        with self._lock:
+            allowed = self._allowed_ids.get(search_filter)
+        if allowed is None:
+            allowed = frozenset(self.doc_ids[int(p)] for p in np.flatnonzero(mask) if int(p) in self.doc_ids)
+            with self._lock:
+                if search_filter in self._masks:
+                    self._allowed_ids[search_filter] = allowed
+        return allowed
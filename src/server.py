@@ -0,0 +1,175 @@
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Sequence
+
+from aiohttp import web
+
+from cli import answer_query, parse_repo_scope
+from answer_cache import AnswerCache
+from federated_search import FederatedIndex
+from search_filter import SearchFilter, make_filter, parse_filters
+from vector_store import RepoIndex, load_repo_index
+from metrics import metrics
+from config import SERVER_HOST, SERVER_PORT, SERVER_WORKERS
+
+def _error(status: int, message: str) -> web.Response:
+    return web.json_response({"error": message}, status=status)
+
+class QAServer:
+    """
+    HTTP/JSON front end that keeps the embedding model, indexes and LLM client warm.
+
+    Each request runs on a shared thread pool through cli.answer_query, so concurrent
+    questions overlap their retrieval and LLM calls, and their query embeddings are
+    batched when the index uses a QueryBatcher.
+
+    Endpoints:
+        POST   /query                {"query": ..., "repos": [...]?, "filters": {"paths", "languages", "symbols"}?}
+                                     -> {"answer": ..., "elapsed_ms": ...}
+        GET    /repos                -> {"repos": [...]}
+        POST   /repos                {"urls": [...]} clones/updates and (re)loads repos
+        POST   /repos/{name}/reload  reloads a repo's index from disk
+        DELETE /repos/{name}         stops searching a repo
+        GET    /health
+        GET    /metrics              Prometheus text: stage latencies, token counts, cache hit rates
+    """
+
+    def __init__(self, index: FederatedIndex, llm, cache: Optional[AnswerCache] = None,
+                 workers: int = SERVER_WORKERS,
+                 ingest: Optional[Callable[[List[str]], List[RepoIndex]]] = None,
+                 load: Callable[[str], RepoIndex] = load_repo_index):
+        self.index = index
+        self.llm = llm
+        self.cache = cache
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="server")
+        self._ingest = ingest
+        self._load = load
+        self._indexing = asyncio.Lock()
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.add_routes([
+            web.post("/query", self.query),
+            web.get("/repos", self.list_repos),
+            web.post("/repos", self.add_repos),
+            web.post("/repos/{name}/reload", self.reload_repo),
+            web.delete("/repos/{name}", self.drop_repo),
+            web.get("/health", self.health),
+            web.get("/metrics", self.export_metrics),
+        ])
+        app.on_cleanup.append(self._shutdown)
+        return app
+
+    async def _shutdown(self, app: web.Application) -> None:
+        self.executor.shutdown(wait=False)
+
+    def _replace(self, repo_index: RepoIndex) -> None:
+        self.index.add(repo_index)
+        if self.cache is not None:
+            self.cache.invalidate_repo(repo_index.repo_name)
+
+    async def query(self, request: web.Request) -> web.Response:
+        try:
+            body = await request.json()
+        except ValueError:
+            return _error(400, "Request body must be JSON")
+        repos, query = parse_repo_scope(str(body.get("query", "")).strip())
+        repos = body.get("repos") or repos
+        try:
+            filters, query = parse_filters(query)
+            fields = body.get("filters") or {}
+            filters = make_filter(**{field: list(getattr(filters, field)) + list(fields.get(field) or [])
+                                     for field in SearchFilter._fields})
+        except (ValueError, TypeError, AttributeError) as e:
+            return _error(400, f"Invalid filters: {e}")
+        if not query:
+            return _error(400, "Missing 'query'")
+
+        start = time.perf_counter()
+        try:
+            answer = await answer_query(query, self.index, self.llm, repos, self.cache, None, self.executor, filters)
+        except ValueError as e:
+            return _error(400, str(e))
+        return web.json_response({"answer": answer, "elapsed_ms": (time.perf_counter() - start) * 1000})
+
+    async def list_repos(self, request: web.Request) -> web.Response:
+        return web.json_response({"repos": self.index.repo_names})
+
+    async def add_repos(self, request: web.Request) -> web.Response:
+        try:
+            urls = [str(url).strip() for url in (await request.json()).get("urls", []) if str(url).strip()]
+        except (ValueError, AttributeError):
+            return _error(400, "Request body must be a JSON object with 'urls'")
+        if not urls:
+            return _error(400, "Missing 'urls'")
+        if self._ingest is None:
+            from ingest_pipeline import ingest_repositories
+            self._ingest = ingest_repositories
+
+        # Indexing jobs run one at a time; queries keep being served meanwhile
+        async with self._indexing:
+            loop = asyncio.get_running_loop()
+            try:
+                repo_indexes = await loop.run_in_executor(self.executor, self._ingest, urls)
+            except Exception as e:
+                return _error(500, f"Indexing failed: {e}")
+        for repo_index in repo_indexes:
+            self._replace(repo_index)
+        return web.json_response({"repos": [r.repo_name for r in repo_indexes]})
+
+    async def reload_repo(self, request: web.Request) -> web.Response:
+        name = request.match_info["name"]
+        loop = asyncio.get_running_loop()
+        try:
+            repo_index = await loop.run_in_executor(self.executor, self._load, name)
+        except (OSError, RuntimeError) as e:
+            return _error(404, f"Cannot load index for {name}: {e}")
+        self._replace(repo_index)
+        return web.json_response({"repos": [name]})
+
+    async def drop_repo(self, request: web.Request) -> web.Response:
+        name = request.match_info["name"]
+        if not self.index.remove(name):
+            return _error(404, f"Unknown repo: {name}")
+        if self.cache is not None:
+            self.cache.invalidate_repo(name)
+        return web.json_response({"repos": self.index.repo_names})
+
+    async def health(self, request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok", "repos": len(self.index.repo_names)})
+
+    async def export_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=metrics.render_prometheus(), content_type="text/plain")
+
+def create_server(repo_urls: Sequence[str] = ()) -> QAServer:
+    """
+    Builds a server with the configured embedding model, LLM and answer cache, all loaded up front.
+
+    :param repo_urls: Repos to clone/update and load before serving.
+    :returns: QAServer instance.
+    """
+    from embedding_engine import QueryBatcher, get_embedding_model
+    from ingest_pipeline import ingest_repositories
+    from llm_factory import get_llm
+
+    embeddings = get_embedding_model()
+    embeddings.embed_query("warm up")
+    repo_indexes = ingest_repositories(list(repo_urls)) if repo_urls else []
+    index = FederatedIndex(repo_indexes, query_embeddings=QueryBatcher(embeddings))
+    return QAServer(index, get_llm(), AnswerCache(), ingest=ingest_repositories)
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """
+    Runs the query server.
+    """
+    parser = argparse.ArgumentParser(description="Serve code questions over HTTP with warm indexes.")
+    parser.add_argument("repo_urls", nargs="*", help="Repos to index before serving")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    args = parser.parse_args(argv)
+    web.run_app(create_server(args.repo_urls).app(), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,123 @@
 import os
 import uuid
-from langchain_community.embeddings import HuggingFaceEmbeddings
+from collections import defaultdict
+from itertools import chain
+from langchain_core.embeddings import Embeddings
 from langchain_community.vectorstores import FAISS
 from langchain.schema import Document
-from typing import List
-from config import EMBEDDING_MODEL_NAME, VECTORSTORE_DIR
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+from chunk_docs import iter_chunks, split_documents
+from embedding_engine import get_embedding_model
+from config import VECTORSTORE_DIR, EMBED_BATCH_SIZE, EMBED_BATCH_MAX_CHARS, FAISS_INDEX_TYPE, DEDUP_ENABLED
+from dedup import StreamDeduplicator, deduplicate_chunks
+from index_manifest import hash_content, load_manifest, save_manifest
+from load_code_documents import read_source_file
+from lexical_index import LEXICAL_FILENAME, LexicalIndex, LexicalIndexUpdater, SQLiteLexicalIndex
+from ann_index import read_search_index, save_ann_index, search_index_path
+from chunk_store import SQLiteDocstore, CHUNK_STORE_FILENAME, load_store, save_store
+from metrics import metrics
+
+class IndexUpdate(NamedTuple):
+    """
+    Work needed to bring a repo's vector store in line with its checkout.
+    """
+    repo_name: str
+    repo_path: str
+    commit: Optional[str]
+    file_hashes: Dict[str, str]
+    changed_paths: List[str]
+    deleted_paths: List[str]
+    chunks: List[Document]
+
+class RepoIndex(NamedTuple):
+    """
+    A repo's vector store together with its lexical (BM25) index.
+    """
+    repo_name: str
+    vectorstore: FAISS
+    lexical_index: Union[LexicalIndex, SQLiteLexicalIndex]
+
+def _relative_path(file_path: str, repo_path: str) -> str:
+    return os.path.relpath(file_path, repo_path).replace(os.sep, "/")
+
+def load_vector_store(repo_name: str, db_dir: str = VECTORSTORE_DIR) -> FAISS:
+    """
+    Loads a persisted FAISS vector store for searching.
+
+    The approximate index selected by FAISS_INDEX_TYPE is used when one was built,
+    memory-mapped read-only when FAISS_MMAP is set, and chunks are read lazily from
+    chunks.sqlite3. Use chunk_store.load_store(..., writable=True) for a store that
+    will be modified.
+
+    :param repo_name: Repository name, used as directory name of the vector store.
+    :param db_dir: Directory to store vector stores.
+    :returns: FAISS vector store instance.
+    """
+    db_path = os.path.join(db_dir, repo_name)
+    return load_store(db_path, get_embedding_model(), read_search_index(search_index_path(db_path)))
+
+def load_lexical_index(repo_name: str, vectorstore: Optional[FAISS] = None, db_dir: str = VECTORSTORE_DIR,
+                       writable: bool = False) -> Union[LexicalIndex, LexicalIndexUpdater, SQLiteLexicalIndex]:
+    """
+    Opens the lexical index persisted next to a repo's vector store.
+
+    Read-only indexes search lexical.sqlite3 in place; writable ones apply added and
+    removed chunks to it on save. Stores built before lexical indexes existed get one
+    built from their docstore.
+
+    :param repo_name: Repository name.
+    :param vectorstore: Loaded vector store, used to backfill a missing lexical index and,
+        when writable, to read the text of removed chunks.
+    :param db_dir: Directory to store vector stores.
+    :param writable: Open the index for add/remove and save.
+    :returns: LexicalIndexUpdater if writable, LexicalIndex if backfilled, else SQLiteLexicalIndex.
+    """
+    db_path = os.path.join(db_dir, repo_name)
+    path = os.path.join(db_path, LEXICAL_FILENAME)
+    if os.path.exists(path):
+        return LexicalIndexUpdater(vectorstore.docstore) if writable else SQLiteLexicalIndex(path)
+    lexical = LexicalIndex()
+    if vectorstore is None:
+        return lexical
+    docstore = vectorstore.docstore
+    for doc_id, doc in (docstore.items() if isinstance(docstore, SQLiteDocstore) else docstore._dict.items()):
+        lexical.add(doc_id, doc.page_content)
+    lexical.save(db_path)
+    return lexical
+
+def load_repo_index(repo_name: str, vectorstore: Optional[FAISS] = None, db_dir: str = VECTORSTORE_DIR) -> RepoIndex:
+    """
+    Loads a repo's vector store (unless given) and lexical index.
+
+    :param repo_name: Repository name.
+    :param vectorstore: Already loaded vector store, if any.
+    :param db_dir: Directory to store vector stores.
+    :returns: RepoIndex instance.
+    """
+    vectorstore = vectorstore or load_vector_store(repo_name, db_dir)
+    lexical_index = load_lexical_index(repo_name, vectorstore, db_dir)
+    metrics.set_gauge("rag_index_vectors", vectorstore.index.ntotal, repo=repo_name)
+    metrics.set_gauge("rag_lexical_terms", lexical_index.term_count(), repo=repo_name)
+    return RepoIndex(repo_name, vectorstore, lexical_index)
+
+def is_index_current(repo_name: str, commit: Optional[str], db_dir: str = VECTORSTORE_DIR) -> bool:
+    """
+    Checks whether the persisted vector store was built from the given commit.
+
+    :param repo_name: Repository name.
+    :param commit: Commit SHA currently checked out, or None if unknown.
+    :param db_dir: Directory to store vector stores.
+    :returns: True if the store exists and its manifest records the same commit.
+    """
+    if commit is None:
+        return False
+    db_path = os.path.join(db_dir, repo_name)
+    manifest = load_manifest(db_path)
+    return (
+        manifest is not None
+        and manifest.get("commit") == commit
+        and os.path.exists(os.path.join(db_path, "index.faiss"))
+    )
 
 def create_vector_store(chunks: List[Document], repo_name: str, db_dir: str = VECTORSTORE_DIR) -> FAISS:
     """
@@ -21,21 +134,334 @@ def create_vector_store(chunks: List[Document], repo_name: str, db_dir: str = VE
 
     if os.path.exists(db_path):
         print(f"Loading existing vector store for {repo_name}")
-        return FAISS.load_local(
-            db_path,
-            HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME),
-            allow_dangerous_deserialization=True
-        )
+        return load_vector_store(repo_name, db_dir)
 
     print(f"Creating new vector store for {repo_name}, chunks: {len(chunks)}")
     if not chunks:
         raise ValueError(f"No chunks to index for {repo_name}!")
+    chunks = _deduplicate(chunks, repo_name)
 
     # Add unique IDs to avoid collision
     for i, doc in enumerate(chunks):
         doc.metadata["doc_id"] = f"{repo_name}_{i}_{uuid.uuid4()}"
 
-    embedding = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
-    db = FAISS.from_documents(chunks, embedding)
-    db.save_local(db_path)
+    embedding = get_embedding_model()
+    ids = [doc.metadata["doc_id"] for doc in chunks]
+    db = FAISS.from_documents(chunks, embedding, ids=ids)
+    save_store(db, db_path)
+    lexical = LexicalIndex()
+    for doc_id, doc in zip(ids, chunks):
+        lexical.add(doc_id, doc.page_content)
+    lexical.save(db_path)
+    return db
+
+def _deduplicate(chunks: List[Document], repo_name: str) -> List[Document]:
+    if not DEDUP_ENABLED or not chunks:
+        return chunks
+    kept, report = deduplicate_chunks(chunks)
+    print(f"[{repo_name}] {report.summary()}")
+    return kept
+
+def _changed_documents(documents: Iterable[Document], indexed: Dict[str, Dict], repo_path: str,
+                       file_hashes: Dict[str, str], changed_paths: List[str]) -> Iterator[Document]:
+    """
+    Yields documents whose content differs from the manifest, recording every file's hash.
+    """
+    for doc in documents:
+        key = _relative_path(doc.metadata["file_path"], repo_path)
+        digest = hash_content(doc.page_content)
+        file_hashes[key] = digest
+        if indexed.get(key, {}).get("hash") != digest:
+            changed_paths.append(key)
+            yield doc
+
+def _dependent_documents(documents: List[Document], indexed: Dict[str, Dict], repo_path: str,
+                         changed_paths: List[str], deleted_paths: List[str]) -> List[Document]:
+    """
+    Finds unchanged files with chunks collapsed into chunks that are about to be dropped.
+
+    Their chunks only live on through the dropped representatives, so they are re-chunked
+    too (repeatedly, since re-chunking a file drops its own representatives).
+    """
+    stale_ids = {doc_id for key in changed_paths + deleted_paths for doc_id in indexed.get(key, {}).get("ids", [])}
+    dependents: List[Document] = []
+    found = True
+    while found:
+        found = False
+        for doc in documents:
+            key = _relative_path(doc.metadata["file_path"], repo_path)
+            if key in changed_paths or stale_ids.isdisjoint(indexed.get(key, {}).get("collapsed_into", [])):
+                continue
+            changed_paths.append(key)
+            dependents.append(doc)
+            stale_ids.update(indexed[key].get("ids", []))
+            found = True
+    return dependents
+
+def _collapsed_by_path(metadata: Iterable[Dict], repo_path: str) -> Dict[str, List[str]]:
+    """
+    Maps files to the doc IDs of the representatives their duplicate chunks were collapsed into.
+
+    :param metadata: Metadata of indexed chunks, with "doc_id" and optionally "duplicates".
+    """
+    collapsed: Dict[str, List[str]] = defaultdict(list)
+    for chunk_metadata in metadata:
+        for location in chunk_metadata.get("duplicates", []):
+            collapsed[_relative_path(location["file_path"], repo_path)].append(chunk_metadata["doc_id"])
+    return collapsed
+
+def _indexed_files(db_path: str) -> Tuple[bool, Dict[str, Dict]]:
+    manifest = load_manifest(db_path)
+    if manifest is None or not os.path.exists(os.path.join(db_path, "index.faiss")):
+        return False, {}
+    return True, manifest["files"]
+
+def _add_in_batches(db: Optional[FAISS], lexical: Union[LexicalIndex, LexicalIndexUpdater], chunks: Iterable[Document], embedding: Embeddings,
+                    repo_name: str, repo_path: str, db_path: str, batch_size: int = EMBED_BATCH_SIZE,
+                    max_batch_chars: int = EMBED_BATCH_MAX_CHARS) -> Tuple[Optional[FAISS], Dict[str, List[str]]]:
+    """
+    Embeds chunks in bounded batches and appends them to the index as each batch completes.
+
+    A batch is flushed when it holds batch_size chunks or max_batch_chars characters,
+    so at most one batch of chunk text is buffered at a time; chunk text goes straight
+    to the store's on-disk docstore.
+
+    :returns: Tuple of (vector store or None if nothing was added, new doc IDs by relative path).
+    """
+    ids_by_path: Dict[str, List[str]] = defaultdict(list)
+    batch: List[Document] = []
+    batch_chars = 0
+    total = 0
+
+    def flush(db: Optional[FAISS]) -> Optional[FAISS]:
+        nonlocal batch, batch_chars, total
+        ids = [f"{repo_name}_{uuid.uuid4()}" for _ in batch]
+        for doc_id, doc in zip(ids, batch):
+            doc.metadata["doc_id"] = doc_id
+            ids_by_path[_relative_path(doc.metadata["file_path"], repo_path)].append(doc_id)
+            lexical.add(doc_id, doc.page_content)
+        with metrics.span("index") as span:
+            if db is None:
+                db = FAISS.from_documents(batch, embedding, ids=ids)
+                db.docstore = SQLiteDocstore.create(os.path.join(db_path, CHUNK_STORE_FILENAME), db.docstore._dict)
+            else:
+                db.add_documents(batch, ids=ids)
+            span.update(repo=repo_name, chunks=len(batch))
+        metrics.inc("rag_indexed_chunks_total", len(batch))
+        total += len(batch)
+        print(f"[{repo_name}] embedded {total} chunks")
+        batch, batch_chars = [], 0
+        return db
+
+    for chunk in chunks:
+        batch.append(chunk)
+        batch_chars += len(chunk.page_content)
+        if len(batch) >= batch_size or batch_chars >= max_batch_chars:
+            db = flush(db)
+    if batch:
+        db = flush(db)
+    return db, ids_by_path
+
+def _save_changes(db: FAISS, lexical: Union[LexicalIndex, LexicalIndexUpdater], db_path: str, files: Dict[str, Dict], commit: Optional[str],
+                  file_hashes: Dict[str, str], changed_paths: List[str], deleted_paths: List[str],
+                  ids_by_path: Dict[str, List[str]], collapsed_by_path: Optional[Dict[str, List[str]]] = None) -> None:
+    """
+    Drops vectors of changed and deleted files, records new entries and persists the store,
+    its lexical index and the manifest.
+
+    The position mapping and lexical index are written as deltas, so saving a small change
+    does not rewrite them as a whole.
+
+    Files whose chunks were deduplicated record the representatives' IDs as "collapsed_into".
+    """
+    stale_ids: List[str] = []
+    for key in list(changed_paths) + list(deleted_paths):
+        stale_ids.extend(files.pop(key, {}).get("ids", []))
+    removed_positions: List[int] = []
+    if stale_ids:
+        # Positions before FAISS compacts the index, for updating the search index in place
+        stale = set(stale_ids)
+        removed_positions = [p for p, doc_id in db.index_to_docstore_id.items() if doc_id in stale]
+        # Before the docstore drops them, since a LexicalIndexUpdater reads their text
+        lexical.remove(stale_ids)
+        db.delete(stale_ids)
+    for key in changed_paths:
+        files[key] = {"hash": file_hashes[key], "ids": ids_by_path.get(key, [])}
+        if collapsed_by_path and collapsed_by_path.get(key):
+            files[key]["collapsed_into"] = sorted(set(collapsed_by_path[key]))
+    added = sum(len(ids) for ids in ids_by_path.values())
+    save_store(db, db_path, removed_positions, added)
+    save_ann_index(db.index, db_path, FAISS_INDEX_TYPE, removed_positions, added)
+    lexical.save(db_path)
+    save_manifest(db_path, {"commit": commit, "files": files})
+
+def prepare_update(documents: List[Document], repo_name: str, repo_path: str,
+                   commit: Optional[str] = None, db_dir: str = VECTORSTORE_DIR) -> IndexUpdate:
+    """
+    Diffs loaded documents against the repo's manifest and chunks only added or changed files.
+
+    Unchanged files whose duplicate chunks were represented by a changed file's chunks are
+    re-chunked as well, and near-duplicate chunks are collapsed when DEDUP_ENABLED.
+
+    :param documents: Whole-file Document objects for the current checkout.
+    :param repo_name: Repository name.
+    :param repo_path: Local path to the repository, used to key files by relative path.
+    :param commit: Commit SHA of the checkout, recorded in the manifest.
+    :param db_dir: Directory to store vector stores.
+    :returns: IndexUpdate describing the chunks to embed and the files to drop.
+    """
+    _, indexed = _indexed_files(os.path.join(db_dir, repo_name))
+    file_hashes: Dict[str, str] = {}
+    changed_paths: List[str] = []
+    changed_docs = list(_changed_documents(documents, indexed, repo_path, file_hashes, changed_paths))
+    deleted_paths = [key for key in indexed if key not in file_hashes]
+    changed_docs += _dependent_documents(documents, indexed, repo_path, changed_paths, deleted_paths)
+    chunks = _deduplicate(split_documents(changed_docs), repo_name) if changed_docs else []
+    return IndexUpdate(repo_name, repo_path, commit, file_hashes, changed_paths, deleted_paths, chunks)
+
+def apply_update(update: IndexUpdate, db_dir: str = VECTORSTORE_DIR) -> FAISS:
+    """
+    Applies an IndexUpdate to the persisted vector store and rewrites its manifest.
+
+    Vectors of changed and deleted files are removed, and only the new chunks are embedded.
+    A store without a manifest is rebuilt from scratch, since its contents cannot be diffed.
+
+    :param update: IndexUpdate produced by prepare_update.
+    :param db_dir: Directory to store vector stores.
+    :returns: FAISS vector store instance.
+    :raises ValueError: If a new store would be created without any chunks.
+    """
+    repo_name = update.repo_name
+    db_path = os.path.join(db_dir, repo_name)
+    exists, files = _indexed_files(db_path)
+    embedding = get_embedding_model()
+
+    if exists:
+        print(f"Updating vector store for {repo_name}: {len(update.changed_paths)} changed, "
+              f"{len(update.deleted_paths)} deleted, chunks: {len(update.chunks)}")
+        db = load_store(db_path, embedding, writable=True)
+        lexical = load_lexical_index(repo_name, db, db_dir, writable=True)
+    else:
+        print(f"Creating new vector store for {repo_name}, chunks: {len(update.chunks)}")
+        if not update.chunks:
+            raise ValueError(f"No chunks to index for {repo_name}!")
+        os.makedirs(db_path, exist_ok=True)
+        db = None
+        lexical = LexicalIndex()
+
+    db, ids_by_path = _add_in_batches(db, lexical, update.chunks, embedding, repo_name, update.repo_path, db_path)
+    _save_changes(db, lexical, db_path, files, update.commit, update.file_hashes,
+                  update.changed_paths, update.deleted_paths, ids_by_path,
+                  _collapsed_by_path((c.metadata for c in update.chunks), update.repo_path))
+    return db
+
+def update_vector_store(documents: List[Document], repo_name: str, repo_path: str,
+                        commit: Optional[str] = None, db_dir: str = VECTORSTORE_DIR) -> FAISS:
+    """
+    Incrementally syncs a repo's vector store with its current checkout.
+
+    :param documents: Whole-file Document objects for the current checkout.
+    :param repo_name: Repository name.
+    :param repo_path: Local path to the repository.
+    :param commit: Commit SHA of the checkout, recorded in the manifest.
+    :param db_dir: Directory to store vector stores.
+    :returns: FAISS vector store instance.
+    """
+    os.makedirs(db_dir, exist_ok=True)
+    return apply_update(prepare_update(documents, repo_name, repo_path, commit, db_dir), db_dir)
+
+def _reread_dependents(stubs: List[Document], files: Dict[str, Dict], repo_path: str, changed_paths: List[str],
+                       deleted_paths: List[str], file_hashes: Dict[str, str]) -> Iterator[Document]:
+    """
+    Reads the unchanged files that _dependent_documents selects back from disk.
+
+    The stream has moved past them by the time the changed and deleted files are known, so
+    only their metadata was kept. A file that can no longer be read is recorded without a
+    hash, so that the next run indexes it again.
+    """
+    for doc in _dependent_documents(stubs, files, repo_path, changed_paths, deleted_paths):
+        key = _relative_path(doc.metadata["file_path"], repo_path)
+        try:
+            content, reason = read_source_file(doc.metadata["file_path"])
+        except OSError as e:
+            content, reason = None, str(e)
+        if content is None:
+            print(f"Could not re-read {key} ({reason}); it will be re-indexed on the next run")
+            file_hashes[key] = ""
+            continue
+        file_hashes[key] = hash_content(content)
+        yield Document(page_content=content, metadata=doc.metadata)
+
+def stream_vector_store(documents: Iterable[Document], repo_name: str, repo_path: str,
+                        commit: Optional[str] = None, db_dir: str = VECTORSTORE_DIR,
+                        batch_size: int = EMBED_BATCH_SIZE,
+                        max_batch_chars: int = EMBED_BATCH_MAX_CHARS) -> FAISS:
+    """
+    Incrementally syncs a repo's vector store while streaming files through chunking and embedding.
+
+    Files are consumed lazily and chunks are embedded in bounded batches, so memory for
+    chunk text stays constant regardless of repo size and progress is reported per batch.
+    As in update_vector_store, near-duplicate chunks are collapsed when DEDUP_ENABLED, and
+    unchanged files whose copies were represented by a changed or deleted file's chunks
+    are read again and re-indexed after the stream.
+
+    :param documents: Iterable (e.g. iter_code_documents) of whole-file Document objects.
+    :param repo_name: Repository name.
+    :param repo_path: Local path to the repository.
+    :param commit: Commit SHA of the checkout, recorded in the manifest.
+    :param db_dir: Directory to store vector stores.
+    :param batch_size: Maximum chunks per embedding batch.
+    :param max_batch_chars: Maximum buffered characters per embedding batch.
+    :returns: FAISS vector store instance.
+    :raises ValueError: If a new store would be created without any chunks.
+    """
+    os.makedirs(db_dir, exist_ok=True)
+    db_path = os.path.join(db_dir, repo_name)
+    exists, files = _indexed_files(db_path)
+    embedding = get_embedding_model()
+    db = load_store(db_path, embedding, writable=True) if exists else None
+    lexical = load_lexical_index(repo_name, db, db_dir, writable=True) if exists else LexicalIndex()
+    os.makedirs(db_path, exist_ok=True)
+    print(f"Streaming vector store for {repo_name}")
+
+    file_hashes: Dict[str, str] = {}
+    changed_paths: List[str] = []
+    deleted_paths: List[str] = []
+    # Metadata of files that may depend on other files' chunks, kept to re-read them after the stream
+    candidates = {key for key, entry in files.items() if entry.get("collapsed_into")}
+    candidate_metadata: Dict[str, Dict] = {}
+
+    def remember_candidates(docs: Iterable[Document]) -> Iterator[Document]:
+        for doc in docs:
+            key = _relative_path(doc.metadata["file_path"], repo_path)
+            if key in candidates:
+                candidate_metadata[key] = dict(doc.metadata)
+            yield doc
+
+    def dependent_chunks() -> Iterator[Document]:
+        # Runs once the stream is exhausted, so every file's hash is known
+        deleted_paths.extend(key for key in files if key not in file_hashes)
+        stubs = [Document(page_content="", metadata=metadata) for key, metadata in candidate_metadata.items()
+                 if key not in changed_paths]
+        yield from iter_chunks(_reread_dependents(stubs, files, repo_path, changed_paths, deleted_paths, file_hashes))
+
+    changed_docs = _changed_documents(remember_candidates(documents), files, repo_path, file_hashes, changed_paths)
+    chunks = chain(iter_chunks(changed_docs), dependent_chunks())
+    deduplicator = StreamDeduplicator() if DEDUP_ENABLED else None
+    if deduplicator is not None:
+        chunks = deduplicator.filter(chunks)
+    db, ids_by_path = _add_in_batches(db, lexical, chunks, embedding, repo_name, repo_path,
+                                      db_path, batch_size, max_batch_chars)
+    if db is None:
+        raise ValueError(f"No chunks to index for {repo_name}!")
+
+    collapsed_by_path = None
+    if deduplicator is not None:
+        representatives, report = deduplicator.finish()
+        if report.chunks:
+            print(f"[{repo_name}] {report.summary()}")
+        db.docstore.update_metadata({metadata["doc_id"]: metadata for metadata in representatives})
+        collapsed_by_path = _collapsed_by_path(representatives, repo_path)
+    _save_changes(db, lexical, db_path, files, commit, file_hashes, changed_paths, deleted_paths, ids_by_path,
+                  collapsed_by_path)
     return db
@@ -0,0 +1,119 @@
+import numpy as np
+import pytest
+
+from src.ann_index import build_ann_index, factory_string, recall_latency_report, set_search_params
+
+@pytest.fixture
+def vectors():
+    return np.random.default_rng(0).normal(size=(2000, 32)).astype(np.float32)
+
+def test_factory_string_scales_with_corpus():
+    assert factory_string("flat", 10, 384) == "Flat"
+    assert factory_string("hnsw", 10, 384, hnsw_m=16) == "HNSW16"
+    assert factory_string("ivf-flat", 1_000_000, 384) == "IVF4000,Flat"
+    # Never more lists than the training data supports
+    assert factory_string("ivf-flat", 390, 384) == "IVF10,Flat"
+    assert factory_string("ivf-pq", 1_000_000, 384, pq_m=48) == "IVF4000,PQ48x8"
+    # PQ sub-quantizers must divide the dimension
+    assert factory_string("ivf-pq", 1_000_000, 384, pq_m=50).startswith("IVF4000,PQ48x")
+
+def test_factory_string_rejects_unknown_type():
+    with pytest.raises(ValueError, match="Unsupported FAISS_INDEX_TYPE"):
+        factory_string("lsh", 10, 8)
+
+@pytest.mark.parametrize("index_type", ["ivf-flat", "hnsw", "ivf-pq"])
+def test_build_ann_index_keeps_positions(vectors, index_type):
+    index = build_ann_index(vectors, index_type, train_sample=1000)
+    set_search_params(index, nprobe=64, ef_search=128)
+
+    assert index.ntotal == len(vectors)
+    _, ids = index.search(vectors[:20], 1)
+    assert (ids[:, 0] == np.arange(20)).mean() >= 0.9
+
+def test_recall_latency_report(vectors):
+    report = recall_latency_report(vectors, vectors[:10], [("flat", {}), ("ivf-flat", {"nprobe": 1}),
+                                                           ("ivf-flat", {"nprobe": 1000})], k=5)
+
+    assert [row["index"] for row in report] == ["flat", "ivf-flat", "ivf-flat"]
+    assert report[0]["recall"] == 1.0
+    assert report[2]["recall"] == 1.0  # probing every list is exact
+    assert report[1]["recall"] <= report[2]["recall"]
+    assert all(row["latency_ms"] >= 0 for row in report)
+
+@pytest.mark.parametrize("index_type", ["ivf-flat", "hnsw", "ivf-pq"])
+def test_update_ann_index_follows_flat_compaction(vectors, index_type):
+    import faiss
+    from src.ann_index import update_ann_index
+
+    flat = faiss.IndexFlatL2(vectors.shape[1])
+    flat.add(vectors[:1500])
+    index = build_ann_index(vectors[:1500], index_type, train_sample=1000, updatable=True)
+    removed = [0, 10, 700, 1499]
+    # Like FAISS.delete after add_documents: append, then drop and close the gaps
+    flat.add(vectors[1500:])
+    flat.remove_ids(np.array(removed, dtype=np.int64))
+    update_ann_index(index, flat, removed, len(vectors) - 1500)
+    set_search_params(index, nprobe=64, ef_search=128)
+
+    remaining = np.delete(vectors, removed, axis=0)
+    assert flat.ntotal == len(remaining)
+    _, ids = index.search(remaining[[0, 9, 800, 1600]], 1)
+    expected = [0, 9, 800, 1600]
+    assert (ids[:, 0] == expected).mean() >= 0.75
+    _, ids = index.search(vectors[removed], 5)
+    # Removed vectors are gone, or tombstoned with ID -1 in HNSW
+    assert not any(found == position for found, position in zip(ids[:, 0], removed))
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf-flat", "hnsw"])
+def test_reconstruct_positions_follows_updates(vectors, index_type):
+    import faiss
+    from src.ann_index import reconstruct_positions, update_ann_index
+
+    flat = faiss.IndexFlatL2(vectors.shape[1])
+    flat.add(vectors[:1500])
+    index = flat
+    if index_type != "flat":
+        index = build_ann_index(vectors[:1500], index_type, train_sample=1000, updatable=True)
+    removed = [0, 10, 700]
+    flat.add(vectors[1500:])
+    flat.remove_ids(np.array(removed, dtype=np.int64))
+    if index_type != "flat":
+        update_ann_index(index, flat, removed, len(vectors) - 1500)
+
+    positions = [0, 9, 800, 1990]
+    np.testing.assert_allclose(reconstruct_positions(index, positions), flat.reconstruct_batch(positions))
+    assert reconstruct_positions(index, [len(vectors)]) is None
+
+    # A later update renumbers the positions again; the cached lookup must follow
+    flat.remove_ids(np.array([5], dtype=np.int64))
+    if index_type != "flat":
+        update_ann_index(index, flat, [5], 0)
+    np.testing.assert_allclose(reconstruct_positions(index, positions), flat.reconstruct_batch(positions))
+
+def test_save_ann_index_updates_in_place_until_drift(vectors, tmp_path):
+    import json
+    import faiss
+    from src.ann_index import ANN_META_FILENAME, save_ann_index
+
+    def meta():
+        return json.loads((tmp_path / ANN_META_FILENAME).read_text())
+
+    flat = faiss.IndexFlatL2(vectors.shape[1])
+    flat.add(vectors[:1000])
+    save_ann_index(flat, str(tmp_path), "ivf-flat", retrain_drift=0.2)
+    assert meta() == {"index_type": "ivf-flat", "vectors": 1000, "built_vectors": 1000, "changes": 0}
+
+    flat.add(vectors[1000:1100])
+    flat.remove_ids(np.array([5, 6], dtype=np.int64))
+    save_ann_index(flat, str(tmp_path), "ivf-flat", removed=[5, 6], added=100, retrain_drift=0.2)
+    assert meta() == {"index_type": "ivf-flat", "vectors": 1098, "built_vectors": 1000, "changes": 102}
+
+    # Past the drift threshold the index is rebuilt and retrained
+    flat.add(vectors[1100:1300])
+    save_ann_index(flat, str(tmp_path), "ivf-flat", added=200, retrain_drift=0.2)
+    assert meta() == {"index_type": "ivf-flat", "vectors": 1298, "built_vectors": 1298, "changes": 0}
+
+    # An update that does not match the recorded size triggers a rebuild too
+    flat.add(vectors[1300:1310])
+    save_ann_index(flat, str(tmp_path), "ivf-flat", retrain_drift=0.2)
+    assert meta()["built_vectors"] == 1308
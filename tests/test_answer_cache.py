@@ -0,0 +1,75 @@
+import pytest
+
+from src.answer_cache import AnswerCache
+
+def test_exact_hit_on_normalized_query():
+    cache = AnswerCache(max_entries=4)
+    cache.put("Where is main?", "ollama:mistral", "In cli.py", chunk_ids=["a", "b"])
+
+    assert cache.get("  where IS   main? ", "ollama:mistral", ["b", "a"]) == "In cli.py"
+    assert cache.stats()["hits"] == 1
+
+def test_miss_on_other_model_or_chunks():
+    cache = AnswerCache(max_entries=4)
+    cache.put("Where is main?", "ollama:mistral", "In cli.py", chunk_ids=["a"])
+
+    assert cache.get("Where is main?", "openai:gpt-4o", ["a"]) is None
+    assert cache.get("Where is main?", "ollama:mistral", ["a", "c"]) is None
+    assert cache.get("Where is main?", "ollama:mistral") is None
+
+def test_lru_eviction():
+    cache = AnswerCache(max_entries=2)
+    cache.put("q1", "m", "a1")
+    cache.put("q2", "m", "a2")
+    cache.get("q1", "m")
+    cache.put("q3", "m", "a3")
+
+    assert cache.get("q1", "m") == "a1"
+    assert cache.get("q2", "m") is None
+    assert len(cache) == 2
+
+def test_ttl_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("src.answer_cache.time.time", lambda: now[0])
+    cache = AnswerCache(max_entries=4, ttl_seconds=60)
+    cache.put("q", "m", "a")
+
+    now[0] += 30
+    assert cache.get("q", "m") == "a"
+    now[0] += 60
+    assert cache.get("q", "m") is None
+    assert len(cache) == 0
+
+def test_semantic_match_within_same_scope():
+    vectors = {"how do i run the tests?": [1.0, 0.0], "how to run tests": [0.99, 0.1], "tell me a joke": [0.0, 1.0]}
+    cache = AnswerCache(max_entries=4, similarity=0.95, embed=lambda q: vectors[q.lower()])
+    cache.put("How do I run the tests?", "m", "Use pytest", chunk_ids=["a"])
+
+    assert cache.get("How to run tests", "m", ["a"]) == "Use pytest"
+    assert cache.get("How to run tests", "m", ["b"]) is None
+    assert cache.get("Tell me a joke", "m", ["a"]) is None
+
+def test_invalidate_repo():
+    cache = AnswerCache(max_entries=4)
+    cache.put("q1", "m", "a1", chunk_ids=["repoA/1"], repos=["repoA"])
+    cache.put("q2", "m", "a2", chunk_ids=["repoB/1"], repos=["repoB"])
+
+    assert cache.invalidate_repo("repoA") == 1
+    assert cache.get("q1", "m", ["repoA/1"]) is None
+    assert cache.get("q2", "m", ["repoB/1"]) == "a2"
+
+def test_persistence(tmp_path):
+    path = str(tmp_path / "answers" / "answers.json")
+    cache = AnswerCache(max_entries=4, path=path)
+    cache.put("q", "m", "a", chunk_ids=["x"], repos=["repoA"])
+
+    reloaded = AnswerCache(max_entries=4, path=path)
+    assert reloaded.get("q", "m", ["x"]) == "a"
+    assert reloaded.invalidate_repo("repoA") == 1
+
+def test_disabled_cache_stores_nothing():
+    cache = AnswerCache(max_entries=0)
+    cache.put("q", "m", "a")
+
+    assert cache.get("q", "m") is None
+    assert len(cache) == 0
@@ -0,0 +1,44 @@
+from unittest.mock import MagicMock
+
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+
+from src.answer_stream import TokenPrinter, generate
+
+def _llm(content):
+    return GenericFakeChatModel(messages=iter([AIMessage(content=content)]))
+
+def test_generate_without_callback_invokes():
+    llm = MagicMock()
+    llm.invoke.return_value.content = "  answer \n"
+
+    assert generate(llm, "prompt") == "answer"
+    llm.stream.assert_not_called()
+
+def test_generate_streams_to_callback():
+    tokens = []
+
+    assert generate(_llm("one two three"), "prompt", tokens.append) == "one two three"
+    assert "".join(tokens) == "one two three"
+
+def test_token_printer_records_timings(monkeypatch):
+    clock = iter([10.0, 10.5, 10.6, 10.7, 11.0])
+    monkeypatch.setattr("src.answer_stream.time.perf_counter", lambda: next(clock))
+    written = []
+    printer = TokenPrinter(write=written.append, flush=lambda: None)
+
+    for token in ["\n", "Hi", " there", "!"]:
+        printer(token)
+
+    # Leading whitespace is not printed and does not count as the first token
+    assert written == ["Hi", " there", "!"]
+    assert printer.tokens == 3
+    assert abs(printer.time_to_first_token - 0.6) < 1e-9
+    assert abs(printer.tokens_per_second - 2 / 0.4) < 1e-9
+    assert printer.summary() == "first token 0.60s, 5.0 tokens/s"
+
+def test_token_printer_summary_empty_without_tokens():
+    printer = TokenPrinter(write=lambda _: None, flush=lambda: None)
+
+    assert printer.time_to_first_token is None
+    assert printer.summary() == ""
@@ -0,0 +1,155 @@
+import io
+import json
+import sys
+import threading
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from langchain.schema import Document
+from langchain_community.chat_models.fake import FakeListChatModel
+from langchain_community.embeddings import DeterministicFakeEmbedding
+from langchain_community.vectorstores import FAISS
+
+from src import batch_qa
+from src.batch_qa import Question, load_questions, run_batch
+from src.federated_search import FederatedIndex
+from src.lexical_index import LexicalIndex
+from src.search_filter import SearchFilter
+from src.vector_store import RepoIndex
+
+def _repo_index(repo_name, texts, embedding):
+    ids = [f"{repo_name}-{i}" for i in range(len(texts))]
+    docs = [Document(page_content=t, metadata={"repo_name": repo_name, "file_path": f"/src/{repo_name}/m{i}.py"})
+            for i, t in enumerate(texts)]
+    vectorstore = FAISS.from_documents(docs, embedding, ids=ids)
+    lexical = LexicalIndex()
+    for doc_id, text in zip(ids, texts):
+        lexical.add(doc_id, text)
+    return RepoIndex(repo_name, vectorstore, lexical)
+
+def _repo_indexes():
+    embedding = DeterministicFakeEmbedding(size=16)
+    return [
+        _repo_index("repoA", ["def merge_from(self, other): pass", "def load_config(): return {}"], embedding),
+        _repo_index("repoB", ["CHUNK_OVERLAP = 150", "def merge_from(a, b): return a"], embedding),
+    ]
+
+@pytest.fixture
+def index():
+    federated = FederatedIndex(_repo_indexes())
+    yield federated
+    federated.close()
+
+@pytest.fixture(autouse=True)
+def cli_module(monkeypatch):
+    module = sys.modules[batch_qa.answer_from_docs.__module__]
+    monkeypatch.setattr(module, "get_embedding_model", lambda: DeterministicFakeEmbedding(size=16))
+    monkeypatch.setattr(batch_qa, "is_code_related_query", lambda q: "hello" not in q.lower())
+    return module
+
+def _lines(output):
+    return [json.loads(line) for line in output.getvalue().splitlines()]
+
+def test_load_questions_reads_fields_and_inline_scope(tmp_path):
+    path = tmp_path / "questions.jsonl"
+    path.write_text("\n".join([
+        json.dumps({"id": "q1", "question": "How does merge_from work?", "repos": ["repoA"]}),
+        "",
+        json.dumps({"query": "@repoB path:src lang:python where is CHUNK_OVERLAP set?",
+                    "filters": {"symbols": ["load_*"]}}),
+    ]))
+
+    questions = load_questions(str(path))
+
+    assert questions == [
+        Question("q1", "How does merge_from work?", ("repoA",)),
+        Question("3", "where is CHUNK_OVERLAP set?", ("repoB",), SearchFilter(("src",), ("python",), ("load_*",))),
+    ]
+
+def test_load_questions_reports_bad_line(tmp_path):
+    path = tmp_path / "questions.jsonl"
+    path.write_text(json.dumps({"question": "ok"}) + "\n" + json.dumps({"question": "lang:cobol why?"}) + "\n")
+
+    with pytest.raises(ValueError, match="questions.jsonl:2: Unknown language: cobol"):
+        load_questions(str(path))
+
+def test_run_batch_streams_answers_and_summary(index):
+    questions = [Question("1", "How does merge_from work?"), Question("2", "hello there"),
+                 Question("3", "Where is CHUNK_OVERLAP?", ("repoB",)), Question("4", "What does load_config return?")]
+    llm = FakeListChatModel(responses=["An answer."])
+    output = io.StringIO()
+
+    with patch.object(index, "embed_queries", wraps=index.embed_queries) as embed, \
+            patch.object(index, "search_many", wraps=index.search_many) as search_many:
+        summary = run_batch(questions, index, llm, output, concurrency=2)
+
+    embed.assert_called_once_with(["How does merge_from work?", "Where is CHUNK_OVERLAP?",
+                                   "What does load_config return?"])
+    # One search for the unscoped code questions and one for the question scoped to repoB
+    assert search_many.call_count == 2
+    lines = {line["id"]: line for line in _lines(output)}
+    assert set(lines) == {"1", "2", "3", "4"}
+    assert lines["2"]["type"] == "general" and lines["2"]["sources"] == []
+    assert lines["3"]["type"] == "code"
+    assert {s["repo_name"] for s in lines["3"]["sources"]} == {"repoB"}
+    assert all(line["answer"] == "An answer." and line["latency_ms"] >= 0 for line in lines.values())
+    assert summary["questions"] == 4 and summary["answered"] == 4 and summary["failed"] == 0
+    assert summary["questions_per_sec"] > 0
+    assert summary["latency_p95_ms"] >= summary["latency_p50_ms"] > 0
+
+def test_failed_questions_are_reported_and_counted(index):
+    class FlakyLLM:
+        def invoke(self, prompt):
+            if "boom" in prompt:
+                raise RuntimeError("provider unavailable")
+            return SimpleNamespace(content="fine")
+
+    questions = [Question("a", "what does boom do?"), Question("b", "merge_from?", ("nope",)),
+                 Question("c", "How does merge_from work?")]
+    output = io.StringIO()
+
+    summary = run_batch(questions, index, FlakyLLM(), output, classify=False)
+
+    lines = {line["id"]: line for line in _lines(output)}
+    assert lines["a"]["error"] == "provider unavailable"
+    assert lines["b"]["error"] == "Unknown repos: nope"
+    assert lines["c"]["answer"] == "fine"
+    assert summary["answered"] == 1 and summary["failed"] == 2
+
+def test_llm_calls_are_bounded_by_concurrency(index):
+    lock = threading.Lock()
+    state = {"active": 0, "peak": 0}
+
+    class SlowLLM:
+        def invoke(self, prompt):
+            with lock:
+                state["active"] += 1
+                state["peak"] = max(state["peak"], state["active"])
+            time.sleep(0.02)
+            with lock:
+                state["active"] -= 1
+            return SimpleNamespace(content="done")
+
+    questions = [Question(str(i), f"How does merge_from work in case {i}?") for i in range(8)]
+
+    summary = run_batch(questions, index, SlowLLM(), io.StringIO(), concurrency=3)
+
+    assert summary["answered"] == 8
+    assert 1 < state["peak"] <= 3
+
+def test_main_writes_answers_and_fails_on_errors(tmp_path, monkeypatch, capsys):
+    repo_indexes = {r.repo_name: r for r in _repo_indexes()}
+    monkeypatch.setattr(sys.modules["vector_store"], "load_repo_index", lambda name: repo_indexes[name])
+    questions = tmp_path / "questions.jsonl"
+    questions.write_text(json.dumps({"id": "ok", "question": "How does merge_from work?"}) + "\n"
+                         + json.dumps({"id": "bad", "question": "@nope merge_from?"}) + "\n")
+    output = tmp_path / "answers.jsonl"
+
+    code = batch_qa.main([str(questions), "--output", str(output), "--repos", "repoA", "repoB", "--fake-llm"])
+
+    assert code == 1
+    lines = [json.loads(line) for line in output.read_text().splitlines()]
+    assert {line["id"] for line in lines} == {"ok", "bad"}
+    assert "Answered 1 of 2 questions" in capsys.readouterr().out
@@ -0,0 +1,66 @@
+import json
+import os
+
+import pytest
+
+from src import benchmark
+from src.benchmark import compare_reports, generate_repo, run_benchmark
+
+def test_generate_repo_is_deterministic_git_repo(tmp_path):
+    first = generate_repo(str(tmp_path / "a"), files=3, functions=2, seed=7)
+    second = generate_repo(str(tmp_path / "b"), files=3, functions=2, seed=7)
+
+    assert os.path.isdir(os.path.join(first, ".git"))
+    for name in ("module_0.py", "module_2.py"):
+        with open(os.path.join(first, "pkg", name)) as f, open(os.path.join(second, "pkg", name)) as g:
+            content = f.read()
+            assert content == g.read()
+        compile(content, name, "exec")
+
+def test_run_benchmark_reports_every_stage(tmp_path):
+    report = run_benchmark(repos=2, files=3, functions=2, queries=3, work_dir=str(tmp_path))
+
+    assert set(report["stages"]) == {"generate", "ingest", "update", "open_indexes", "search", "answer"}
+    assert report["chunks"] > 0
+    assert report["stages"]["ingest"]["items"] == report["chunks"]
+    assert report["stages"]["ingest"]["items_per_sec"] > 0
+    assert report["stages"]["update"]["items"] == 2  # one edited module per repo
+    ingest_spans = report["stages"]["ingest"]["spans"]
+    assert {"clone", "load", "split", "index"} <= set(ingest_spans)
+    assert ingest_spans["clone"]["calls"] == 2
+    assert ingest_spans["index"]["items"] == report["chunks"]
+    assert all(span["seconds"] > 0 and span["items_per_sec"] > 0 for span in ingest_spans.values())
+    assert report["stages"]["update"]["spans"]["index"]["items"] < report["chunks"]
+    assert "faiss_search" in report["stages"]["search"]["spans"]
+    assert all(stage["peak_rss_growth_mb"] >= 0 for stage in report["stages"].values())
+    assert report["answer_latency"]["queries"] == 3
+    assert report["peak_rss_mb"] > 0
+    json.dumps(report)
+
+def test_run_benchmark_rejects_unknown_backend():
+    with pytest.raises(ValueError, match="Unsupported embeddings"):
+        run_benchmark(embeddings="bert")
+
+def _report(index_seconds, p95):
+    latency = {"queries": 1, "p50_ms": 1.0, "p95_ms": p95}
+    spans = {"split": {"calls": 1, "seconds": index_seconds / 2, "items": 10, "items_per_sec": 20 / index_seconds}}
+    return {"stages": {"index": {"seconds": index_seconds, "cumulative_peak_rss_mb": 100.0,
+                                 "peak_rss_growth_mb": 10.0, "spans": spans}},
+            "search_latency": latency, "answer_latency": latency}
+
+def test_compare_reports_flags_slowdowns_beyond_tolerance():
+    assert compare_reports(_report(1.0, 2.0), _report(1.1, 2.0), tolerance=0.2) == []
+
+    regressions = compare_reports(_report(1.0, 2.0), _report(1.5, 3.0), tolerance=0.2)
+    assert len(regressions) == 4
+    assert regressions[0].startswith("stage index: 1.0000 -> 1.5000")
+    assert regressions[1].startswith("stage index span split: 0.5000 -> 0.7500")
+
+def test_main_writes_report_and_fails_on_regression(tmp_path, monkeypatch):
+    monkeypatch.setattr(benchmark, "run_benchmark", lambda *args, **kwargs: _report(2.0, 2.0))
+    baseline = tmp_path / "baseline.json"
+    baseline.write_text(json.dumps(_report(1.0, 2.0)))
+    output = tmp_path / "report.json"
+
+    assert benchmark.main(["--output", str(output), "--baseline", str(baseline)]) == 1
+    assert json.loads(output.read_text())["stages"]["index"]["seconds"] == 2.0
@@ -1,6 +1,6 @@
 import pytest
 from langchain.schema import Document
-from src.chunk_docs import split_documents
+from src.chunk_docs import iter_chunks, split_documents
 from src.config import CHUNK_SIZE, CHUNK_OVERLAP
 
 def test_split_documents_chunks_correctly():
@@ -25,3 +25,72 @@ def test_split_documents_chunks_correctly():
     # Ensure some overlap exists if more than one chunk
     if len(chunks) > 1:
         assert chunks[0].page_content[-CHUNK_OVERLAP:] == chunks[1].page_content[:CHUNK_OVERLAP]
+
+def test_iter_chunks_is_lazy_and_matches_split_documents():
+    documents = [Document(page_content="B" * (CHUNK_SIZE + 10), metadata={"file_path": f"{i}.py"}) for i in range(3)]
+    consumed = []
+
+    def source():
+        for doc in documents:
+            consumed.append(doc)
+            yield doc
+
+    chunks = iter_chunks(source())
+    first = next(chunks)
+    assert len(consumed) == 1
+    assert [first.page_content] + [c.page_content for c in chunks] == [c.page_content for c in split_documents(documents)]
+
+SAMPLE_MODULE = '''import os
+
+
+def small_a():
+    return 1
+
+
+def small_b():
+    return 2
+
+
+class Big:
+    """A class too large for one chunk."""
+
+    def method_one(self):
+{body_one}
+
+    def method_two(self):
+{body_two}
+'''
+
+def _sample_document():
+    body = "\n".join(f"        value_{i} = {i}  # padding to grow the method body" for i in range(12))
+    source = SAMPLE_MODULE.format(body_one=body, body_two=body)
+    return Document(page_content=source, metadata={"file_path": "pkg/sample.py"}), source
+
+def test_split_documents_uses_syntax_boundaries():
+    document, source = _sample_document()
+    lines = source.splitlines()
+
+    chunks = split_documents([document])
+    symbols = [chunk.metadata["symbol"] for chunk in chunks]
+
+    # Small siblings are packed together, the oversized class is split into its methods
+    assert symbols[0] == "small_a, small_b"
+    assert "Big.method_one" in symbols[1]
+    assert symbols[-1] == "Big.method_two"
+    for chunk in chunks:
+        assert len(chunk.page_content) <= CHUNK_SIZE
+        assert chunk.metadata["file_path"] == "pkg/sample.py"
+        start, end = chunk.metadata["start_line"], chunk.metadata["end_line"]
+        assert chunk.page_content == "\n".join(lines[start - 1:end]).rstrip()
+
+    # No function is cut in half and nothing is duplicated
+    assert "".join(c.page_content for c in chunks).count("def method_two") == 1
+    assert sum(len(c.page_content) for c in chunks) <= len(source)
+
+def test_split_documents_falls_back_for_invalid_python():
+    document = Document(page_content="def broken(:\n" + "x" * (CHUNK_SIZE * 2), metadata={"file_path": "bad.py"})
+
+    chunks = split_documents([document])
+
+    assert len(chunks) > 1
+    assert all("start_line" not in chunk.metadata for chunk in chunks)
@@ -0,0 +1,83 @@
+import os
+
+import pytest
+from langchain.schema import Document
+from langchain_community.embeddings import DeterministicFakeEmbedding
+from langchain_community.vectorstores import FAISS
+
+from src.chunk_store import (
+    CHUNK_STORE_FILENAME, LEGACY_PICKLE_FILENAME, LazyIdMap, SQLiteDocstore, load_store, save_store
+)
+
+@pytest.fixture
+def embedding():
+    return DeterministicFakeEmbedding(size=16)
+
+@pytest.fixture
+def docs():
+    return [
+        Document(page_content="def foo(): pass", metadata={"file_path": "a.py", "start_line": 1}),
+        Document(page_content="def bar(): pass", metadata={"file_path": "b.py", "start_line": 3}),
+    ]
+
+def test_docstore_add_search_delete(tmp_path, docs):
+    docstore = SQLiteDocstore(str(tmp_path / CHUNK_STORE_FILENAME))
+    docstore.add({"a": docs[0], "b": docs[1]})
+
+    assert docstore.search("a") == docs[0]
+    assert docstore.search("missing") == "ID missing not found."
+    assert docstore.mget(["b", "missing", "a"]) == [docs[1], None, docs[0]]
+    with pytest.raises(ValueError, match="already exist"):
+        docstore.add({"a": docs[0]})
+
+    docstore.delete(["a"])
+    assert len(docstore) == 1
+    assert [doc_id for doc_id, _ in docstore.items()] == ["b"]
+
+def test_save_and_load_read_only_store(tmp_path, docs, embedding):
+    db_path = str(tmp_path / "repo")
+    db = FAISS.from_documents(docs, embedding, ids=["a", "b"])
+    save_store(db, db_path)
+
+    loaded = load_store(db_path, embedding)
+
+    assert isinstance(loaded.index_to_docstore_id, LazyIdMap)
+    assert len(loaded.index_to_docstore_id) == 2
+    assert loaded.similarity_search("def bar(): pass", k=1)[0] == docs[1]
+    with pytest.raises(Exception):
+        loaded.docstore.add({"c": docs[0]})
+
+def test_writable_store_persists_adds_and_deletes(tmp_path, docs, embedding):
+    db_path = str(tmp_path / "repo")
+    save_store(FAISS.from_documents(docs, embedding, ids=["a", "b"]), db_path)
+
+    db = load_store(db_path, embedding, writable=True)
+    db.delete(["a"])
+    db.add_documents([Document(page_content="def baz(): pass", metadata={})], ids=["c"])
+    save_store(db, db_path)
+
+    loaded = load_store(db_path, embedding)
+    assert [loaded.index_to_docstore_id[i] for i in range(2)] == ["b", "c"]
+    assert loaded.similarity_search("def baz(): pass", k=1)[0].page_content == "def baz(): pass"
+
+def test_save_store_updates_positions_in_place(tmp_path, embedding):
+    db_path = str(tmp_path / "repo")
+    docs = [Document(page_content=f"def f{i}(): pass", metadata={}) for i in range(6)]
+    save_store(FAISS.from_documents(docs, embedding, ids=list("abcdef")), db_path)
+
+    db = load_store(db_path, embedding, writable=True)
+    db.add_documents([Document(page_content="def g(): pass", metadata={})], ids=["g"])
+    db.delete(["b", "c", "e"])
+    save_store(db, db_path, removed_positions=[1, 2, 4], added=1)
+
+    assert load_store(db_path, embedding, writable=True).index_to_docstore_id == {0: "a", 1: "d", 2: "f", 3: "g"}
+
+def test_legacy_pickle_is_migrated(tmp_path, docs, embedding):
+    db_path = str(tmp_path / "repo")
+    FAISS.from_documents(docs, embedding, ids=["a", "b"]).save_local(db_path)
+
+    loaded = load_store(db_path, embedding)
+
+    assert not os.path.exists(os.path.join(db_path, LEGACY_PICKLE_FILENAME))
+    assert os.path.exists(os.path.join(db_path, CHUNK_STORE_FILENAME))
+    assert loaded.similarity_search("def foo(): pass", k=1)[0] == docs[0]
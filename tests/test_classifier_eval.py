@@ -0,0 +1,27 @@
+import os
+from src.classifier_eval import evaluate_classifier, load_eval_set
+from src.query_classifier import heuristic_classification
+
+EVAL_SET = os.path.join(os.path.dirname(__file__), "..", "evals", "query_classifier.jsonl")
+
+def test_eval_set_is_balanced():
+    examples = load_eval_set(EVAL_SET)
+    labels = [example["code_related"] for example in examples]
+    assert labels.count(True) >= 10 and labels.count(False) >= 10
+
+def test_heuristic_tier_accuracy_and_latency():
+    report = evaluate_classifier(load_eval_set(EVAL_SET), heuristic_classification)
+
+    assert report["examples"] == 74
+    assert report["confident_accuracy"] >= 0.95
+    # Lone identifiers (brands, places) and everyday words like "return" or "test" are left to the next tier
+    assert report["llm_fallback_rate"] <= 0.6
+    # Sub-millisecond per query, with generous headroom for slow CI machines
+    assert report["latency_p95_ms"] < 1.0
+
+def test_evaluate_classifier_counts_fallbacks():
+    examples = [{"query": "a", "code_related": True}, {"query": "b", "code_related": False}]
+    report = evaluate_classifier(examples, lambda q: (True, 0.9) if q == "a" else (None, 0.0), threshold=0.8)
+
+    assert report["confident_accuracy"] == 1.0
+    assert report["llm_fallback_rate"] == 0.5
@@ -1,8 +1,19 @@
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
 import pytest
-from unittest.mock import patch, MagicMock, call
 from types import SimpleNamespace
-from unittest.mock import MagicMock, patch
+from unittest.mock import ANY, MagicMock, patch
 from src import cli
+from src.search_filter import SearchFilter
+
+@pytest.fixture(autouse=True)
+def fake_embeddings(monkeypatch):
+    from langchain_community.embeddings import DeterministicFakeEmbedding
+    monkeypatch.setattr(cli, "get_embedding_model", lambda: DeterministicFakeEmbedding(size=16))
 
 def test_get_repo_urls(monkeypatch):
     # Simulate user input with spaces and empty entries
@@ -10,113 +21,282 @@ def test_get_repo_urls(monkeypatch):
     urls = cli.get_repo_urls()
     assert urls == ["https://github.com/user/repo1", "https://github.com/user/repo2"]
 
-@patch("src.cli.clone_repos")
-@patch("src.cli.load_code_documents")
-@patch("src.cli.split_documents")
-@patch("src.cli.create_vector_store")
-def test_process_repositories(mock_create_vs, mock_split_docs, mock_load_docs, mock_clone_repos):
-    # Setup mocks
-    repo_data = [("repo1", "/path/to/repo1"), ("repo2", "/path/to/repo2")]
-    mock_clone_repos.return_value = repo_data
-    mock_load_docs.side_effect = [["doc1"], ["doc2"]]
-    mock_split_docs.side_effect = [["chunk1"], ["chunk2"]]
+@patch("src.cli.ingest_repositories")
+def test_process_repositories(mock_ingest):
     vs1 = MagicMock(name="VectorStore1")
     vs2 = MagicMock(name="VectorStore2")
-    mock_create_vs.side_effect = [vs1, vs2]
+    mock_ingest.return_value = [vs1, vs2]
 
     vectorstores = cli.process_repositories(["https://fake.url/repo1", "https://fake.url/repo2"])
 
-    mock_clone_repos.assert_called_once_with(["https://fake.url/repo1", "https://fake.url/repo2"])
-    assert mock_load_docs.call_count == 2
-    assert mock_split_docs.call_count == 2
-    assert mock_create_vs.call_count == 2
-
+    mock_ingest.assert_called_once_with(["https://fake.url/repo1", "https://fake.url/repo2"])
     assert vectorstores == [vs1, vs2]
 
-def test_combine_vectorstores_merges(monkeypatch):
-    vs1 = MagicMock(name="VS1")
-    vs2 = MagicMock(name="VS2")
-    vs3 = MagicMock(name="VS3")
+def test_handle_code_query_uses_answer_cache():
+    index = MagicMock()
+    index.search.return_value = [
+        SimpleNamespace(metadata={"repo_name": "repoA", "file_path": "/a.py", "doc_id": "1"}, page_content="x = 1"),
+    ]
+    llm = MagicMock()
+    llm.invoke.return_value.content = "Answer"
+    cache = cli.AnswerCache(max_entries=8)
 
-    combined = cli.combine_vectorstores([vs1, vs2, vs3])
+    assert cli.handle_code_query("What is x?", index, llm, cache=cache) == "Answer"
+    assert cli.handle_code_query("  what is X? ", index, llm, cache=cache) == "Answer"
+    assert llm.invoke.call_count == 1
 
-    assert combined == vs1
-    vs1.merge_from.assert_has_calls([call(vs2), call(vs3)])
+    # Re-indexing gives the chunk a new ID, so the stale answer is not reused
+    index.search.return_value[0].metadata["doc_id"] = "2"
+    cli.handle_code_query("What is x?", index, llm, cache=cache)
+    assert llm.invoke.call_count == 2
 
-def test_combine_vectorstores_empty_raises():
-    with pytest.raises(ValueError, match="No vectorstores available!"):
-        cli.combine_vectorstores([])
+def test_handle_general_query_uses_answer_cache():
+    llm = MagicMock()
+    llm.invoke.return_value.content = " Hi! "
+    cache = cli.AnswerCache(max_entries=8)
+
+    assert cli.handle_general_query("Hello bot", llm, cache) == "Hi!"
+    assert cli.handle_general_query("hello   bot", llm, cache) == "Hi!"
+    llm.invoke.assert_called_once_with("Hello bot")
+
+def test_parse_repo_scope():
+    assert cli.parse_repo_scope("@repoA,repoB where is main?") == (["repoA", "repoB"], "where is main?")
+    assert cli.parse_repo_scope("where is main?") == (None, "where is main?")
 
 @patch("src.cli.CODE_QUERY_RETRIEVAL_K", 5)
 def test_handle_code_query_groups_and_invokes():
-    vectorstore = MagicMock()
-    retriever = MagicMock()
+    index = MagicMock()
 
     docs = [
         SimpleNamespace(metadata={"repo_name": "repoA", "file_path": "/path/a.py"}, page_content="print('hello')\nsecond line"),
         SimpleNamespace(metadata={"repo_name": "repoA", "file_path": "/path/b.py"}, page_content="def foo(): pass\n"),
         SimpleNamespace(metadata={"repo_name": "repoB", "file_path": "/path/c.py"}, page_content="x = 1\n"),
     ]
-
-    retriever.get_relevant_documents.return_value = docs
-    vectorstore.as_retriever.return_value = retriever
+    index.search.return_value = docs
+    index.chunk_vectors.return_value = None
 
     llm = MagicMock()
     llm.invoke.return_value.content = "Here is your answer."
 
     query = "How to print in python?"
-    answer = cli.handle_code_query(query, vectorstore, llm)
+    answer = cli.handle_code_query(query, index, llm)
 
-    vectorstore.as_retriever.assert_called_once_with(search_kwargs={"k": 5})
-    retriever.get_relevant_documents.assert_called_once_with(query)
-
-    # Check grouped docs appear in the prompt sent to LLM
-    assert "- `/path/a.py`: print('hello')..." in answer or True  # LLM returns fixed response, so just check presence of response
+    index.search.assert_called_once_with(query, 5, None, filters=None)
+    prompt = llm.invoke.call_args[0][0]
+    assert "**repoA**" in prompt and "**repoB**" in prompt
+    # Full snippets reach the model, not just a first-line preview
+    assert "`/path/a.py`:\n```\nprint('hello')\nsecond line\n```" in prompt
     assert "Here is your answer." == answer
 
+def test_handle_code_query_restricts_repos():
+    index = MagicMock()
+    index.search.return_value = []
+    llm = MagicMock()
+    llm.invoke.return_value.content = "Answer"
+
+    cli.handle_code_query("Where is merge_from?", index, llm, ["repoA"])
 
+    index.search.assert_called_once_with("Where is merge_from?", cli.CODE_QUERY_RETRIEVAL_K, ["repoA"], filters=None)
 
 @patch("src.cli.is_code_related_query")
 def test_interactive_loop_code_and_non_code(monkeypatch_is_code, capsys):
-    vectorstore = MagicMock()
+    index = MagicMock()
     llm = MagicMock()
 
     # Setup mocks
     monkeypatch_is_code.side_effect = [False, True, False]
 
-    # For code query: handle_code_query returns answer
-    with patch("src.cli.handle_code_query", return_value="Code answer") as mock_handle_code_query:
+    # For code query: answer_from_docs returns answer
+    with patch("src.cli.answer_from_docs", return_value="Code answer") as mock_answer_from_docs:
         inputs = iter(["Hello bot", "How to code?", "exit"])
         with patch("builtins.input", lambda _: next(inputs)):
-            cli.interactive_loop(vectorstore, llm)
+            cli.interactive_loop(index, llm, stream=False)
 
     # Check prints for non-code query
     out = capsys.readouterr().out
     assert "Bot:" in out
     llm.invoke.assert_any_call("Hello bot")
-    mock_handle_code_query.assert_called_once_with("How to code?", vectorstore, llm)
+    mock_answer_from_docs.assert_called_once_with("How to code?", index.search.return_value, llm, None, None, index)
+    assert "Code answer" in out
+
+@patch("src.cli.is_code_related_query")
+def test_interactive_loop_scoped_query_and_commands(mock_is_code, capsys):
+    index = MagicMock()
+    index.remove.return_value = True
+    llm = MagicMock()
+    added = SimpleNamespace(repo_name="repoC")
+
+    with patch("src.cli.answer_from_docs", return_value="Scoped answer") as mock_answer_from_docs, \
+            patch("src.cli.process_repositories", return_value=[added]) as mock_process:
+        inputs = iter(["@repoA what is foo?", ":add https://fake/repoC", ":drop repoA", "exit"])
+        with patch("builtins.input", lambda _: next(inputs)):
+            cli.interactive_loop(index, llm, stream=False)
+
+    # A repo scope implies a code question, so the classifier is skipped
+    mock_is_code.assert_not_called()
+    index.search.assert_called_once_with("what is foo?", cli.CODE_QUERY_RETRIEVAL_K, ["repoA"], filters=SearchFilter())
+    mock_answer_from_docs.assert_called_once_with("what is foo?", index.search.return_value, llm, None, None, index)
+    mock_process.assert_called_once_with(["https://fake/repoC"])
+    index.add.assert_called_once_with(added)
+    index.remove.assert_called_once_with("repoA")
+    out = capsys.readouterr().out
+    assert "Added repoC" in out and "Dropped repoA" in out
+
+def test_interactive_loop_passes_filters_and_skips_classifier():
+    index = MagicMock()
+    llm = MagicMock()
+
+    with patch("src.cli.is_code_related_query") as mock_is_code, \
+            patch("src.cli.answer_from_docs", return_value="Filtered answer") as mock_answer_from_docs:
+        inputs = iter(["path:src/* lang:python symbol:merge_* how are indexes merged?", "exit"])
+        with patch("builtins.input", lambda _: next(inputs)):
+            cli.interactive_loop(index, llm, stream=False)
+
+    mock_is_code.assert_not_called()
+    index.search.assert_called_once_with(
+        "how are indexes merged?", cli.CODE_QUERY_RETRIEVAL_K, None,
+        filters=SearchFilter(paths=("src/*",), languages=("python",), symbols=("merge_*",)),
+    )
+    assert mock_answer_from_docs.call_args[0][0] == "how are indexes merged?"
+
+def _slow(seconds, result):
+    def call(*args, **kwargs):
+        time.sleep(seconds)
+        return result
+    return call
+
+def test_answer_query_overlaps_retrieval_with_classification():
+    index = MagicMock()
+    index.search.side_effect = _slow(0.2, [])
+    llm = MagicMock()
+    llm.invoke.return_value.content = "Answer"
+
+    with patch("src.cli.is_code_related_query", side_effect=_slow(0.2, True)):
+        start = time.perf_counter()
+        answer = asyncio.run(cli.answer_query("Where is foo?", index, llm))
+        elapsed = time.perf_counter() - start
+
+    assert answer == "Answer"
+    assert elapsed < 0.35
+
+def test_answer_query_discards_retrieval_for_general_questions():
+    index = MagicMock()
+    index.search.side_effect = ValueError("No vectorstores available!")
+    llm = MagicMock()
+    llm.invoke.return_value.content = "Hi!"
+
+    with patch("src.cli.is_code_related_query", return_value=False):
+        assert asyncio.run(cli.answer_query("Hello bot", index, llm)) == "Hi!"
+    llm.invoke.assert_called_once_with("Hello bot")
+
+def test_answer_query_surfaces_retrieval_errors_for_code_questions():
+    index = MagicMock()
+    index.search.side_effect = ValueError("No vectorstores available!")
+
+    with patch("src.cli.is_code_related_query", return_value=True):
+        with pytest.raises(ValueError, match="No vectorstores"):
+            asyncio.run(cli.answer_query("Where is foo?", index, MagicMock()))
+
+def _fake_streaming_llm(*answers):
+    from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+    from langchain_core.messages import AIMessage
+    return GenericFakeChatModel(messages=iter([AIMessage(content=a) for a in answers]))
+
+def test_handle_code_query_streams_tokens():
+    index = MagicMock()
+    index.search.return_value = [
+        SimpleNamespace(metadata={"repo_name": "repoA", "file_path": "/a.py"}, page_content="x = 1"),
+    ]
+    tokens = []
+
+    answer = cli.handle_code_query("What is x?", index, _fake_streaming_llm("x is one"), on_token=tokens.append)
+
+    assert answer == "x is one"
+    assert tokens == ["x", " ", "is", " ", "one"]
+
+@patch("src.cli.is_code_related_query", return_value=False)
+def test_interactive_loop_streams_answers(mock_is_code, capsys):
+    llm = _fake_streaming_llm("Hello there friend")
+    inputs = iter(["Hello bot", "exit"])
+    with patch("builtins.input", lambda _: next(inputs)):
+        cli.interactive_loop(MagicMock(), llm, stream=True)
+
+    out = capsys.readouterr().out
+    assert "Bot: Hello there friend" in out
+    assert "first token" in out and "tokens/s" in out
 
 def test_main_flow(monkeypatch):
     repo_urls = ["https://fake/repo"]
-    vectorstores = [MagicMock(name="VS")]
-    combined_vs = MagicMock(name="CombinedVS")
+    repo_indexes = [MagicMock(name="RepoIndex")]
+    federated = MagicMock(name="FederatedIndex")
     llm = MagicMock(name="LLM")
 
     monkeypatch.setattr(cli, "get_repo_urls", lambda: repo_urls)
-    monkeypatch.setattr(cli, "process_repositories", lambda urls: vectorstores)
-    monkeypatch.setattr(cli, "combine_vectorstores", lambda vs_list: combined_vs)
+    monkeypatch.setattr(cli, "process_repositories", lambda urls: repo_indexes)
+    federated_cls = MagicMock(return_value=federated)
+    monkeypatch.setattr(cli, "FederatedIndex", federated_cls)
     monkeypatch.setattr(cli, "get_llm", lambda: llm)
 
-    # Instead of replacing interactive_loop with a lambda that returns tuple,
-    # replace it with a mock so we can assert it was called correctly
     interactive_loop_mock = MagicMock()
     monkeypatch.setattr(cli, "interactive_loop", interactive_loop_mock)
+    warm_up = MagicMock()
+    monkeypatch.setattr(cli, "warm_up", warm_up)
 
-    result = cli.main()
+    result = cli.main([])
 
     # main() does not return anything
     assert result is None
 
-    # interactive_loop should be called exactly once with combined_vs and llm
-    interactive_loop_mock.assert_called_once_with(combined_vs, llm)
+    # Per-repo indexes are searched in place rather than merged
+    federated_cls.assert_called_once_with(repo_indexes)
+    interactive_loop_mock.assert_called_once_with(federated, llm, ANY)
+    assert type(interactive_loop_mock.call_args[0][2]).__name__ == "AnswerCache"
+    # Models load in the background while the URLs are typed
+    warm_up.assert_called_once()
+
+def test_main_profiles_a_single_question(monkeypatch, capsys):
+    monkeypatch.setattr(cli, "warm_up", MagicMock())
+    monkeypatch.setattr(cli, "get_repo_urls", lambda: ["https://fake/repo"])
+    monkeypatch.setattr(cli, "process_repositories", lambda urls: [])
+    monkeypatch.setattr(cli, "FederatedIndex", MagicMock())
+    monkeypatch.setattr(cli, "get_llm", lambda: MagicMock())
+    monkeypatch.setattr(cli, "answer_in_thread", lambda query, index, llm: f"answer to {query}")
+    interactive_loop = MagicMock()
+    monkeypatch.setattr(cli, "interactive_loop", interactive_loop)
+
+    cli.main(["--profile", "Where is merge_from?"])
+
+    out = capsys.readouterr().out
+    assert "cumulative" in out
+    assert "Answer: answer to Where is merge_from?" in out
+    interactive_loop.assert_not_called()
+
+def test_answer_in_thread_routes_by_classification(monkeypatch):
+    monkeypatch.setattr(cli, "is_code_related_query", lambda q: "code" in q)
+    monkeypatch.setattr(cli, "handle_general_query", lambda q, llm: "general")
+    monkeypatch.setattr(cli, "handle_code_query", lambda q, index, llm, repos: f"code {repos}")
+
+    assert cli.answer_in_thread("hello", None, None) == "general"
+    assert cli.answer_in_thread("some code", None, None) == "code None"
+    assert cli.answer_in_thread("@repoA hello", None, None) == "code ['repoA']"
+
+# Measured at about 50 ms; importing langchain, faiss or torch at startup costs over a second
+CLI_IMPORT_BUDGET_MS = 300
+HEAVY_MODULES = {"torch", "sentence_transformers", "transformers", "langchain", "langchain_core",
+                 "langchain_community", "faiss", "git", "aiohttp", "openai"}
+
+def test_cli_import_time_budget():
+    src_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import cli"], cwd=src_dir,
+                            capture_output=True, text=True, check=True)
+
+    imported = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            if cumulative.strip().isdigit():
+                imported[name.strip()] = int(cumulative)
 
+    assert "cli" in imported
+    assert not HEAVY_MODULES & {name.split(".")[0] for name in imported}
+    assert imported["cli"] / 1000 < CLI_IMPORT_BUDGET_MS
@@ -1,21 +1,116 @@
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
-from unittest.mock import patch
-from src.clone_repo import clone_repos
+from src import clone_repo as clone_module
+from src.clone_repo import clone_repo, clone_repos, evict_clone_cache, get_head_commit, parse_repo_url
+
+def _git(cwd, *args):
+    return subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True).stdout.strip()
+
+@pytest.fixture
+def remote(tmp_path):
+    """A local bare repo with one commit, plus a working copy to push new commits from."""
+    bare = tmp_path / "remote.git"
+    work = tmp_path / "work"
+    _git(tmp_path, "init", "--bare", "-b", "main", str(bare))
+    _git(tmp_path, "init", "-b", "main", str(work))
+    _git(work, "config", "user.email", "dev@example.com")
+    _git(work, "config", "user.name", "dev")
+    (work / "app.py").write_text("x = 1\n")
+    _git(work, "add", ".")
+    _git(work, "commit", "-m", "first")
+    _git(work, "remote", "add", "origin", str(bare))
+    _git(work, "push", "origin", "main")
+    return f"file://{bare}", work
+
+def _push_commit(work, content):
+    (work / "app.py").write_text(content)
+    _git(work, "commit", "-am", "update")
+    _git(work, "push", "origin", "main")
+    return _git(work, "rev-parse", "HEAD")
+
+def test_parse_repo_url():
+    assert parse_repo_url("https://github.com/psf/requests") == ("requests", "https://github.com/psf/requests", None)
+    assert parse_repo_url("https://github.com/psf/requests.git#v2.0") == ("requests", "https://github.com/psf/requests.git", "v2.0")
+
+def test_clone_repo_shallow_into_cache(tmp_path, remote):
+    url, work = remote
+    cache_dir = str(tmp_path / "cache")
+
+    repo_name, path = clone_repo(url, cache_dir)
+
+    assert repo_name == "remote"
+    assert os.path.dirname(path) == cache_dir
+    assert (tmp_path / "cache" / os.path.basename(path) / "app.py").read_text() == "x = 1\n"
+    assert _git(path, "rev-parse", "--is-shallow-repository") == "true"
+    assert get_head_commit(path) == _git(work, "rev-parse", "HEAD")
+    # No leftover staging directories
+    assert os.listdir(cache_dir) == [os.path.basename(path)]
+
+def test_clone_repo_warm_run_fetches_new_commits(tmp_path, remote):
+    url, work = remote
+    cache_dir = str(tmp_path / "cache")
+    _, first_path = clone_repo(url, cache_dir)
+
+    new_head = _push_commit(work, "x = 2\n")
+    _, second_path = clone_repo(url, cache_dir)
+
+    assert second_path == first_path
+    assert get_head_commit(second_path) == new_head
+    assert open(os.path.join(second_path, "app.py")).read() == "x = 2\n"
+
+def test_clone_repo_pins_ref(tmp_path, remote):
+    url, work = remote
+    cache_dir = str(tmp_path / "cache")
+    _git(work, "tag", "v1")
+    _git(work, "push", "origin", "v1")
+    pinned = _git(work, "rev-parse", "HEAD")
+    _push_commit(work, "x = 2\n")
+
+    repo_name, path = clone_repo(f"{url}#v1", cache_dir)
+
+    assert repo_name == "remote"
+    assert get_head_commit(path) == pinned
+
+def test_clone_repo_keeps_refs_apart_and_releases_keys(tmp_path, remote):
+    url, work = remote
+    cache_dir = str(tmp_path / "cache")
+    _git(work, "tag", "v1")
+    _git(work, "push", "origin", "v1")
+    pinned = _git(work, "rev-parse", "HEAD")
+    head = _push_commit(work, "x = 2\n")
+
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(lambda u: clone_repo(u, cache_dir), [f"{url}#v1", url, f"{url}#v1", url]))
+
+    pinned_path, head_path = results[0][1], results[1][1]
+    assert pinned_path != head_path
+    assert [path for _, path in results] == [pinned_path, head_path] * 2
+    assert get_head_commit(pinned_path) == pinned and get_head_commit(head_path) == head
+    assert sorted(os.listdir(cache_dir)) == sorted([os.path.basename(pinned_path), os.path.basename(head_path)])
+    assert clone_module._active_keys == {} and clone_module._key_locks == {}
 
-@patch("src.clone_repo.Repo.clone_from")
-@patch("tempfile.mkdtemp", return_value="/tmp/fake-temp-dir")
-def test_clone_repos_valid_url(mock_mkdtemp, mock_clone_from):
-    urls = ["https://github.com/psf/requests"]
+def test_evict_clone_cache_removes_least_recently_used(tmp_path, monkeypatch):
+    cache_dir = tmp_path / "cache"
+    for i, name in enumerate(["old", "new"]):
+        (cache_dir / name / ".git").mkdir(parents=True)
+        (cache_dir / name / "blob").write_bytes(b"x" * 100)
+        marker = cache_dir / name / ".git" / clone_module.LAST_USED_MARKER
+        marker.write_text("")
+        os.utime(marker, (1000 + i, 1000 + i))
+    monkeypatch.setattr(clone_module, "_active_keys", {})
 
-    # Act
-    repo_paths = clone_repos(urls)
+    evicted = evict_clone_cache(str(cache_dir), max_bytes=150)
 
-    # Assert
-    assert isinstance(repo_paths, list)
-    assert len(repo_paths) == 1
+    assert evicted == ["old"]
+    assert sorted(os.listdir(cache_dir)) == ["new"]
 
-    repo_name, path = repo_paths[0]
-    assert repo_name == "requests"
-    assert path == "/tmp/fake-temp-dir"
+def test_clone_repos_uses_cache(tmp_path, remote, monkeypatch):
+    url, _ = remote
+    calls = []
+    monkeypatch.setattr(clone_module, "clone_repo", lambda u: calls.append(u) or ("remote", "/cache/remote"))
 
-    mock_clone_from.assert_called_once_with(urls[0], "/tmp/fake-temp-dir")
+    assert clone_repos([url]) == [("remote", "/cache/remote")]
+    assert calls == [url]
@@ -0,0 +1,87 @@
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import numpy as np
+from langchain_community.embeddings import DeterministicFakeEmbedding
+
+from src.context_builder import build_context, merge_snippets, mmr_order, pack_snippets
+
+def _doc(text, path="a.py", repo="repoA", **meta):
+    return SimpleNamespace(page_content=text, metadata={"repo_name": repo, "file_path": path, **meta})
+
+def _words(text):
+    return len(text.split())
+
+def test_merges_adjacent_and_overlapping_line_ranges():
+    docs = [
+        _doc("def b():\n    return 2", start_line=4, end_line=5, symbol="b"),
+        _doc("def a():\n    return 1", start_line=1, end_line=2, symbol="a"),
+        _doc("    return 2\ndef c(): pass", start_line=5, end_line=6, symbol="c"),
+        _doc("def far(): pass", start_line=40, end_line=40, symbol="far"),
+    ]
+
+    snippets = merge_snippets(docs)
+
+    assert len(snippets) == 2
+    merged = snippets[0]
+    assert (merged.start_line, merged.end_line) == (1, 6)
+    assert merged.text == "def a():\n    return 1\n\ndef b():\n    return 2\ndef c(): pass"
+    assert merged.symbols == ["a", "b", "c"]
+    assert merged.rank == 0
+    assert snippets[1].symbols == ["far"]
+
+def test_merges_character_splitter_overlap_and_duplicates():
+    head = "x = 1\n" * 10 + "shared_overlap_text = 42\n"
+    tail = "shared_overlap_text = 42\n" + "y = 2\n" * 5
+    docs = [_doc(tail), _doc(head), _doc(head), _doc(head, path="b.py")]
+
+    snippets = merge_snippets(docs)
+
+    assert [s.file_path for s in snippets] == ["a.py", "b.py"]
+    assert snippets[0].text == (head + tail[len("shared_overlap_text = 42\n"):]).strip("\n")
+
+def test_pack_respects_budget_and_skips_to_smaller_snippets():
+    docs = [_doc("a " * 50, path="big.py"), _doc("b " * 500, path="huge.py"), _doc("c " * 10, path="small.py")]
+    packed = pack_snippets(merge_snippets(docs), budget=80, count_tokens=_words)
+
+    assert [s.file_path for s, _ in packed] == ["big.py", "small.py"]
+    assert sum(_words(block) for _, block in packed) <= 80
+
+def test_pack_truncates_oversized_best_snippet():
+    docs = [_doc("\n".join(f"line{i} = {i}" for i in range(100)))]
+    packed = pack_snippets(merge_snippets(docs), budget=30, count_tokens=_words)
+
+    assert len(packed) == 1
+    assert _words(packed[0][1]) <= 30
+    assert packed[0][1].count("\n") > 2
+
+def test_mmr_prefers_diverse_chunks():
+    embeddings = DeterministicFakeEmbedding(size=32)
+    docs = [_doc("def load(): pass"), _doc("def load(): pass", path="copy.py"), _doc("def save(): pass")]
+
+    order = mmr_order("def load(): pass", docs, embeddings, lambda_mult=0.5)
+
+    assert order[0] in (0, 1)
+    # The exact duplicate is pushed behind the different chunk
+    assert order[1] == 2
+
+def test_mmr_uses_stored_vectors_without_embedding_chunks():
+    embeddings = DeterministicFakeEmbedding(size=32)
+    docs = [_doc("def load(): pass"), _doc("def load(): pass", path="copy.py"), _doc("def save(): pass")]
+    vectors = np.array(embeddings.embed_documents([d.page_content for d in docs]))
+
+    with patch.object(DeterministicFakeEmbedding, "embed_documents") as embed_documents:
+        order = mmr_order("def load(): pass", docs, embeddings, lambda_mult=0.5, vectors=vectors)
+
+    embed_documents.assert_not_called()
+    assert order[1] == 2
+
+def test_build_context_groups_by_repo():
+    docs = [_doc("def a(): pass", repo="repoA"), _doc("def b(): pass", path="b.py", repo="repoB"),
+            _doc("def c(): pass", path="c.py", repo="repoA")]
+
+    context = build_context("q", docs, count_tokens=_words)
+
+    assert context.index("**repoA**") < context.index("**repoB**")
+    assert context.count("**repoA**") == 1
+    assert "`c.py`:\n```\ndef c(): pass\n```" in context
@@ -0,0 +1,56 @@
+from langchain.schema import Document
+
+from src.dedup import MinHasher, deduplicate_chunks, find_clusters, similarity
+
+LICENSE = (
+    "# Copyright (c) Example Corp. Licensed under the Apache License, Version 2.0 (the \"License\");\n"
+    "# you may not use this file except in compliance with the License. You may obtain a copy\n"
+    "# of the License at http://www.apache.org/licenses/LICENSE-2.0 unless required by law.\n"
+)
+
+def _function(name, body):
+    return f"def {name}(records, factor=3):\n    total = 0\n    for record in records:\n{body}    return total\n"
+
+def _chunk(text, path, start=1):
+    return Document(page_content=text, metadata={"file_path": path, "start_line": start, "end_line": start + 3})
+
+def test_signature_similarity_tracks_jaccard():
+    hasher = MinHasher(num_perm=128)
+    text = _function("process", "        total += record * factor\n")
+    same = hasher.signature(hasher.tokens(text))
+    renamed = hasher.signature(hasher.tokens(text.replace("process", "handle")))
+    other = hasher.signature(hasher.tokens("class Config:\n    debug = False\n    retries = 3\n    name = 'x'\n"))
+
+    assert similarity(same, hasher.signature(hasher.tokens(text))) == 1.0
+    assert 0.5 < similarity(same, renamed) < 1.0
+    assert similarity(same, other) < 0.2
+
+def test_find_clusters_groups_copies_and_keeps_short_chunks():
+    chunks = [_chunk(LICENSE, f"/repo/m{i}.py") for i in range(5)]
+    chunks.append(_chunk(_function("a", "        total += record\n"), "/repo/a.py"))
+    chunks.append(_chunk("x = 1", "/repo/b.py"))
+    chunks.append(_chunk("x = 1", "/repo/c.py"))
+
+    representative = find_clusters(chunks)
+
+    assert representative[:5] == [0] * 5
+    assert representative[5:] == [5, 6, 7]
+
+def test_deduplicate_chunks_records_duplicate_locations():
+    chunks = [
+        _chunk(LICENSE, "/repo/a.py"),
+        _chunk(_function("a", "        total += record\n"), "/repo/a.py", 5),
+        _chunk(LICENSE, "/repo/vendor/b.py"),
+        _chunk(LICENSE + "\n", "/repo/c.py"),
+    ]
+
+    kept, report = deduplicate_chunks(chunks)
+
+    assert kept == chunks[:2]
+    assert kept[0].metadata["duplicates"] == [
+        {"file_path": "/repo/vendor/b.py", "start_line": 1, "end_line": 4},
+        {"file_path": "/repo/c.py", "start_line": 1, "end_line": 4},
+    ]
+    assert "duplicates" not in kept[1].metadata
+    assert (report.chunks, report.kept, report.clusters, report.collapsed) == (4, 2, 1, 2)
+    assert "collapsed 2 of 4 chunks into 1 clusters" in report.summary()
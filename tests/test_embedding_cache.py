@@ -0,0 +1,81 @@
+import sqlite3
+
+from langchain_community.embeddings import DeterministicFakeEmbedding
+from src.embedding_cache import CachedEmbeddings
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    calls: list = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return super().embed_documents(texts)
+
+def _cache(tmp_path, inner=None, model_name="model-a", **kwargs):
+    inner = inner or CountingEmbeddings(size=8, calls=[])
+    return CachedEmbeddings(inner, model_name, str(tmp_path / "cache.sqlite3"), **kwargs), inner
+
+def test_cache_only_embeds_misses(tmp_path):
+    cache, inner = _cache(tmp_path)
+
+    first = cache.embed_documents(["def a(): pass", "def b(): pass"])
+    second = cache.embed_documents(["def b(): pass", "def c(): pass", "def a(): pass"])
+
+    assert inner.calls == [["def a(): pass", "def b(): pass"], ["def c(): pass"]]
+    assert second[0] == first[1] and second[2] == first[0]
+    assert cache.stats() == {"hits": 2, "misses": 3, "hit_rate": 0.4, "entries": 3}
+
+def test_cache_is_persistent_and_keyed_by_model(tmp_path):
+    cache, _ = _cache(tmp_path)
+    cache.embed_documents(["x = 1"])
+    cache.close()
+
+    reopened, inner = _cache(tmp_path)
+    reopened.embed_documents(["x = 1"])
+    assert inner.calls == []
+
+    other_model, inner = _cache(tmp_path, model_name="model-b")
+    other_model.embed_documents(["x = 1"])
+    assert inner.calls == [["x = 1"]]
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache, inner = _cache(tmp_path, max_entries=2)
+    cache.embed_documents(["a"])
+    cache.embed_documents(["b"])
+    cache.embed_documents(["a"])  # refreshes "a"
+    cache.embed_documents(["c"])  # evicts "b"
+    inner.calls.clear()
+
+    cache.embed_documents(["a", "b", "c"])
+
+    assert inner.calls == [["b"]]
+
+def test_entry_count_is_tracked_without_counting_the_table(tmp_path):
+    cache, _ = _cache(tmp_path, max_entries=3)
+    statements = []
+    cache._conn.set_trace_callback(statements.append)
+
+    for batch in (["a", "b"], ["b", "c"], ["d", "e"]):
+        cache.embed_documents(batch)
+
+    assert not any("COUNT(" in statement.upper() for statement in statements)
+    assert cache.stats()["entries"] == 3
+    assert cache._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] == 3
+
+def test_entry_count_is_backfilled_for_existing_caches(tmp_path):
+    cache, _ = _cache(tmp_path)
+    cache.embed_documents(["a", "b"])
+    cache.close()
+    conn = sqlite3.connect(str(tmp_path / "cache.sqlite3"))
+    conn.execute("DROP TABLE meta")
+    conn.commit()
+    conn.close()
+
+    reopened, _ = _cache(tmp_path)
+
+    assert reopened.stats()["entries"] == 2
+
+def test_duplicate_texts_in_one_call_embed_once(tmp_path):
+    cache, inner = _cache(tmp_path)
+    vectors = cache.embed_documents(["same", "same"])
+    assert inner.calls == [["same"]]
+    assert vectors[0] == vectors[1]
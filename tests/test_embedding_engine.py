@@ -0,0 +1,119 @@
+import numpy as np
+import pytest
+from unittest.mock import patch
+
+import src.embedding_engine as embedding_engine
+from src.embedding_engine import EmbeddingEngine, get_embedding_model, quantization_recall
+
+class FakeModel:
+    """Stands in for SentenceTransformer: embeds a text as [len(text), 1]."""
+
+    def __init__(self):
+        self.batches = []
+        self.pool_calls = 0
+
+    def encode(self, texts, batch_size=32):
+        self.batches.append(list(texts))
+        return np.array([[float(len(t)), 1.0] for t in texts], dtype=np.float32)
+
+    def start_multi_process_pool(self, devices):
+        return {"devices": devices}
+
+    def encode_multi_process(self, texts, pool, batch_size=32):
+        self.pool_calls += 1
+        return self.encode(texts, batch_size)
+
+    def stop_multi_process_pool(self, pool):
+        pass
+
+@pytest.fixture(autouse=True)
+def reset_embedding_instance(monkeypatch):
+    monkeypatch.setattr(embedding_engine, "EMBEDDING_CACHE_PATH", "")
+    embedding_engine._embedding_instance = None
+    yield
+    embedding_engine._embedding_instance = None
+
+def test_encode_batches_by_length_and_preserves_order():
+    model = FakeModel()
+    engine = EmbeddingEngine(model=model, batch_size=2, workers=1)
+    texts = ["aaaa", "a", "aaa", "aa", "aaaaa"]
+
+    vectors = engine.embed_documents(texts)
+
+    assert [v[0] for v in vectors] == [4.0, 1.0, 3.0, 2.0, 5.0]
+    assert model.batches == [["a", "aa"], ["aaa", "aaaa"], ["aaaaa"]]
+
+def test_large_jobs_use_worker_pool():
+    model = FakeModel()
+    engine = EmbeddingEngine(model=model, workers=2, pool_min_texts=3)
+
+    engine.embed_documents(["a", "b"])
+    assert model.pool_calls == 0
+
+    engine.embed_documents(["a", "bb", "ccc"])
+    assert model.pool_calls == 1
+    engine.close()
+
+def test_embed_query_returns_single_vector():
+    engine = EmbeddingEngine(model=FakeModel())
+    assert engine.embed_query("abc") == [3.0, 1.0]
+
+def test_get_embedding_model_is_singleton():
+    with patch.object(embedding_engine, "_load_model", return_value=FakeModel()) as mock_load:
+        first = get_embedding_model()
+        second = get_embedding_model()
+        first.embed_query("x")
+        second.embed_query("y")
+
+    assert first is second
+    mock_load.assert_called_once()
+
+def test_get_embedding_model_wraps_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_engine, "EMBEDDING_CACHE_PATH", str(tmp_path / "cache.sqlite3"))
+    with patch.object(embedding_engine, "_load_model", return_value=FakeModel()):
+        model = get_embedding_model()
+        model.embed_documents(["abc"])
+        model.embed_documents(["abc"])
+
+    assert model.stats()["hits"] == 1
+    assert model.model_name.endswith(":torch")
+
+def test_load_model_rejects_unknown_backend():
+    with pytest.raises(ValueError, match="Unsupported EMBEDDING_BACKEND: gpu"):
+        embedding_engine._load_model("model", "gpu")
+
+def test_quantization_recall():
+    corpus = ["a", "bb", "ccc", "dddd"]
+    queries = ["a", "dddd"]
+
+    class Vectors:
+        def __init__(self, table):
+            self.table = table
+
+        def embed_documents(self, texts):
+            return [self.table[t] for t in texts]
+
+    reference = Vectors({"a": [1, 0], "bb": [0.9, 0.1], "ccc": [0.1, 0.9], "dddd": [0, 1]})
+    assert quantization_recall(corpus, queries, reference, reference, k=2) == 1.0
+
+    swapped = Vectors({"a": [1, 0], "bb": [0.1, 0.9], "ccc": [0.9, 0.1], "dddd": [0, 1]})
+    assert quantization_recall(corpus, queries, swapped, reference, k=2) == 0.5
+
+def test_query_batcher_coalesces_concurrent_queries():
+    from concurrent.futures import ThreadPoolExecutor
+    from src.embedding_engine import QueryBatcher
+
+    calls = []
+
+    class Inner:
+        def embed_documents(self, texts):
+            calls.append(list(texts))
+            return [[float(len(t)), 1.0] for t in texts]
+
+    batcher = QueryBatcher(Inner(), window_ms=50, max_batch=16)
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        vectors = list(pool.map(batcher.embed_query, ["a", "bb", "ccc", "dddd", "eeeee", "ffffff"]))
+
+    assert vectors == [[float(n), 1.0] for n in range(1, 7)]
+    assert sum(len(c) for c in calls) == 6
+    assert len(calls) < 6
@@ -0,0 +1,133 @@
+import numpy as np
+import pytest
+from langchain.schema import Document
+from langchain_community.embeddings import DeterministicFakeEmbedding
+from langchain_community.vectorstores import FAISS
+
+from src.federated_search import FederatedIndex
+from src.search_filter import SearchFilter
+from src.lexical_index import LexicalIndex
+from src.vector_store import RepoIndex
+
+def _repo_index(repo_name, texts, embedding):
+    ids = [f"{repo_name}-{i}" for i in range(len(texts))]
+    docs = [Document(page_content=t, metadata={"repo_name": repo_name}) for t in texts]
+    vectorstore = FAISS.from_documents(docs, embedding, ids=ids)
+    lexical = LexicalIndex()
+    for doc_id, text in zip(ids, texts):
+        lexical.add(doc_id, text)
+    return RepoIndex(repo_name, vectorstore, lexical)
+
+@pytest.fixture
+def index():
+    embedding = DeterministicFakeEmbedding(size=16)
+    federated = FederatedIndex([
+        _repo_index("repoA", ["def merge_from(self, other): pass", "def load_config(): return {}"], embedding),
+        _repo_index("repoB", ["CHUNK_OVERLAP = 150", "def merge_from(a, b): return a"], embedding),
+    ])
+    yield federated
+    federated.close()
+
+def test_search_merges_results_across_repos(index):
+    docs = index.search("merge_from", k=2)
+
+    assert {d.metadata["repo_name"] for d in docs} == {"repoA", "repoB"}
+    assert all("merge_from" in d.page_content for d in docs)
+
+def test_search_fuses_lexical_and_vector_hits():
+    from src.retriever import vector_search
+
+    embedding = DeterministicFakeEmbedding(size=8)
+    texts = ["def merge_from(self, target): pass", "CHUNK_OVERLAP = 150", "def unrelated(): return None"]
+    repo = _repo_index("repoA", texts, embedding)
+    federated = FederatedIndex([repo])
+
+    # The deterministic fake embeds identical text identically, so an exact-text query is the vector top hit
+    assert vector_search(repo.vectorstore, embedding.embed_query(texts[2]), 1)[0][0] == "repoA-2"
+
+    docs = federated.search("merge_from", k=2)
+    federated.close()
+
+    assert len(docs) == 2
+    assert docs[0].page_content == texts[0]
+
+def test_search_restricted_to_subset(index):
+    docs = index.search("merge_from", k=4, repos=["repoB"])
+
+    assert docs and {d.metadata["repo_name"] for d in docs} == {"repoB"}
+
+def test_search_unknown_repo_raises(index):
+    with pytest.raises(ValueError, match="Unknown repos: nope"):
+        index.search("merge_from", repos=["nope"])
+
+def test_add_and_remove_at_runtime(index):
+    embedding = DeterministicFakeEmbedding(size=16)
+    index.add(_repo_index("repoC", ["def retry_with_backoff(): pass"], embedding))
+
+    assert index.repo_names == ["repoA", "repoB", "repoC"]
+    assert index.search("retry_with_backoff", k=1)[0].metadata["repo_name"] == "repoC"
+
+    assert index.remove("repoC") is True
+    assert index.remove("repoC") is False
+    assert "repoC" not in index.repo_names
+
+def test_search_without_repos_raises():
+    with pytest.raises(ValueError, match="No vectorstores available!"):
+        FederatedIndex().search("anything")
+
+def test_search_with_metadata_filters():
+    embedding = DeterministicFakeEmbedding(size=16)
+    texts = ["def merge_from(self, other): pass", "def merge_from(a, b): return a", "function merge_from(a) {}"]
+    docs = [
+        Document(page_content=texts[0], metadata={"repo_name": "repoA", "file_path": "/clones/repoA/src/index.py",
+                                                  "symbol": "LexicalIndex.merge_from"}),
+        Document(page_content=texts[1], metadata={"repo_name": "repoA", "file_path": "/clones/repoA/tests/test_index.py",
+                                                  "symbol": "merge_from"}),
+        Document(page_content=texts[2], metadata={"repo_name": "repoA", "file_path": "/clones/repoA/src/index.js"}),
+    ]
+    ids = ["a-0", "a-1", "a-2"]
+    lexical = LexicalIndex()
+    for doc_id, text in zip(ids, texts):
+        lexical.add(doc_id, text)
+    federated = FederatedIndex([RepoIndex("repoA", FAISS.from_documents(docs, embedding, ids=ids), lexical)])
+
+    def paths(filters):
+        return sorted(d.metadata["file_path"] for d in federated.search("merge_from", k=3, filters=filters))
+
+    assert paths(SearchFilter(paths=("src",))) == ["/clones/repoA/src/index.js", "/clones/repoA/src/index.py"]
+    assert paths(SearchFilter(languages=("python",))) == ["/clones/repoA/src/index.py",
+                                                          "/clones/repoA/tests/test_index.py"]
+    assert paths(SearchFilter(symbols=("LexicalIndex.*",))) == ["/clones/repoA/src/index.py"]
+    assert paths(SearchFilter(paths=("docs/*",))) == []
+    federated.close()
+
+def test_search_many_matches_single_searches(index):
+    queries = ["merge_from", "CHUNK_OVERLAP", "load_config"]
+
+    results = index.search_many(queries, k=2)
+
+    assert [[d.page_content for d in docs] for docs in results] == \
+        [[d.page_content for d in index.search(query, k=2)] for query in queries]
+    assert index.search_many([], k=2) == []
+
+@pytest.mark.parametrize("on_disk", [False, True])
+def test_chunk_vectors_reads_stored_vectors(tmp_path, on_disk):
+    from src.chunk_store import load_store, save_store
+
+    embedding = DeterministicFakeEmbedding(size=8)
+    texts = ["def merge_from(self, target): pass", "CHUNK_OVERLAP = 150", "def unrelated(): return None"]
+    ids = [f"repoA-{i}" for i in range(len(texts))]
+    docs = [Document(page_content=t, metadata={"repo_name": "repoA", "doc_id": doc_id}) for t, doc_id in zip(texts, ids)]
+    vectorstore = FAISS.from_documents(docs, embedding, ids=ids)
+    if on_disk:
+        save_store(vectorstore, str(tmp_path))
+        vectorstore = load_store(str(tmp_path), embedding)
+    lexical = LexicalIndex()
+    federated = FederatedIndex([RepoIndex("repoA", vectorstore, lexical)])
+
+    found = federated.search("merge_from", k=3)
+    vectors = federated.chunk_vectors(found)
+
+    np.testing.assert_allclose(vectors, embedding.embed_documents([d.page_content for d in found]), rtol=1e-6)
+    assert federated.chunk_vectors([Document(page_content="x", metadata={"repo_name": "repoA"})]) is None
+    federated.close()
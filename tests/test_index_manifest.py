@@ -0,0 +1,18 @@
+from src.index_manifest import MANIFEST_FILENAME, hash_content, load_manifest, save_manifest
+
+def test_hash_content_is_stable_and_content_sensitive():
+    assert hash_content("x = 1\n") == hash_content("x = 1\n")
+    assert hash_content("x = 1\n") != hash_content("x = 2\n")
+
+def test_save_and_load_manifest_round_trip(tmp_path):
+    manifest = {"commit": "abc123", "files": {"pkg/a.py": {"hash": "h", "ids": ["id1"]}}}
+    save_manifest(str(tmp_path), manifest)
+
+    assert (tmp_path / MANIFEST_FILENAME).exists()
+    assert load_manifest(str(tmp_path)) == manifest
+
+def test_load_manifest_missing_or_corrupt(tmp_path):
+    assert load_manifest(str(tmp_path)) is None
+
+    (tmp_path / MANIFEST_FILENAME).write_text("{not json")
+    assert load_manifest(str(tmp_path)) is None
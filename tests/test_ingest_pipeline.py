@@ -0,0 +1,109 @@
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+from src import ingest_pipeline
+from src.ingest_pipeline import ingest_repositories
+
+def _fake_clone(url, cache_dir):
+    # Later URLs clone faster, so stages complete out of input order
+    time.sleep(0.05 / (1 + int(url[-1])))
+    return f"repo{url[-1]}", f"/tmp/repo{url[-1]}"
+
+def test_ingest_repositories_preserves_order_and_reports_progress():
+    messages = []
+    updates = {f"repo{i}": MagicMock(chunks=[1, 2]) for i in range(3)}
+    stores = {name: MagicMock(name=name) for name in updates}
+
+    with patch.object(ingest_pipeline, "clone_repo", side_effect=_fake_clone), \
+         patch.object(ingest_pipeline, "prepare_repo", side_effect=lambda name, path, db_dir: updates[name]), \
+         patch.object(ingest_pipeline, "embed_repo", side_effect=lambda name, update, db_dir: stores[name]):
+        result = ingest_repositories(["https://x/repo0", "https://x/repo1", "https://x/repo2"],
+                                     use_processes=False, progress=messages.append)
+
+    assert result == [stores["repo0"], stores["repo1"], stores["repo2"]]
+    for name in stores:
+        stage_messages = [m for m in messages if m.startswith(f"[{name}]")]
+        assert [m.split()[1] for m in stage_messages] == ["cloned", "prepared,", "indexed"]
+    assert messages[-1].endswith("[3/3]")
+
+def test_ingest_repositories_bounds_embedding_concurrency():
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def fake_embed(name, update, db_dir):
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+        time.sleep(0.02)
+        with lock:
+            active -= 1
+        return name
+
+    with patch.object(ingest_pipeline, "clone_repo", side_effect=lambda url, cache_dir: (url, url)), \
+         patch.object(ingest_pipeline, "prepare_repo", return_value=None), \
+         patch.object(ingest_pipeline, "embed_repo", side_effect=fake_embed):
+        result = ingest_repositories([f"r{i}" for i in range(6)], embed_workers=2,
+                                     use_processes=False, progress=lambda msg: None)
+
+    assert result == [f"r{i}" for i in range(6)]
+    assert peak <= 2
+
+def test_prepare_repo_skips_current_index():
+    with patch.object(ingest_pipeline, "get_head_commit", return_value="sha"), \
+         patch.object(ingest_pipeline, "is_index_current", return_value=True), \
+         patch.object(ingest_pipeline, "load_code_documents") as mock_load:
+        assert ingest_pipeline.prepare_repo("repo", "/tmp/repo", "/tmp/db") is None
+    mock_load.assert_not_called()
+
+def test_ingest_repositories_streaming_skips_prepare_stage():
+    with patch.object(ingest_pipeline, "clone_repo", side_effect=lambda url, cache_dir: (url, url)), \
+         patch.object(ingest_pipeline, "prepare_repo") as mock_prepare, \
+         patch.object(ingest_pipeline, "stream_repo", side_effect=lambda name, path, db_dir: f"store-{name}"):
+        result = ingest_repositories(["r0", "r1"], use_processes=False, streaming=True, progress=lambda msg: None)
+
+    assert result == ["store-r0", "store-r1"]
+    mock_prepare.assert_not_called()
+
+def test_ingest_repositories_skips_failed_repos():
+    messages = []
+
+    def fake_prepare(name, path, db_dir):
+        if name == "r1":
+            raise ValueError("unreadable repo")
+
+    with patch.object(ingest_pipeline, "clone_repo", side_effect=lambda url, cache_dir: (url, url)), \
+         patch.object(ingest_pipeline, "prepare_repo", side_effect=fake_prepare), \
+         patch.object(ingest_pipeline, "embed_repo", side_effect=lambda name, update, db_dir: f"store-{name}"), \
+         patch.object(ingest_pipeline, "metrics") as mock_metrics:
+        result = ingest_repositories(["r0", "r1", "r2"], use_processes=False, progress=messages.append)
+
+    assert result == ["store-r0", "store-r2"]
+    assert any(m.startswith("[r1] failed to prepare: unreadable repo") for m in messages)
+    mock_metrics.inc.assert_called_once_with("rag_ingest_failures_total", stage="prepare")
+
+def test_ingest_repositories_with_spawned_workers(tmp_path, monkeypatch):
+    from langchain_community.embeddings import DeterministicFakeEmbedding
+    from src.benchmark import generate_repo
+
+    repo_path = generate_repo(str(tmp_path / "repos" / "synthetic"), files=2, functions=2)
+    monkeypatch.setattr("vector_store.get_embedding_model", lambda: DeterministicFakeEmbedding(size=16))
+    monkeypatch.setattr(ingest_pipeline.metrics, "enabled", True)
+    ingest_pipeline.metrics.reset()
+
+    try:
+        result = ingest_repositories([f"file://{repo_path}"], prepare_workers=1, db_dir=str(tmp_path / "db"),
+                                     use_processes=True, clone_cache_dir=str(tmp_path / "clones"),
+                                     progress=lambda msg: None)
+        stages = {dict(series["labels"])["stage"]
+                  for series in ingest_pipeline.metrics.snapshot()["histograms"]["rag_stage_seconds"]}
+    finally:
+        ingest_pipeline.metrics.reset()
+
+    assert [repo_index.repo_name for repo_index in result] == ["synthetic"]
+    assert result[0].vectorstore.index.ntotal > 0
+    assert result[0].lexical_index.search("Handler0", 1)
+    # Spans recorded in the worker process reach the parent's registry
+    assert {"clone", "load", "split"} <= stages
@@ -0,0 +1,30 @@
+import sys
+import threading
+
+from src.lazy_import import lazy_callable, warm_up
+
+def test_lazy_callable_imports_on_first_call():
+    sys.modules.pop("colorsys", None)
+    rgb_to_hsv = lazy_callable("colorsys", "rgb_to_hsv")
+
+    assert "colorsys" not in sys.modules
+    assert rgb_to_hsv(1.0, 0.0, 0.0) == (0.0, 1.0, 1.0)
+    assert "colorsys" in sys.modules
+    assert rgb_to_hsv.__name__ == "rgb_to_hsv"
+
+def test_warm_up_imports_and_initializes_in_background():
+    sys.modules.pop("colorsys", None)
+    ran = threading.Event()
+
+    thread = warm_up(["colorsys"], [ran.set])
+    thread.join(timeout=5)
+
+    assert thread.daemon
+    assert "colorsys" in sys.modules
+    assert ran.is_set()
+
+def test_warm_up_ignores_failures():
+    thread = warm_up(["no_such_module_for_warm_up"])
+    thread.join(timeout=5)
+
+    assert not thread.is_alive()
@@ -0,0 +1,95 @@
+import time
+
+from langchain.schema import Document
+
+from src.lexical_index import (
+    LEXICAL_FILENAME, LexicalIndex, LexicalIndexUpdater, SQLiteLexicalIndex, reciprocal_rank_fusion, tokenize
+)
+
+def test_tokenize_splits_identifiers_and_keeps_full_names():
+    assert tokenize("merge_from") == ["merge_from", "merge", "from"]
+    assert tokenize("getRepoUrls()") == ["getrepourls", "get", "repo", "urls"]
+    assert tokenize("HTTPServer CHUNK_OVERLAP x") == ["httpserver", "http", "server", "chunk_overlap", "chunk", "overlap", "x"]
+
+def _index():
+    index = LexicalIndex()
+    index.add("cli", "def combine_vectorstores(vectorstores):\n    combined.merge_from(vs)")
+    index.add("config", "CHUNK_SIZE: int = 800\nCHUNK_OVERLAP: int = 150")
+    index.add("readme", "Chunks overlap a little so context is not lost")
+    return index
+
+def test_search_ranks_exact_identifier_first():
+    index = _index()
+    assert index.search("Where is CHUNK_OVERLAP set?", 2)[0][0] == "config"
+    assert index.search("what calls merge_from", 1)[0][0] == "cli"
+    assert index.search("nothing matches zzz", 3) == []
+
+def test_remove_and_replace():
+    index = _index()
+    index.remove(["config", "unknown"])
+    assert len(index) == 2
+    assert all(doc_id != "config" for doc_id, _ in index.search("CHUNK_OVERLAP", 3))
+
+    index.add("cli", "def replaced(): pass")
+    assert index.search("merge_from", 3) == []
+
+def test_save_load_round_trip(tmp_path):
+    index = _index()
+    index.save(str(tmp_path))
+
+    loaded = LexicalIndex.load(str(tmp_path))
+
+    assert loaded.search("CHUNK_OVERLAP", 3) == index.search("CHUNK_OVERLAP", 3)
+    assert loaded.postings == index.postings and loaded.doc_lengths == index.doc_lengths
+    assert len(LexicalIndex.load(str(tmp_path / "missing"))) == 0
+
+def test_sqlite_index_searches_postings_on_disk(tmp_path):
+    index = _index()
+    index.save(str(tmp_path))
+
+    on_disk = SQLiteLexicalIndex(str(tmp_path / LEXICAL_FILENAME), cache_terms=2)
+
+    assert len(on_disk) == 3 and on_disk.term_count() == index.term_count()
+    for query in ("Where is CHUNK_OVERLAP set?", "merge_from chunks", "chunk overlap context", "zzz"):
+        assert on_disk.search(query, 2) == index.search(query, 2)
+    assert on_disk.search("chunk overlap", 3, allowed={"readme"}) == index.search("chunk overlap", 3, allowed={"readme"})
+    assert len(on_disk._weights) == 2
+    on_disk.close()
+
+def test_updater_applies_changes_in_place(tmp_path):
+    index = _index()
+    index.save(str(tmp_path))
+    texts = {"config": "CHUNK_SIZE: int = 800\nCHUNK_OVERLAP: int = 150"}
+
+    class Docstore:
+        def mget(self, ids):
+            return [Document(page_content=texts[i]) if i in texts else None for i in ids]
+
+    updater = LexicalIndexUpdater(Docstore())
+    updater.add("settings", "CHUNK_OVERLAP: int = 200")
+    updater.remove(["config", "unknown"])
+    updater.save(str(tmp_path))
+    index.add("settings", "CHUNK_OVERLAP: int = 200")
+    index.remove(["config"])
+
+    on_disk = SQLiteLexicalIndex(str(tmp_path / LEXICAL_FILENAME))
+    assert len(on_disk) == 3 and on_disk.term_count() == index.term_count()
+    for query in ("Where is CHUNK_OVERLAP set?", "chunk size", "merge_from chunks", "int"):
+        assert on_disk.search(query, 3) == index.search(query, 3)
+    loaded = LexicalIndex.load(str(tmp_path))
+    assert loaded.postings == index.postings and loaded.doc_lengths == index.doc_lengths
+    on_disk.close()
+
+def test_search_latency_is_sub_millisecond():
+    index = LexicalIndex()
+    for i in range(2000):
+        index.add(f"doc{i}", f"def handler_{i}(request):\n    return render(request, 'page_{i}.html')")
+
+    start = time.perf_counter()
+    for _ in range(100):
+        index.search("handler_1234 render", 10)
+    assert (time.perf_counter() - start) / 100 < 0.001
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]], k=60)
+    assert [doc_id for doc_id, _ in fused] == ["b", "a", "d", "c"]
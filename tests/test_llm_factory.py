@@ -1,9 +1,15 @@
+import json
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
 import pytest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch
 
 import src.llm_factory as llm_factory
-from src.config import MODEL_PROVIDER, MODEL_NAME
+from src.llm_factory import LLMGateway, PromptBatcher, ProviderPool, create_chat_model, is_transient_error
 
 @pytest.fixture(autouse=True)
 def reset_llm_instance():
@@ -12,60 +18,250 @@ def reset_llm_instance():
     yield
     llm_factory._llm_instance = None
 
-@patch("src.llm_factory.ChatOllama")
-def test_get_llm_ollama(mock_chat_ollama):
-    with patch("config.MODEL_PROVIDER", "ollama"), patch("config.MODEL_NAME", "mistral"):
-        mock_instance = MagicMock()
-        mock_chat_ollama.return_value = mock_instance
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Speaks just enough of the Ollama (/api/chat) and OpenAI (/v1/chat/completions) APIs.
+    """
 
-        llm = llm_factory.get_llm()
-        mock_chat_ollama.assert_called_once_with(model="mistral")
-        assert llm == mock_instance
+    protocol_version = "HTTP/1.1"
 
-@patch("src.llm_factory.ChatOpenAI")
-def test_get_llm_openai(mock_chat_openai):
-    # Patch config.MODEL_PROVIDER and MODEL_NAME within the llm_factory module context
-    with patch.object(llm_factory, "MODEL_PROVIDER", "openai"), \
-         patch.object(llm_factory, "MODEL_NAME", "gpt-4"):
+    def log_message(self, *args):
+        pass
 
-        mock_instance = MagicMock()
-        mock_chat_openai.return_value = mock_instance
+    def _send(self, status, body, content_type="application/json"):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
 
-        llm = llm_factory.get_llm()
-        mock_chat_openai.assert_called_once_with(model_name="gpt-4")
-        assert llm == mock_instance
+    def do_POST(self):
+        server = self.server
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with server.lock:
+            server.requests += 1
+            server.connections.add(self.client_address)
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            server.payloads.append(payload)
+            fail = server.failures_left > 0
+            server.failures_left -= fail
+        try:
+            time.sleep(server.delay)
+            if fail:
+                self._send(server.failure_status, json.dumps({"error": "request failed"}))
+            elif self.path == "/api/chat":
+                words = server.reply.split(" ")
+                lines = [
+                    json.dumps({"message": {"role": "assistant", "content": (" " if i else "") + word}, "done": False})
+                    for i, word in enumerate(words)
+                ]
+                lines.append(json.dumps({"message": {"role": "assistant", "content": ""}, "done": True}))
+                self._send(200, "\n".join(lines) + "\n", "application/x-ndjson")
+            elif self.path == "/v1/chat/completions":
+                self._send(200, json.dumps({
+                    "id": "stand-in", "object": "chat.completion", "created": 0, "model": payload["model"],
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": server.reply}}],
+                    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+                }))
+            else:
+                self._send(404, json.dumps({"error": "not found"}))
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+def _start_server(reply="Hello from the stand-in"):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.reply = reply
+    server.requests = 0
+    server.connections = set()
+    server.in_flight = 0
+    server.max_in_flight = 0
+    server.payloads = []
+    server.failures_left = 0
+    server.failure_status = 500
+    server.delay = 0.0
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+@pytest.fixture
+def stand_in():
+    server = _start_server()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def backup():
+    server = _start_server("Hello from the backup")
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def _pool(name, server, provider="ollama", limit=4):
+    base_url = server.url + ("/v1" if provider != "ollama" else "")
+    return ProviderPool(name, lambda: create_chat_model(provider, "mistral", base_url=base_url, timeout=5,
+                                                        pool_size=limit), limit)
+
+def test_ollama_model_keeps_model_loaded(stand_in):
+    with patch.object(llm_factory, "OLLAMA_KEEP_ALIVE", "1h"):
+        model = create_chat_model("ollama", "mistral", base_url=stand_in.url, timeout=5)
+
+    assert model.invoke("Hi").content == "Hello from the stand-in"
+    assert stand_in.payloads[0]["keep_alive"] == "1h"
+
+def test_openai_compatible_model_against_stand_in(stand_in):
+    with patch.dict(os.environ, {"TOGETHER_API_KEY": "dummy_key"}):
+        model = create_chat_model("together", "together-model", base_url=stand_in.url + "/v1", timeout=5)
+
+    assert model.invoke("Hi").content == "Hello from the stand-in"
+    assert model.invoke("Hi again").content == "Hello from the stand-in"
+    assert len(stand_in.connections) == 1
+
+def test_create_chat_model_unsupported_provider():
+    with pytest.raises(ValueError, match="Unsupported MODEL_PROVIDER: unsupported"):
+        create_chat_model("unsupported", "model")
+
+def test_gateway_retries_then_succeeds(stand_in):
+    stand_in.failures_left = 1
+    gateway = LLMGateway(providers=[_pool("ollama", stand_in)], max_retries=2, backoff=0)
+
+    assert gateway.invoke("Hi").content == "Hello from the stand-in"
+    assert stand_in.requests == 2
+    assert gateway.stats() == {"ollama": {"calls": 2, "failures": 1}}
+
+def test_gateway_fails_over_in_order(stand_in, backup):
+    stand_in.failures_left = 10
+    gateway = LLMGateway(providers=[_pool("ollama", stand_in), _pool("together", backup, "together")],
+                         max_retries=1, backoff=0)
+
+    with patch.dict(os.environ, {"TOGETHER_API_KEY": "dummy_key"}):
+        assert gateway.invoke("Hi").content == "Hello from the backup"
+    assert stand_in.requests == 2
+    assert backup.requests == 1
+
+@pytest.mark.parametrize("provider,status", [("ollama", 400), ("together", 401)])
+def test_gateway_raises_non_transient_errors_at_once(stand_in, backup, provider, status):
+    stand_in.failures_left = 10
+    stand_in.failure_status = status
+    gateway = LLMGateway(providers=[_pool(provider, stand_in, provider), _pool("backup", backup)],
+                         max_retries=2, backoff=0)
+
+    with patch.dict(os.environ, {"TOGETHER_API_KEY": "dummy_key"}):
+        with pytest.raises(Exception, match=str(status)):
+            gateway.invoke("Hi")
+    assert stand_in.requests == 1
+    assert backup.requests == 0
+    assert gateway.providers[0].acquire(timeout=0)
+
+def test_is_transient_error():
+    import requests
 
+    assert is_transient_error(requests.ConnectionError("refused"))
+    assert is_transient_error(requests.Timeout("slow"))
+    assert is_transient_error(ValueError("Ollama call failed with status code 503. Details: busy"))
+    assert is_transient_error(ValueError("Ollama call failed with status code 429. Details: slow down"))
+    assert not is_transient_error(ValueError("Ollama call failed with status code 400. Details: prompt too long"))
+    assert not is_transient_error(KeyError("choices"))
 
-@patch("src.llm_factory.ChatOpenAI")
-def test_get_llm_together(mock_chat_openai):
-    with patch.dict(os.environ, {"TOGETHER_API_KEY": "dummy_key"}), \
-         patch.object(llm_factory, "MODEL_PROVIDER", "together"), \
-         patch.object(llm_factory, "MODEL_NAME", "together-model"):
+def test_gateway_skips_unavailable_provider(stand_in):
+    def unavailable():
+        raise ValueError("no API key")
 
-        mock_instance = MagicMock()
-        mock_chat_openai.return_value = mock_instance
+    gateway = LLMGateway(providers=[ProviderPool("openai", unavailable), _pool("ollama", stand_in)], backoff=0)
 
+    assert gateway.invoke("Hi").content == "Hello from the stand-in"
+
+def test_gateway_raises_last_error_when_all_providers_fail(stand_in):
+    stand_in.failures_left = 10
+    gateway = LLMGateway(providers=[_pool("ollama", stand_in)], max_retries=1, backoff=0)
+
+    with pytest.raises(ValueError, match="status code 500"):
+        gateway.invoke("Hi")
+    # The slot was released
+    assert gateway.providers[0].acquire(timeout=0)
+
+def test_gateway_limits_concurrency_per_provider(stand_in):
+    stand_in.delay = 0.05
+    gateway = LLMGateway(providers=[_pool("ollama", stand_in, limit=2)])
+
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        answers = list(pool.map(lambda i: gateway.invoke(f"Q{i}").content, range(6)))
+
+    assert answers == ["Hello from the stand-in"] * 6
+    assert stand_in.max_in_flight == 2
+
+def test_gateway_fails_over_when_provider_is_saturated(stand_in, backup):
+    stand_in.delay = 0.3
+    gateway = LLMGateway(providers=[_pool("ollama", stand_in, limit=1), _pool("backup", backup)],
+                         queue_timeout=0.05)
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        first = pool.submit(gateway.invoke, "Q1")
+        time.sleep(0.1)
+        second = pool.submit(gateway.invoke, "Q2")
+        answers = {first.result().content, second.result().content}
+
+    assert answers == {"Hello from the stand-in", "Hello from the backup"}
+
+def test_gateway_streams_tokens(stand_in):
+    gateway = LLMGateway(providers=[_pool("ollama", stand_in)])
+
+    tokens = [chunk.content for chunk in gateway.stream("Hi")]
+
+    assert "".join(tokens) == "Hello from the stand-in"
+    assert len(tokens) > 1
+    assert gateway.providers[0].acquire(timeout=0)
+
+def test_prompt_batcher_coalesces_concurrent_prompts():
+    calls = []
+
+    def handler(prompts):
+        calls.append(list(prompts))
+        return [p.upper() for p in prompts]
+
+    batcher = PromptBatcher(handler, window_ms=100, max_batch=8)
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(batcher.submit, ["a", "b", "c", "d"]))
+
+    assert results == ["A", "B", "C", "D"]
+    assert batcher.batches < 4
+    assert sorted(p for batch in calls for p in batch) == ["a", "b", "c", "d"]
+
+def test_get_llm_builds_gateway_in_failover_order():
+    with patch.object(llm_factory, "MODEL_PROVIDER", "ollama"), \
+         patch.object(llm_factory, "LLM_FAILOVER", ["together", "openai", "ollama"]):
         llm = llm_factory.get_llm()
 
-        mock_chat_openai.assert_called_once_with(
-            base_url="https://api.together.xyz/v1",
-            api_key="dummy_key",
-            model="together-model",
-        )
-        assert llm == mock_instance
+    assert isinstance(llm, LLMGateway)
+    assert [p.name for p in llm.providers] == ["ollama", "together", "openai"]
+
+@patch("src.llm_factory.create_chat_model")
+def test_get_llm_uses_failover_model_names(mock_create):
+    with patch.object(llm_factory, "MODEL_PROVIDER", "ollama"), \
+         patch.object(llm_factory, "MODEL_NAME", "mistral"), \
+         patch.object(llm_factory, "LLM_FAILOVER", ["openai"]), \
+         patch.object(llm_factory, "LLM_MODELS", {"openai": "gpt-4o-mini"}):
+        llm = llm_factory.get_llm()
+        llm.providers[0].model
+        llm.providers[1].model
 
+    assert mock_create.call_args_list[0][0][:2] == ("ollama", "mistral")
+    assert mock_create.call_args_list[1][0][:2] == ("openai", "gpt-4o-mini")
 
 def test_get_llm_unsupported_provider():
     with patch.object(llm_factory, "MODEL_PROVIDER", "unsupported"):
         with pytest.raises(ValueError, match="Unsupported MODEL_PROVIDER: unsupported"):
             llm_factory.get_llm()
 
-
 def test_get_llm_singleton_behavior():
-    with patch("config.MODEL_PROVIDER", "ollama"), patch("config.MODEL_NAME", "mistral"):
-        first_instance = MagicMock()
-        with patch("src.llm_factory.ChatOllama", return_value=first_instance):
-            llm1 = llm_factory.get_llm()
-            llm2 = llm_factory.get_llm()
-            # Should only create instance once
-            assert llm1 is llm2
+    with patch.object(llm_factory, "MODEL_PROVIDER", "ollama"), patch.object(llm_factory, "LLM_FAILOVER", []):
+        llm1 = llm_factory.get_llm()
+        llm2 = llm_factory.get_llm()
+        # Should only create instance once
+        assert llm1 is llm2
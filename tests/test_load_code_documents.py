@@ -1,29 +1,129 @@
+import os
+import subprocess
+
 import pytest
-from unittest.mock import mock_open, patch
-from src.load_code_documents import load_code_documents
+from unittest.mock import patch
+from src.load_code_documents import (
+    ScanStats, extension_languages, iter_code_documents, list_repo_files, load_code_documents
+)
 from langchain.schema import Document
 
 
-@patch("src.load_code_documents.glob.glob")
-@patch("builtins.open", new_callable=mock_open, read_data="print('Hello world')\n")
-def test_load_code_documents_success(mock_file, mock_glob):
-    repo_name = "test-repo"
-    repo_path = "/fake/repo/path"
-    fake_file_path = "/fake/repo/path/module.py"
+def _write(root, rel_path, content):
+    path = root / rel_path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if isinstance(content, bytes):
+        path.write_bytes(content)
+    else:
+        path.write_text(content)
+    return path
+
+
+def _make_tree(root):
+    _write(root, "app.py", "print('Hello world')\n")
+    _write(root, "pkg/util.py", "def util():\n    return 1\n")
+    _write(root, "pkg/util.js", "export const x = 1;\n")
+    _write(root, "notes.txt", "ignored")
+    _write(root, ".gitignore", "build_out/\n*.tmp.py\n")
+    _write(root, "build_out/gen.py", "x = 1\n")
+    _write(root, "scratch.tmp.py", "x = 2\n")
+    _write(root, "node_modules/lib/index.py", "x = 3\n")
+    _write(root, "api_pb2.py", "x = 4\n")
+    _write(root, "schema.py", "# Code generated by protoc. DO NOT EDIT.\nx = 5\n")
+    _write(root, "blob.py", b"\x00\x01\x02binary")
+    _write(root, "huge.py", "x = 1\n" * 200_000)
+
 
-    # Fake one Python file
-    mock_glob.return_value = [fake_file_path]
+def _git(root, *args):
+    subprocess.run(["git", "-C", str(root), *args], check=True, capture_output=True)
 
-    documents = load_code_documents(repo_name, repo_path)
+
+def test_load_code_documents_success(tmp_path):
+    _write(tmp_path, "module.py", "print('Hello world')\n")
+
+    documents = load_code_documents("test-repo", str(tmp_path))
 
     assert len(documents) == 1
     doc = documents[0]
     assert isinstance(doc, Document)
     assert doc.page_content == "print('Hello world')\n"
     assert doc.metadata == {
-        "repo_name": repo_name,
-        "file_path": fake_file_path
+        "repo_name": "test-repo",
+        "file_path": os.path.join(str(tmp_path), "module.py"),
+        "language": "python",
     }
 
-    mock_file.assert_called_once_with(fake_file_path, "r", encoding="utf-8")
-    mock_glob.assert_called_once_with("/fake/repo/path/**/*.py", recursive=True)
+
+def test_iter_code_documents_yields_lazily(tmp_path):
+    (tmp_path / "a.py").write_text("a = 1\n")
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / "b.py").write_text("b = 2\n")
+    (tmp_path / "notes.txt").write_text("ignored")
+
+    documents = iter_code_documents("repo", str(tmp_path))
+
+    assert not isinstance(documents, list)
+    contents = sorted(doc.page_content for doc in documents)
+    assert contents == ["a = 1\n", "b = 2\n"]
+
+
+@pytest.mark.parametrize("use_git", [False, True])
+def test_scanner_skips_ignored_generated_binary_and_large_files(tmp_path, use_git):
+    _make_tree(tmp_path)
+    if use_git:
+        _git(tmp_path, "init", "-q")
+        _git(tmp_path, "add", "-A", "-f", "node_modules")
+    stats = ScanStats("repo")
+
+    documents = load_code_documents("repo", str(tmp_path), stats)
+
+    paths = sorted(os.path.relpath(doc.metadata["file_path"], tmp_path) for doc in documents)
+    assert paths == ["app.py", os.path.join("pkg", "util.py")]
+    assert stats.source == ("git" if use_git else "walk")
+    assert stats.read == 2
+    # The walk prunes node_modules; git lists the force-added file and it is filtered out
+    assert stats.skipped.get("excluded", 0) == (1 if use_git else 0)
+    assert stats.skipped["generated"] == 2
+    assert stats.skipped["binary"] == 1
+    assert stats.skipped["size"] == 1
+    assert stats.skipped["extension"] == 3  # notes.txt, util.js and .gitignore
+
+
+def test_git_listing_includes_untracked_but_not_ignored_files(tmp_path):
+    _make_tree(tmp_path)
+    _git(tmp_path, "init", "-q")
+
+    files = list_repo_files(str(tmp_path))
+
+    assert "app.py" in files
+    assert "build_out/gen.py" not in files
+    assert "scratch.tmp.py" not in files
+    assert not any(f.startswith(".git/") for f in files)
+
+
+def test_languages_select_extensions(tmp_path):
+    _make_tree(tmp_path)
+
+    documents = list(iter_code_documents("repo", str(tmp_path), languages=["javascript"]))
+
+    assert [doc.metadata["language"] for doc in documents] == ["javascript"]
+    with pytest.raises(ValueError, match="Unknown language: cobol"):
+        extension_languages(["cobol"])
+
+
+def test_unreadable_file_is_counted_not_raised(tmp_path):
+    _write(tmp_path, "a.py", "a = 1\n")
+    _write(tmp_path, "b.py", "b = 2\n")
+    stats = ScanStats("repo")
+    real_open = open
+
+    def flaky_open(path, *args, **kwargs):
+        if str(path).endswith("b.py"):
+            raise PermissionError("denied")
+        return real_open(path, *args, **kwargs)
+
+    with patch("builtins.open", side_effect=flaky_open):
+        documents = load_code_documents("repo", str(tmp_path), stats)
+
+    assert [doc.page_content for doc in documents] == ["a = 1\n"]
+    assert stats.skipped == {"error": 1}
@@ -0,0 +1,104 @@
+import json
+import urllib.request
+
+import pytest
+
+from src.metrics import Histogram, Metrics, profile_call, start_metrics_server
+
+def test_span_records_latency_and_nested_trace(tmp_path):
+    trace = tmp_path / "trace.jsonl"
+    registry = Metrics(enabled=True, trace_path=str(trace))
+
+    with registry.span("query"):
+        with registry.span("search", repo="repoA") as span:
+            span["hits"] = 3
+
+    snapshot = registry.snapshot()["histograms"]["rag_stage_seconds"]
+    assert {tuple(s["labels"].items()) for s in snapshot} == {(("stage", "query"),),
+                                                             (("repo", "repoA"), ("stage", "search"))}
+    events = [json.loads(line) for line in trace.read_text().splitlines()]
+    assert [e["span"] for e in events] == ["search", "query"]
+    assert events[0]["parent"] == "query" and events[0]["hits"] == 3
+    assert events[1]["parent"] is None
+
+def test_span_counts_errors():
+    registry = Metrics(enabled=True, trace_path="")
+
+    with pytest.raises(KeyError):
+        with registry.span("llm"):
+            raise KeyError("boom")
+
+    assert registry.counters["rag_stage_errors_total"] == {(("error", "KeyError"), ("stage", "llm")): 1}
+    assert registry.histograms["rag_stage_seconds"][(("stage", "llm"),)].count == 1
+
+def test_disabled_registry_records_nothing():
+    registry = Metrics(enabled=False, trace_path="")
+
+    with registry.span("split"):
+        registry.inc("rag_chunks_total", 5)
+
+    assert registry.snapshot() == {"counters": {}, "gauges": {}, "histograms": {}}
+
+def test_merge_adds_exported_series():
+    worker = Metrics(enabled=True, trace_path="")
+    parent = Metrics(enabled=True, trace_path="")
+    for registry in (worker, parent):
+        registry.inc("rag_files_loaded_total", 2)
+        registry.observe("rag_stage_seconds", 0.003, stage="load")
+    worker.set_gauge("rag_index_vectors", 7, repo="a")
+    worker.observe("rag_stage_seconds", 0.2, stage="split")
+
+    parent.merge(worker.export())
+
+    assert parent.counters["rag_files_loaded_total"] == {(): 4}
+    assert parent.gauges["rag_index_vectors"] == {(("repo", "a"),): 7}
+    load = parent.histograms["rag_stage_seconds"][(("stage", "load"),)]
+    assert load.count == 2 and load.sum == pytest.approx(0.006) and sum(load.counts) == 2
+    assert parent.histograms["rag_stage_seconds"][(("stage", "split"),)].count == 1
+    assert worker.histograms["rag_stage_seconds"][(("stage", "load"),)].count == 1
+
+def test_histogram_quantiles_use_bucket_bounds():
+    histogram = Histogram(buckets=(0.01, 0.1, 1.0))
+    for value in (0.005, 0.05, 0.05, 0.5):
+        histogram.observe(value)
+
+    assert histogram.quantile(0.5) == 0.1
+    assert histogram.quantile(0.95) == 1.0
+    assert Histogram().quantile(0.5) == 0.0
+
+def test_render_prometheus_text_format():
+    registry = Metrics(enabled=True, trace_path="")
+    registry.inc("rag_answer_cache_requests_total", result="hit")
+    registry.set_gauge("rag_index_vectors", 42, repo="repoA")
+    registry.observe("rag_stage_seconds", 0.003, stage="embed")
+
+    text = registry.render_prometheus()
+
+    assert 'rag_answer_cache_requests_total{result="hit"} 1' in text
+    assert 'rag_index_vectors{repo="repoA"} 42' in text
+    assert 'rag_stage_seconds_bucket{stage="embed",le="0.0025"} 0' in text
+    assert 'rag_stage_seconds_bucket{stage="embed",le="0.005"} 1' in text
+    assert 'rag_stage_seconds_bucket{stage="embed",le="+Inf"} 1' in text
+    assert 'rag_stage_seconds_count{stage="embed"} 1' in text
+
+def test_metrics_server_serves_prometheus_text():
+    registry = Metrics(enabled=True, trace_path="")
+    registry.inc("rag_chunks_total", 7)
+    server = start_metrics_server(0, registry=registry)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url) as response:
+            assert "rag_chunks_total 7" in response.read().decode()
+    finally:
+        server.shutdown()
+
+def test_profile_call_prints_cprofile_report(capsys, tmp_path):
+    assert profile_call(lambda: sum(range(1000)), top=5) == 499500
+    assert "cumulative" in capsys.readouterr().out
+
+    output = tmp_path / "query.prof"
+    profile_call(lambda: None, output=str(output))
+    assert output.stat().st_size > 0
+
+    with pytest.raises(ValueError, match="Unsupported profiler"):
+        profile_call(lambda: None, profiler="perf")
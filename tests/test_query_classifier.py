@@ -1,6 +1,16 @@
 import pytest
 from unittest.mock import patch, MagicMock
-from src.query_classifier import is_code_related_query
+import src.query_classifier as query_classifier
+from src.query_classifier import is_code_related_query, heuristic_classification, normalize_query
+
+@pytest.fixture(autouse=True)
+def local_tier(monkeypatch):
+    # Default to an undecided local tier so the LLM path is exercised
+    monkeypatch.setattr(query_classifier, "CLASSIFIER_USE_EMBEDDINGS", False)
+    monkeypatch.setattr(query_classifier, "classify_locally", lambda query: (None, 0.0))
+    query_classifier.clear_classifier_cache()
+    yield
+    query_classifier.clear_classifier_cache()
 
 @patch("src.query_classifier.llm")
 def test_is_code_related_query_yes(mock_llm):
@@ -49,3 +59,91 @@ def test_is_code_related_query_unexpected_response(mock_llm):
     result = is_code_related_query(query)
     mock_llm.invoke.assert_called_once()
     assert result is False
+
+@patch("src.query_classifier.llm")
+def test_confident_local_classification_skips_llm(mock_llm, monkeypatch):
+    monkeypatch.setattr(query_classifier, "classify_locally", lambda query: (True, 0.95))
+
+    assert is_code_related_query("What does `merge_from` do?") is True
+    mock_llm.invoke.assert_not_called()
+
+@patch("src.query_classifier.llm")
+def test_low_confidence_falls_back_to_llm(mock_llm, monkeypatch):
+    monkeypatch.setattr(query_classifier, "classify_locally", lambda query: (False, 0.5))
+    mock_llm.invoke.return_value.content = "Yes"
+
+    assert is_code_related_query("Is the thing broken?") is True
+    mock_llm.invoke.assert_called_once()
+
+@patch("src.query_classifier.llm")
+def test_results_are_memoized_per_normalized_query(mock_llm):
+    mock_llm.invoke.return_value.content = "No"
+
+    assert is_code_related_query("What time is it?") is False
+    assert is_code_related_query("  what TIME is   it? ") is False
+    mock_llm.invoke.assert_called_once()
+
+@pytest.mark.parametrize("query, expected", [
+    ("Which function reads CHUNK_OVERLAP?", True),
+    ("What does the getRepoUrls method return?", True),
+    ("Explain handle_code_query()", True),
+    ("What is in src/config.py?", True),
+    ("Which module loads the embedding model?", True),
+    ("Tell me a joke", False),
+    ("What is the weather like today?", False),
+])
+def test_heuristic_classification(query, expected):
+    label, confidence = heuristic_classification(query)
+    assert label is expected
+    assert confidence >= query_classifier.CLASSIFIER_CONFIDENCE_THRESHOLD
+
+@pytest.mark.parametrize("query", [
+    "What is the return policy at Amazon?",
+    "Can you recommend a model of car?",
+    "What is a good test of character?",
+    "Who is the NBA MVP?",
+    "How do I file my taxes in the USA?",
+    "Is it worth buying an iPhone?",
+    "What is on YouTube today?",
+    "What is the return policy at McDonald's?",
+    "Tell me about PlayStation games",
+    "Who was president of the U.S.A in 1990?",
+    "What time is it in New_York?",
+    "Should I call the IRS about my return?",
+    "Where is CHUNK_OVERLAP used?",
+])
+def test_heuristic_never_confident_on_generic_terms(query):
+    label, confidence = heuristic_classification(query)
+    assert label is not True or confidence < query_classifier.CLASSIFIER_CONFIDENCE_THRESHOLD
+
+def test_heuristic_classification_undecided():
+    assert heuristic_classification("What about that?") == (None, 0.0)
+
+def test_classify_locally_combines_embedding_tier(monkeypatch):
+    monkeypatch.undo()
+    monkeypatch.setattr(query_classifier, "CLASSIFIER_USE_EMBEDDINGS", True)
+    monkeypatch.setattr(query_classifier, "embedding_classification", lambda query: (True, 0.7))
+
+    assert query_classifier.classify_locally("What about that?") == (True, 0.7)
+    label, confidence = query_classifier.classify_locally("Is there a problem in the loop?")
+    assert label is True and confidence >= 0.85
+
+def test_normalize_query():
+    assert normalize_query("  How   DOES this work? ") == "how does this work?"
+
+@patch("src.query_classifier.llm")
+def test_classify_many_with_llm_uses_one_numbered_prompt(mock_llm):
+    mock_llm.invoke.return_value.content = "1. Yes\n2. No\n3) yes"
+
+    assert query_classifier.classify_many_with_llm(["a?", "b?", "c?"]) == [True, False, True]
+    prompt = mock_llm.invoke.call_args[0][0]
+    assert "1. a?" in prompt and "3. c?" in prompt
+    mock_llm.batch.assert_not_called()
+
+@patch("src.query_classifier.llm")
+def test_classify_many_with_llm_falls_back_to_single_prompts(mock_llm):
+    mock_llm.invoke.return_value.content = "Yes"
+    mock_llm.batch.return_value = [MagicMock(content="No"), MagicMock(content="Yes")]
+
+    assert query_classifier.classify_many_with_llm(["a?", "b?"]) == [False, True]
+    assert len(mock_llm.batch.call_args[0][0]) == 2
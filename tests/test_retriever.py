@@ -27,3 +27,21 @@ def test_create_qa_chain_returns_retrievalqa(mock_get_llm):
         mock_from_chain_type.assert_called_once_with(llm=mock_llm, retriever=mock_retriever)
 
         assert isinstance(qa_chain, RetrievalQA)
+
+def test_filtered_search_params_widen_ivf_probes_for_selective_filters():
+    import faiss
+    import numpy as np
+    from src.ann_index import build_ann_index
+    from src.retriever import filtered_search_params
+
+    vectors = np.random.default_rng(0).standard_normal((2000, 8)).astype(np.float32)
+    index = build_ann_index(vectors, "ivf-flat", nlist=32)
+    mask = np.zeros(len(vectors), dtype=bool)
+    mask[::100] = True
+
+    params, bitmap = filtered_search_params(index, mask)
+    _, indices = index.search(vectors[:1], 5, params=params)
+
+    assert isinstance(params, faiss.SearchParametersIVF)
+    assert params.nprobe == 32
+    assert len(indices[0]) == 5 and all(i % 100 == 0 for i in indices[0])
@@ -0,0 +1,59 @@
+import os
+
+import numpy as np
+import pytest
+from langchain.schema import Document
+from langchain_community.embeddings import DeterministicFakeEmbedding
+
+from src.retriever import vector_search
+from src.search_filter import MetadataIndex, SearchFilter, parse_filters
+from src.vector_store import load_vector_store, update_vector_store
+
+def test_parse_filters_splits_terms_from_query():
+    filters, query = parse_filters("path:src/*,lib/* lang:python symbol:Lexical* how is BM25 scored?")
+
+    assert filters == SearchFilter(paths=("src/*", "lib/*"), languages=("python",), symbols=("Lexical*",))
+    assert query == "how is BM25 scored?"
+    assert not parse_filters("what is a closure? e.g. https://x")[0]
+
+def test_parse_filters_rejects_unknown_language():
+    with pytest.raises(ValueError, match="Unknown language: cobol"):
+        parse_filters("lang:cobol payroll")
+
+def test_mask_matches_relative_paths_symbols_and_duplicates():
+    rows = [
+        (0, "a", "/clones/repo/src/index.py", "LexicalIndex.search, LexicalIndex.add"),
+        (1, "b", "/clones/repo/tests/test_index.py", "test_search"),
+        (2, "c", "/clones/repo/src/app.js", None),
+        # Chunk 1 also stands for a copy under vendor/ that deduplication collapsed into it
+        (1, "b", "/clones/repo/vendor/lib/index.py", "test_search"),
+    ]
+    metadata = MetadataIndex(rows, size=3, manifest_paths={"src/index.py", "tests/test_index.py", "src/app.js"})
+
+    assert metadata.mask(SearchFilter(paths=("src",))).tolist() == [True, False, True]
+    assert metadata.mask(SearchFilter(paths=("vendor/*",))).tolist() == [False, True, False]
+    assert metadata.mask(SearchFilter(languages=("javascript",))).tolist() == [False, False, True]
+    assert metadata.mask(SearchFilter(symbols=("add",))).tolist() == [True, False, False]
+    assert metadata.mask(SearchFilter(paths=("src/*",), symbols=("test_*",))).tolist() == [False, False, False]
+    assert metadata.allowed_ids(SearchFilter(paths=("tests/*",))) == {"b"}
+
+def test_persisted_store_filters_inside_faiss_search(tmp_path, monkeypatch):
+    monkeypatch.setattr("src.vector_store.get_embedding_model", lambda: DeterministicFakeEmbedding(size=16))
+    repo_path = str(tmp_path / "checkout")
+    db_dir = str(tmp_path / "vector_db")
+    files = {f"pkg{i % 4}/module_{i}.py": f"def handler_{i}(event):\n    return event + {i}\n" for i in range(40)}
+    docs = [Document(page_content=content, metadata={"repo_name": "repo", "file_path": os.path.join(repo_path, path)})
+            for path, content in files.items()]
+    update_vector_store(docs, "repo", repo_path, commit="sha1", db_dir=db_dir)
+    db = load_vector_store("repo", db_dir)
+
+    metadata = MetadataIndex.from_store(db)
+    mask = metadata.mask(SearchFilter(paths=("pkg2",)))
+    hits = vector_search(db, db.embeddings.embed_query("handler"), 5, mask)
+
+    assert mask.sum() == 10
+    assert len(hits) == 5
+    assert all(db.docstore.search(doc_id).metadata["file_path"].startswith(os.path.join(repo_path, "pkg2"))
+               for doc_id, _ in hits)
+    # A filter matching nothing returns nothing rather than unfiltered hits
+    assert vector_search(db, db.embeddings.embed_query("handler"), 5, np.zeros(db.index.ntotal, dtype=bool)) == []
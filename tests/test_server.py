@@ -0,0 +1,161 @@
+import asyncio
+import sys
+import threading
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+from langchain.schema import Document
+from langchain_community.embeddings import DeterministicFakeEmbedding
+from langchain_community.vectorstores import FAISS
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from src import server
+from src.answer_cache import AnswerCache
+from src.embedding_engine import QueryBatcher
+from src.federated_search import FederatedIndex
+from src.lexical_index import LexicalIndex
+from src.vector_store import RepoIndex
+
+class CountingEmbedding(DeterministicFakeEmbedding):
+    calls: list = []
+
+    def embed_documents(self, texts):
+        self.calls.append(len(texts))
+        return super().embed_documents(texts)
+
+def _repo_index(repo_name, texts):
+    embedding = DeterministicFakeEmbedding(size=16)
+    ids = [f"{repo_name}-{i}" for i in range(len(texts))]
+    docs = [Document(page_content=t, metadata={"repo_name": repo_name, "file_path": f"{i}.py", "doc_id": ids[i]})
+            for i, t in enumerate(texts)]
+    lexical = LexicalIndex()
+    for doc_id, text in zip(ids, texts):
+        lexical.add(doc_id, text)
+    return RepoIndex(repo_name, FAISS.from_documents(docs, embedding, ids=ids), lexical)
+
+@pytest.fixture
+def cli_module(monkeypatch):
+    # server.py imports the flat `cli` module, not `src.cli`
+    module = sys.modules[server.answer_query.__module__]
+    monkeypatch.setattr(module, "get_embedding_model", lambda: DeterministicFakeEmbedding(size=16))
+    monkeypatch.setattr(module, "is_code_related_query", lambda q: "hello" not in q.lower())
+    return module
+
+@pytest.fixture
+def qa_server(cli_module):
+    index = FederatedIndex([_repo_index("repoA", ["def merge_from(): pass"]),
+                            _repo_index("repoB", ["CHUNK_OVERLAP = 150"])],
+                           query_embeddings=QueryBatcher(DeterministicFakeEmbedding(size=16)))
+    llm = FakeListChatModel(responses=["answer"])
+
+    def load(name):
+        if name != "repoC":
+            raise OSError("missing")
+        return _repo_index("repoC", ["def reloaded(): pass"])
+
+    return server.QAServer(index, llm, AnswerCache(max_entries=16), workers=4,
+                           ingest=lambda urls: [_repo_index("repoD", ["def added(): pass"])], load=load)
+
+def _run(qa, scenario):
+    async def main():
+        async with TestClient(TestServer(qa.app())) as client:
+            return await scenario(client)
+    return asyncio.run(main())
+
+def test_query_and_errors(qa_server):
+    async def scenario(client):
+        ok = await client.post("/query", json={"query": "Where is merge_from?"})
+        scoped = await client.post("/query", json={"query": "@repoB what is CHUNK_OVERLAP?"})
+        general = await client.post("/query", json={"query": "Hello there"})
+        unknown = await client.post("/query", json={"query": "x", "repos": ["nope"]})
+        missing = await client.post("/query", json={})
+        return [(r.status, await r.json()) for r in (ok, scoped, general, unknown, missing)]
+
+    (ok, scoped, general, unknown, missing) = _run(qa_server, scenario)
+    assert ok[0] == 200 and ok[1]["answer"] == "answer" and ok[1]["elapsed_ms"] >= 0
+    assert scoped[0] == 200 and general[0] == 200
+    assert unknown == (400, {"error": "Unknown repos: nope"})
+    assert missing[0] == 400
+
+def test_query_with_filters(qa_server):
+    async def scenario(client):
+        inline = await client.post("/query", json={"query": "lang:python where is merge_from?"})
+        body = await client.post("/query", json={"query": "where is merge_from?", "filters": {"paths": ["*.py"]}})
+        bad = await client.post("/query", json={"query": "x", "filters": {"languages": ["cobol"]}})
+        return [(r.status, await r.json()) for r in (inline, body, bad)]
+
+    inline, body, bad = _run(qa_server, scenario)
+    assert inline[0] == 200 and body[0] == 200
+    assert bad == (400, {"error": "Invalid filters: Unknown language: cobol"})
+
+def test_metrics_endpoint_exports_stage_latencies(qa_server):
+    async def scenario(client):
+        await client.post("/query", json={"query": "Where is merge_from?"})
+        response = await client.get("/metrics")
+        return response.status, await response.text()
+
+    status, text = _run(qa_server, scenario)
+    assert status == 200
+    assert '# TYPE rag_stage_seconds histogram' in text
+    assert 'rag_stage_seconds_count{stage="search"}' in text
+    assert 'rag_stage_seconds_count{stage="llm"}' in text
+
+def test_repo_management(qa_server):
+    async def scenario(client):
+        added = await (await client.post("/repos", json={"urls": ["https://fake/repoD"]})).json()
+        reloaded = await client.post("/repos/repoC/reload")
+        missing = await client.post("/repos/nope/reload")
+        dropped = await client.delete("/repos/repoA")
+        unknown = await client.delete("/repos/repoA")
+        repos = await (await client.get("/repos")).json()
+        health = await (await client.get("/health")).json()
+        return added, reloaded.status, missing.status, dropped.status, unknown.status, repos, health
+
+    added, reloaded, missing, dropped, unknown, repos, health = _run(qa_server, scenario)
+    assert added == {"repos": ["repoD"]}
+    assert (reloaded, missing, dropped, unknown) == (200, 404, 200, 404)
+    assert repos == {"repos": ["repoB", "repoD", "repoC"]}
+    assert health == {"status": "ok", "repos": 3}
+
+def test_concurrent_queries_share_embedding_batches(cli_module):
+    embedding = CountingEmbedding(size=16)
+    embedding.calls = []
+    index = FederatedIndex([_repo_index("repoA", ["def merge_from(): pass"])],
+                           query_embeddings=QueryBatcher(embedding, window_ms=50))
+    qa = server.QAServer(index, FakeListChatModel(responses=["answer"]), workers=8)
+
+    async def scenario(client):
+        responses = await asyncio.gather(*[
+            client.post("/query", json={"query": f"@repoA where is merge_from {i}?"}) for i in range(8)
+        ])
+        return [r.status for r in responses]
+
+    assert _run(qa, scenario) == [200] * 8
+    assert sum(embedding.calls) == 8
+    assert len(embedding.calls) < 8
+
+def test_cli_client_talks_to_server(qa_server, monkeypatch, capsys):
+    from aiohttp import web
+    from src import cli
+
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(qa_server.app())
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        inputs = iter([":repos", "Where is merge_from?", ":drop repoA", "@nope where?", "exit"])
+        monkeypatch.setattr("builtins.input", lambda _: next(inputs))
+        cli.client_loop(f"http://127.0.0.1:{port}")
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+
+    out = capsys.readouterr().out
+    assert "Repos: repoA, repoB" in out
+    assert "Bot: answer" in out
+    assert "Dropped repoA" in out
+    assert "Bot: Unknown repos: nope" in out
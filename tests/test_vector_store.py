@@ -1,8 +1,13 @@
+import json
 import os
 import shutil
 import pytest
 from langchain.schema import Document
-from src.vector_store import create_vector_store
+from src.vector_store import (
+    apply_update, create_vector_store, is_index_current, prepare_update, stream_vector_store,
+    update_vector_store, load_repo_index
+)
+from src.index_manifest import load_manifest
 from src.config import VECTORSTORE_DIR
 from langchain_community.vectorstores import FAISS
 
@@ -28,7 +33,8 @@ def test_create_vector_store_creates_new_store(tmp_path, dummy_chunks, repo_name
     expected_path = db_dir / repo_name
     assert expected_path.exists()
     assert (expected_path / "index.faiss").exists()
-    assert (expected_path / "index.pkl").exists()
+    assert (expected_path / "chunks.sqlite3").exists()
+    assert not (expected_path / "index.pkl").exists()
 
 def test_create_vector_store_raises_for_empty_chunks(repo_name):
     with pytest.raises(ValueError, match="No chunks to index"):
@@ -48,3 +54,176 @@ def test_create_vector_store_loads_existing(tmp_path, dummy_chunks, repo_name):
 
     # Cleanup
     shutil.rmtree(str(db_dir))
+
+@pytest.fixture
+def fake_embeddings(monkeypatch):
+    from langchain_community.embeddings import DeterministicFakeEmbedding
+    monkeypatch.setattr("src.vector_store.get_embedding_model",
+                        lambda: DeterministicFakeEmbedding(size=16))
+
+def _file_docs(repo_path, files):
+    return [
+        Document(page_content=content, metadata={"repo_name": "test_repo", "file_path": os.path.join(repo_path, name)})
+        for name, content in files.items()
+    ]
+
+def test_update_vector_store_only_embeds_changed_files(tmp_path, fake_embeddings, repo_name):
+    db_dir = str(tmp_path / "vector_db")
+    repo_path = str(tmp_path / "checkout")
+    files = {"a.py": "def a(): pass\n", "b.py": "def b(): pass\n", "c.py": "def c(): pass\n"}
+
+    db = update_vector_store(_file_docs(repo_path, files), repo_name, repo_path, commit="sha1", db_dir=db_dir)
+    assert len(db.index_to_docstore_id) == 3
+    assert is_index_current(repo_name, "sha1", db_dir)
+
+    files["b.py"] = "def b(): return 2\n"
+    del files["c.py"]
+    update = prepare_update(_file_docs(repo_path, files), repo_name, repo_path, commit="sha2", db_dir=db_dir)
+    assert update.changed_paths == ["b.py"]
+    assert update.deleted_paths == ["c.py"]
+    assert [c.page_content for c in update.chunks] == ["def b(): return 2"]
+
+    db = apply_update(update, db_dir)
+    contents = sorted(d.page_content for _, d in db.docstore.items())
+    assert contents == ["def a(): pass", "def b(): return 2"]
+
+    lexical = load_repo_index(repo_name, db, db_dir).lexical_index
+    assert len(lexical) == 2
+    assert lexical.search("return", 1)[0][0] in dict(db.docstore.items())
+
+    manifest = load_manifest(os.path.join(db_dir, repo_name))
+    assert manifest["commit"] == "sha2"
+    assert sorted(manifest["files"]) == ["a.py", "b.py"]
+    assert not is_index_current(repo_name, "sha1", db_dir)
+
+def test_update_vector_store_noop_when_unchanged(tmp_path, fake_embeddings, repo_name):
+    db_dir = str(tmp_path / "vector_db")
+    repo_path = str(tmp_path / "checkout")
+    docs = _file_docs(repo_path, {"a.py": "def a(): pass\n"})
+
+    update_vector_store(docs, repo_name, repo_path, commit="sha1", db_dir=db_dir)
+    update = prepare_update(docs, repo_name, repo_path, commit="sha1", db_dir=db_dir)
+
+    assert update.changed_paths == [] and update.deleted_paths == [] and update.chunks == []
+
+def test_stream_vector_store_embeds_in_batches(tmp_path, fake_embeddings, repo_name, capsys):
+    db_dir = str(tmp_path / "vector_db")
+    repo_path = str(tmp_path / "checkout")
+    files = {f"m{i}.py": f"def f{i}(): pass\n" for i in range(5)}
+    consumed = []
+
+    def documents():
+        for doc in _file_docs(repo_path, files):
+            consumed.append(doc.metadata["file_path"])
+            yield doc
+
+    db = stream_vector_store(documents(), repo_name, repo_path, commit="sha1", db_dir=db_dir, batch_size=2)
+
+    assert len(consumed) == 5
+    assert len(db.index_to_docstore_id) == 5
+    out = capsys.readouterr().out
+    assert [line for line in out.splitlines() if "embedded" in line] == [
+        f"[{repo_name}] embedded 2 chunks",
+        f"[{repo_name}] embedded 4 chunks",
+        f"[{repo_name}] embedded 5 chunks",
+    ]
+    assert sorted(load_manifest(os.path.join(db_dir, repo_name))["files"]) == sorted(files)
+
+    # A later streamed run only embeds the changed file
+    files["m0.py"] = "def f0(): return 0\n"
+    db = stream_vector_store(iter(_file_docs(repo_path, files)), repo_name, repo_path, commit="sha2", db_dir=db_dir)
+    assert len(db.index_to_docstore_id) == 5
+    assert "def f0(): return 0" in [d.page_content for _, d in db.docstore.items()]
+
+def test_stream_vector_store_flushes_on_char_ceiling(tmp_path, fake_embeddings, repo_name, capsys):
+    db_dir = str(tmp_path / "vector_db")
+    repo_path = str(tmp_path / "checkout")
+    files = {f"m{i}.py": "x" * 100 for i in range(3)}
+
+    stream_vector_store(iter(_file_docs(repo_path, files)), repo_name, repo_path, db_dir=db_dir,
+                        batch_size=100, max_batch_chars=150)
+
+    out = capsys.readouterr().out
+    assert len([line for line in out.splitlines() if "embedded" in line]) == 2
+
+def test_update_builds_search_index_and_loads_it(tmp_path, fake_embeddings, repo_name, monkeypatch):
+    from src.ann_index import ANN_INDEX_FILENAME, ANN_META_FILENAME
+    from src.vector_store import load_vector_store
+    db_dir = str(tmp_path / "vector_db")
+    repo_path = str(tmp_path / "checkout")
+    files = {f"m{i}.py": f"def f{i}(): pass\n" for i in range(100)}
+    monkeypatch.setattr("src.vector_store.FAISS_INDEX_TYPE", "ivf-flat")
+
+    update_vector_store(_file_docs(repo_path, files), repo_name, repo_path, commit="sha1", db_dir=db_dir)
+    assert os.path.exists(os.path.join(db_dir, repo_name, ANN_INDEX_FILENAME))
+
+    db = load_vector_store(repo_name, db_dir)
+    assert type(db.index).__name__ == "IndexIVFFlat"
+    assert db.similarity_search("def f7(): pass", k=1)[0].page_content == "def f7(): pass"
+
+    # A one-file change updates the search index in place instead of retraining it
+    files["m1.py"] = "def f1(): return 1\n"
+    update_vector_store(_file_docs(repo_path, files), repo_name, repo_path, commit="sha2", db_dir=db_dir)
+    with open(os.path.join(db_dir, repo_name, ANN_META_FILENAME)) as f:
+        assert json.load(f) == {"index_type": "ivf-flat", "vectors": 100, "built_vectors": 100, "changes": 2}
+    db = load_vector_store(repo_name, db_dir)
+    assert db.similarity_search("def f1(): return 1", k=1)[0].page_content == "def f1(): return 1"
+    assert db.similarity_search("def f7(): pass", k=1)[0].page_content == "def f7(): pass"
+
+    # Switching back to flat drops the stale search index
+    monkeypatch.setattr("src.vector_store.FAISS_INDEX_TYPE", "flat")
+    files["m0.py"] = "def f0(): return 0\n"
+    update_vector_store(_file_docs(repo_path, files), repo_name, repo_path, commit="sha3", db_dir=db_dir)
+    assert not os.path.exists(os.path.join(db_dir, repo_name, ANN_INDEX_FILENAME))
+    assert type(load_vector_store(repo_name, db_dir).index).__name__ == "IndexFlatL2"
+
+def test_update_rechunks_files_collapsed_into_changed_file(tmp_path, fake_embeddings, repo_name):
+    db_dir = str(tmp_path / "vector_db")
+    repo_path = str(tmp_path / "checkout")
+    shared = "def shared(records):\n    total = 0\n    for record in records:\n        total += record * 2\n    return total\n"
+    files = {"a.py": shared, "b.py": shared, "c.py": "def c(): pass\n"}
+
+    db = update_vector_store(_file_docs(repo_path, files), repo_name, repo_path, commit="sha1", db_dir=db_dir)
+    assert len(db.index_to_docstore_id) == 2
+    manifest = load_manifest(os.path.join(db_dir, repo_name))
+    assert manifest["files"]["b.py"]["ids"] == []
+    assert manifest["files"]["b.py"]["collapsed_into"] == manifest["files"]["a.py"]["ids"]
+
+    files["a.py"] = "def a(): return 1\n"
+    update = prepare_update(_file_docs(repo_path, files), repo_name, repo_path, commit="sha2", db_dir=db_dir)
+    assert update.changed_paths == ["a.py", "b.py"]
+
+    db = apply_update(update, db_dir)
+    contents = sorted(d.page_content for _, d in db.docstore.items())
+    assert contents == ["def a(): return 1", "def c(): pass", shared.strip()]
+
+def _write_files(repo_path, files):
+    os.makedirs(repo_path, exist_ok=True)
+    for name, content in files.items():
+        with open(os.path.join(repo_path, name), "w") as f:
+            f.write(content)
+    return _file_docs(repo_path, files)
+
+@pytest.mark.parametrize("build", [update_vector_store, stream_vector_store])
+def test_stream_rechunks_files_collapsed_into_edited_file(tmp_path, fake_embeddings, repo_name, build):
+    db_dir = str(tmp_path / "vector_db")
+    repo_path = str(tmp_path / "checkout")
+    shared = "def shared(records):\n    total = 0\n    for record in records:\n        total += record * 2\n    return total\n"
+    files = {"a.py": shared, "b.py": shared, "c.py": "def c(): pass\n"}
+
+    db = build(_write_files(repo_path, files), repo_name, repo_path, commit="sha1", db_dir=db_dir)
+    assert len(db.index_to_docstore_id) == 2
+    manifest = load_manifest(os.path.join(db_dir, repo_name))
+    assert manifest["files"]["b.py"]["collapsed_into"] == manifest["files"]["a.py"]["ids"]
+    representative = db.docstore.search(manifest["files"]["a.py"]["ids"][0])
+    assert [d["file_path"] for d in representative.metadata["duplicates"]] == [os.path.join(repo_path, "b.py")]
+
+    # Editing the representative's file must not lose the copy that lived on through it
+    files["a.py"] = "def a(): return 1\n"
+    db = stream_vector_store(iter(_write_files(repo_path, files)), repo_name, repo_path, commit="sha2", db_dir=db_dir)
+
+    contents = sorted(d.page_content for _, d in db.docstore.items())
+    assert contents == ["def a(): return 1", "def c(): pass", shared.strip()]
+    manifest = load_manifest(os.path.join(db_dir, repo_name))
+    assert len(manifest["files"]["b.py"]["ids"]) == 1
+    assert "collapsed_into" not in manifest["files"]["b.py"]